@@ -1,26 +1,165 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 import os
+import json
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Optional, Tuple
+from contextlib import asynccontextmanager
 import asyncio
+import math
+import time
 
-from client.mcp_client import MCPClient
+from client.session_pool import MCPSessionPool
+from client.scheduler import UpstreamRateLimitError, PRIORITY_CLASSES
+from client.deadline import Deadline, DeadlineExceededError
+from cache.edit_time import is_settled
+from cache.block_cache import BlockCache
+from cache.response_cache import ResponseCache
+from cache.refresher import BackgroundRefresher
+from cache.sqlite_store import open_store_from_env
 from parser.notion_parser import NotionParser
+from parser.block_fetcher import BlockTreeFetcher, FetchLimits
+from parser.fields import FieldSelection
+from sync.mirror_store import MirrorStore
+from sync.engine import SyncEngine
+from sync.local_query import LocalQueryEngine, UnsupportedFilterError, paginate
+from search.index import SearchIndex
+from metrics.registry import REGISTRY
+from metrics.middleware import MetricsMiddleware, TraceMiddleware
+from metrics.trace import trace_store
 from models.schemas import (
     PageContent, PageListResponse, SearchRequest, DatabaseSearchRequest,
-    ErrorResponse
+    BatchPagesRequest, BatchPagesResponse, BlockContent, ErrorResponse
 )
 
 load_dotenv()
 
+# 进程级 MCP 会话池，所有请求共享连接和已初始化的会话
+session_pool = MCPSessionPool()
+
+# 可选的持久化缓存（CACHE_DB_PATH），多个 worker 共享，重启后仍然有效
+cache_store = open_store_from_env()
+
+# 进程级块缓存，未修改的子树无需重新请求 MCP
+block_cache = BlockCache(store=cache_store)
+
+# 接口响应缓存（ETag / If-None-Match）
+response_cache = ResponseCache(store=cache_store)
+
+# /api/search 的默认模式：upstream（转发到 Notion）、local（只查本地索引）、auto（本地无结果时回退到上游）
+SEARCH_MODES = ("upstream", "local", "auto")
+SEARCH_MODE = os.getenv("SEARCH_MODE", "upstream").lower()
+
+# 本地全文搜索索引：获取过的页面和镜像中的页面会增量加入；SEARCH_MODE=upstream 时不建立索引
+search_index = SearchIndex() if SEARCH_MODE in ("local", "auto") else None
+
+# 数据库镜像（MIRROR_DATABASE_IDS），已同步的数据库直接由本地镜像提供读取
+mirror_store = MirrorStore()
+sync_engine = SyncEngine(session_pool, mirror_store, search_index=search_index)
+local_query = LocalQueryEngine(mirror_store)
+
+# 页面内容的后台刷新（stale-while-revalidate）
+page_refresher = BackgroundRefresher()
+
+# 数据库导出时每次向上游请求的页面数（Notion 的上限为 100）
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", 100))
+
+# 批量获取页面：单次请求的页面数上限和同时获取的页面数
+BATCH_MAX_PAGES = int(os.getenv("BATCH_MAX_PAGES", 100))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+
+# 检查客户端是否已断开连接的间隔（秒）
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", 0.2))
+
+# Cache-Status 响应头中的缓存名称
+CACHE_STATUS_NAME = "notion-proxy"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await session_pool.start()
+    await sync_engine.start()
+    yield
+    await sync_engine.close()
+    await page_refresher.close()
+    await session_pool.close()
+    mirror_store.close()
+    if cache_store is not None:
+        cache_store.close()
+
+
 app = FastAPI(
     title="Notion API 中转服务",
     description="简化的 Notion API 接口，基于 notion-mcp-server",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# 按路由记录请求延迟（/metrics）
+app.add_middleware(MetricsMiddleware)
+# 按需记录请求的上游调用（X-Debug-Trace: 1 或 ?trace=1）
+app.add_middleware(TraceMiddleware)
+
+
+def register_metrics() -> None:
+    """把会话池、调度器和缓存的现有统计注册为输出时读取的指标"""
+    REGISTRY.callback(
+        "notion_proxy_session_pool_sessions", "gauge", "MCP sessions in the session pool by state",
+        ("state",), lambda: [((state,), session_pool.stats()[state]) for state in ("idle", "in_use")]
+    )
+    REGISTRY.callback(
+        "notion_proxy_session_pool_sessions_created_total", "counter", "MCP sessions initialized",
+        (), lambda: [((), session_pool.stats()["created"])]
+    )
+    REGISTRY.callback(
+        "notion_proxy_http_connections", "gauge", "Connections in the shared upstream httpx pool by state",
+        ("state",), lambda: [((state,), count) for state, count in session_pool.connection_stats().items()]
+    )
+    REGISTRY.callback(
+        "notion_proxy_scheduler_queue_depth", "gauge", "Upstream calls waiting for a rate limit token by priority",
+        ("priority",), lambda: [
+            ((name,), stats["queue_depth"]) for name, stats in session_pool.scheduler.stats()["classes"].items()
+        ]
+    )
+    REGISTRY.callback(
+        "notion_proxy_scheduler_acquired_total", "counter", "Rate limit tokens granted by priority",
+        ("priority",), lambda: [
+            ((name,), stats["acquired"]) for name, stats in session_pool.scheduler.stats()["classes"].items()
+        ]
+    )
+    REGISTRY.callback(
+        "notion_proxy_scheduler_rate_limited_total", "counter", "Upstream 429 responses seen by the scheduler",
+        (), lambda: [((), session_pool.scheduler.stats()["rate_limited"])]
+    )
+    REGISTRY.callback(
+        "notion_proxy_single_flight_total", "counter",
+        "Coalescible MCP calls (calls), those that joined an in-flight call (deduplicated) "
+        "and shared calls cancelled after every waiter left (cancelled)",
+        ("result",), lambda: [
+            ((result,), session_pool.single_flight.stats()[result]) for result in ("calls", "deduplicated", "cancelled")
+        ]
+    )
+    caches = {"block": block_cache, "response": response_cache}
+    REGISTRY.callback(
+        "notion_proxy_cache_requests_total", "counter", "Cache lookups by cache and result",
+        ("cache", "result"), lambda: [
+            ((name, result), cache.stats()[key]) for name, cache in caches.items()
+            for result, key in (("hit", "hits"), ("miss", "misses"))
+        ]
+    )
+    REGISTRY.callback(
+        "notion_proxy_cache_entries", "gauge", "Entries in the in-memory caches",
+        ("cache",), lambda: [((name,), cache.stats()["entries"]) for name, cache in caches.items()]
+    )
+    REGISTRY.callback(
+        "notion_proxy_cache_bytes", "gauge", "Estimated memory used by the in-memory caches",
+        ("cache",), lambda: [((name,), cache.stats()["bytes"]) for name, cache in caches.items()]
+    )
+
+
+register_metrics()
+
 security = HTTPBearer()
 
 # 认证依赖
@@ -35,6 +174,146 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
     return credentials.credentials
 
 
+def resolve_priority(x_priority: Optional[str], default: str) -> str:
+    """请求头 X-Priority 可覆盖端点默认的优先级类别"""
+    if x_priority and x_priority.strip().lower() in PRIORITY_CLASSES:
+        return x_priority.strip().lower()
+    return default
+
+
+def cached_response(entry: dict, if_none_match: Optional[str], cache_status: Optional[str] = None,
+                    selection: Optional[FieldSelection] = None) -> Response:
+    """返回缓存的响应体，If-None-Match 命中时返回 304；指定 selection 时只返回选择的字段"""
+    if selection is not None:
+        body = selection.project(entry["body"])
+        entry = {**entry, "body": body, "etag": entry["etag"] and ResponseCache.make_etag(body)}
+    if entry["etag"] is None:
+        # 上游调用失败、内容不完整的响应：不带 ETag，客户端不能通过 304 继续使用
+        headers = {"Cache-Control": "no-store"}
+    else:
+        headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache"}
+    if cache_status:
+        # Age 为内容最后一次确认是最新版本以来经过的秒数
+        headers["Age"] = str(max(0, int(time.time() - entry["validated_at"])))
+        headers["Cache-Status"] = f"{CACHE_STATUS_NAME}; {cache_status}"
+    if entry["etag"] is not None and ResponseCache.etag_matches(if_none_match, entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+
+async def query_database_response(mcp_client, database_id: str, if_none_match: Optional[str], page_size: int,
+                                  start_cursor: Optional[str] = None, filter: Optional[dict] = None,
+                                  sorts: Optional[list] = None, selection: Optional[FieldSelection] = None,
+                                  no_cache: bool = False) -> Response:
+    """查询数据库，相同的查询在 TTL 内直接使用缓存的响应；no_cache 时总是访问上游并刷新缓存"""
+    key = ResponseCache.database_key(
+        database_id, page_size=page_size, start_cursor=start_cursor, filter=filter, sorts=sorts
+    )
+    entry = None if no_cache else response_cache.get(key)
+    if entry is None:
+        result = await mcp_client.query_database(
+            database_id=database_id,
+            page_size=page_size,
+            start_cursor=start_cursor,
+            filter=filter,
+            sorts=sorts
+        )
+        
+        if not result:
+            raise HTTPException(status_code=404, detail="Database not found")
+        
+        parsed_result = NotionParser.parse_page_list(result)
+        if search_index is not None:
+            for page_info in parsed_result["results"]:
+                search_index.add(page_info)
+        entry = response_cache.put(key, PageListResponse(**parsed_result), ttl=response_cache.database_ttl)
+    return cached_response(entry, if_none_match, selection=selection)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[FieldSelection]:
+    """解析 fields 参数，字段不存在时返回 400"""
+    try:
+        return FieldSelection.parse(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def wants_no_cache(cache_control: Optional[str]) -> bool:
+    """请求头 Cache-Control: no-cache 表示跳过缓存和镜像，直接访问上游"""
+    return bool(cache_control and "no-cache" in cache_control.lower())
+
+
+def mirror_database_response(database_id: str, if_none_match: Optional[str], page_size: int,
+                             start_cursor: Optional[str] = None, filter: Optional[dict] = None,
+                             sorts: Optional[list] = None, selection: Optional[FieldSelection] = None) -> Response:
+    """由本地镜像返回数据库页面列表（filter / sorts 在本地求值），Age 为距上次同步的秒数
+
+    条件无法在本地求值时抛出 UnsupportedFilterError，由调用方回退到上游查询。
+    """
+    state = mirror_store.get_state(database_id)
+    key = ResponseCache.database_key(
+        database_id, mirror=state["version"], page_size=page_size, start_cursor=start_cursor, filter=filter, sorts=sorts
+    )
+    entry = response_cache.get(key)
+    if entry is None:
+        if filter or sorts:
+            rows, next_cursor = paginate(local_query.query(database_id, filter, sorts), page_size, start_cursor)
+        else:
+            rows, next_cursor = mirror_store.page(database_id, page_size, start_cursor)
+        entry = response_cache.put(key, PageListResponse(
+            results=[row["info"] for row in rows],
+            has_more=next_cursor is not None,
+            next_cursor=next_cursor
+        ))
+    return cached_response({**entry, "validated_at": state["last_sync"]}, if_none_match, "hit; detail=mirror", selection)
+
+
+@app.exception_handler(UpstreamRateLimitError)
+async def rate_limit_exception_handler(request, exc):
+    # 上游持续限流时明确返回 503，而不是返回不完整的内容
+    headers = {}
+    if exc.retry_after is not None:
+        headers["Retry-After"] = str(max(1, int(exc.retry_after + 0.5)))
+    return JSONResponse(
+        status_code=503,
+        content=ErrorResponse(error="Upstream rate limited", detail=str(exc)).dict(),
+        headers=headers
+    )
+
+
+@app.exception_handler(DeadlineExceededError)
+async def deadline_exception_handler(request, exc):
+    # 请求的截止时间已到，进行中的上游调用已取消
+    return JSONResponse(
+        status_code=504,
+        content=ErrorResponse(error="Deadline exceeded", detail=str(exc)).dict()
+    )
+
+
+async def run_until_disconnected(request: Request, coro):
+    """执行请求处理，客户端提前断开连接时取消处理（及其进行中的上游调用）"""
+    task = asyncio.ensure_future(coro)
+    
+    async def wait_for_disconnect():
+        while not await request.is_disconnected():
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+    
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        print(f"Client disconnected, cancelling {request.url.path}")
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # 客户端已经不在，响应不会被读取
+        return Response(status_code=499)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     return JSONResponse(
@@ -49,30 +328,436 @@ async def root():
     return {"message": "Notion API 中转服务运行中", "version": "1.0.0"}
 
 
+async def stream_page_content(page_id: str, as_markdown: bool, priority: str,
+                              limits: Optional[FetchLimits] = None,
+                              deadline: Optional[Deadline] = None) -> StreamingResponse:
+    """先发送页面元数据，再按文档顺序流式发送 Markdown 片段
+
+    客户端断开时 StreamingResponse 取消生成器，预取中的子树随之取消。
+    """
+    async with session_pool.acquire(priority, deadline) as mcp_client:
+        page_data = await mcp_client.get_page(page_id)
+    if not page_data:
+        raise HTTPException(status_code=404, detail=f"Page {page_id} not found or failed to retrieve")
+    
+    page_info = NotionParser.parse_page(page_data)
+    metadata = page_info.model_dump(mode="json")
+    
+    fetchers = []
+    
+    async def fragments():
+        async with session_pool.acquire(priority, deadline) as mcp_client:
+            fetcher = BlockTreeFetcher(mcp_client, cache=block_cache, limits=limits or FetchLimits.from_env())
+            fetchers.append(fetcher)
+            async for fragment in NotionParser.iter_page_markdown(
+                mcp_client, page_id, page_data.get("last_edited_time"), fetcher=fetcher
+            ):
+                yield fragment
+    
+    async def markdown_body():
+        # 元数据以 front matter 形式输出，值使用 JSON 编码（同时也是合法的 YAML）
+        yield "---\n" + "".join(f"{key}: {json.dumps(value, ensure_ascii=False)}\n" for key, value in metadata.items()) + "---\n\n"
+        try:
+            async for fragment in fragments():
+                yield fragment
+        except Exception as e:
+            print(f"Error streaming page content: {e}")
+            # 纯文本流没有结构化的错误行：先输出错误标记，再中止分块传输，客户端会看到响应不完整
+            detail = str(e).replace("--", "- -")
+            yield f"\n\n<!-- notion-proxy: error detail={json.dumps(detail, ensure_ascii=False)} -->\n"
+            raise
+    
+    async def ndjson_body():
+        yield json.dumps({"type": "metadata", "page": metadata}, ensure_ascii=False) + "\n"
+        try:
+            async for fragment in fragments():
+                yield json.dumps({"type": "content", "markdown": fragment}, ensure_ascii=False) + "\n"
+            # 超出获取上限时结束行包含截断情况
+            end = {"type": "end"}
+            if fetchers and fetchers[0].truncation_info():
+                end["truncated"] = fetchers[0].truncation_info()
+            yield json.dumps(end, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"Error streaming page content: {e}")
+            yield json.dumps({"type": "error", "detail": str(e)}, ensure_ascii=False) + "\n"
+    
+    if as_markdown:
+        return StreamingResponse(markdown_body(), media_type="text/markdown; charset=utf-8")
+    return StreamingResponse(ndjson_body(), media_type="application/x-ndjson")
+
+
+async def load_page_entry(mcp_client, page_id: str, page_data: Optional[dict] = None,
+                          limits: Optional[FetchLimits] = None):
+    """验证并返回页面的缓存条目，页面已修改时重新获取内容，返回 (条目, Cache-Status)
+
+    已有页面对象（例如来自数据库查询结果）时通过 page_data 传入，省去一次 API-retrieve-a-page。
+    limits 为块树获取上限（默认使用服务端配置），内容被截断或有子块获取失败时不写入缓存也不加入搜索索引。
+    """
+    # 先用一次 API-retrieve-a-page 取得 last_edited_time，页面未修改时直接使用缓存的响应
+    if page_data is None:
+        page_data = await mcp_client.get_page(page_id)
+    if not page_data:
+        response_cache.forget_page(page_id)
+        if search_index is not None:
+            search_index.remove(page_id)
+        raise HTTPException(status_code=404, detail=f"Page {page_id} not found or failed to retrieve")
+    
+    last_edited_time = page_data.get("last_edited_time")
+    entry = response_cache.get_page(page_id, last_edited_time)
+    if entry is not None:
+        if search_index is not None and not search_index.has_content(
+            page_id, NotionParser.parse_page(page_data).last_edited_time
+        ):
+            # 缓存来自持久化存储（例如重启后），正文尚未加入搜索索引
+            search_index.add(PageContent.model_validate_json(entry["body"]))
+        return entry, "hit; detail=revalidated"
+    
+    page_content = await NotionParser.get_page_content(
+        mcp_client, page_id, cache=block_cache, page_data=page_data, limits=limits or FetchLimits.from_env()
+    )
+    if not page_content:
+        raise HTTPException(status_code=404, detail=f"Page {page_id} not found or failed to retrieve")
+    if page_content.truncated is not None:
+        entry = ResponseCache.make_entry(page_content)
+        if "upstream_error" in page_content.truncated.reasons:
+            # 部分子块获取失败：只返回给本次请求，不缓存也不带 ETag
+            entry["etag"] = None
+            return entry, "fwd=miss; detail=upstream-error"
+        return entry, "fwd=miss; detail=truncated"
+    if search_index is not None:
+        search_index.add(page_content)
+    entry = response_cache.put_page(page_id, last_edited_time, page_content)
+    if not is_settled(last_edited_time):
+        # 一分钟内刚编辑过：同一 last_edited_time 下内容仍可能变化，不缓存
+        return entry, "fwd=miss; detail=recently-edited"
+    return entry, "fwd=miss; stored"
+
+
+async def load_page_metadata(mcp_client, page_id: str, selection: FieldSelection) -> dict:
+    """只获取页面元数据（一次 API-retrieve-a-page，不获取块树），只解析选择的属性"""
+    page_data = await mcp_client.get_page(page_id)
+    if not page_data:
+        raise HTTPException(status_code=404, detail=f"Page {page_id} not found or failed to retrieve")
+    page_info = NotionParser.parse_page(page_data, property_names=selection.property_names())
+    body = selection.dumps(page_info.model_dump(mode="json"))
+    return {"body": body, "etag": ResponseCache.make_etag(body), "validated_at": time.time()}
+
+
+async def refresh_page(page_id: str) -> None:
+    """后台刷新页面缓存，使用独立的会话和 bulk 优先级，不占用前台请求的配额"""
+    try:
+        async with session_pool.acquire("bulk") as mcp_client:
+            await load_page_entry(mcp_client, page_id)
+    except HTTPException as e:
+        print(f"Background refresh of page {page_id} failed: {e.detail}")
+
+
 @app.get("/api/page/{page_id}", response_model=PageContent)
-async def get_page_content(page_id: str, token: str = Depends(verify_token)):
+async def get_page_content(
+    request: Request,
+    page_id: str,
+    stream: bool = False,
+    fields: Optional[str] = None,
+    max_depth: Optional[int] = None,
+    max_blocks: Optional[int] = None,
+    max_calls: Optional[int] = None,
+    accept: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None),
+    x_request_timeout: Optional[float] = Header(None),
+    token: str = Depends(verify_token)
+):
     """
     获取页面完整内容
     
     - **page_id**: Notion 页面 ID
+    - **stream**: 为 true 时以 NDJSON 流式返回（先元数据，后 Markdown 片段）
+    - 请求头 `Accept: text/markdown` 时直接流式返回 Markdown 文本
+    - 请求头 `X-Priority` 可指定上游调度优先级 (interactive / normal / bulk，默认 normal)
+    - 请求头 `If-None-Match` 与当前 ETag 一致时返回 304
+    - 缓存在容忍窗口内时直接返回旧内容并在后台刷新；请求头 `Cache-Control: no-cache` 强制验证
+    - 响应头 `Age` / `Cache-Status` 标明内容的新鲜度
+    - **fields**: 只返回指定的字段，如 `id,title,properties.Status`；不包含 content 时只请求页面元数据
+    - **max_depth** / **max_blocks** / **max_calls**: 覆盖服务端的块树获取上限（0 表示不限制），
+      超出上限时内容中留下截断标记，响应的 truncated 字段列出被跳过的块
+    - 请求头 `X-Request-Timeout` 可指定比服务端 REQUEST_TIMEOUT 更短的截止时间（秒），到期返回 504；
+      客户端断开连接时停止获取
     - 返回页面的元数据和 Markdown 格式的内容
     """
-    async with MCPClient() as mcp_client:
+    selection = parse_fields(fields)
+    limits = FetchLimits.from_env(max_depth, max_blocks, max_calls)
+    priority = resolve_priority(x_priority, "normal")
+    deadline = Deadline.from_env(x_request_timeout)
+    if accept and "text/markdown" in accept:
+        return await stream_page_content(page_id, as_markdown=True, priority=priority, limits=limits, deadline=deadline)
+    if stream:
+        return await stream_page_content(page_id, as_markdown=False, priority=priority, limits=limits, deadline=deadline)
+    
+    if not wants_no_cache(cache_control):
+        entry = response_cache.latest_page(page_id)
+        if entry is not None:
+            age = time.time() - entry["validated_at"]
+            ttl = response_cache.page_fresh_ttl - age
+            if ttl >= 0:
+                return cached_response(entry, if_none_match, "hit", selection)
+            if -ttl <= response_cache.page_stale_while_revalidate:
+                # 在容忍窗口内：先返回旧内容，由后台任务刷新
+                page_refresher.schedule(page_id, lambda: refresh_page(page_id))
+                return cached_response(
+                    entry, if_none_match, f"hit; ttl={math.floor(ttl)}; detail=stale-while-revalidate", selection
+                )
+    
+    async def load():
+        async with session_pool.acquire(priority, deadline) as mcp_client:
+            try:
+                if selection is not None and not selection.needs_content:
+                    return cached_response(await load_page_metadata(mcp_client, page_id, selection), if_none_match, "fwd=miss")
+                entry, cache_status = await load_page_entry(mcp_client, page_id, limits=limits)
+                return cached_response(entry, if_none_match, cache_status, selection)
+            except (HTTPException, UpstreamRateLimitError, DeadlineExceededError):
+                raise
+            except Exception as e:
+                print(f"Error getting page content: {e}")
+                raise HTTPException(status_code=500, detail=f"Failed to get page content: {str(e)}")
+    
+    return await run_until_disconnected(request, load())
+
+
+@app.get("/api/block/{block_id}", response_model=BlockContent)
+async def get_block_content(
+    request: Request,
+    block_id: str,
+    max_depth: Optional[int] = None,
+    max_blocks: Optional[int] = None,
+    max_calls: Optional[int] = None,
+    x_priority: Optional[str] = Header(None),
+    x_request_timeout: Optional[float] = Header(None),
+    token: str = Depends(verify_token)
+):
+    """
+    获取单个块的子内容（Markdown），用于补取页面中被截断的子树
+
+    - **block_id**: 块 ID（页面内容中截断标记里的 block_id）
+    - **max_depth** / **max_blocks** / **max_calls**: 同页面接口，覆盖服务端的块树获取上限
+    - 请求头 `X-Request-Timeout`: 同页面接口
+    """
+    limits = FetchLimits.from_env(max_depth, max_blocks, max_calls)
+    deadline = Deadline.from_env(x_request_timeout)
+    
+    async def load():
+        async with session_pool.acquire(resolve_priority(x_priority, "normal"), deadline) as mcp_client:
+            try:
+                content, truncated = await NotionParser.get_block_content(
+                    mcp_client, block_id, cache=block_cache, limits=limits
+                )
+            except (UpstreamRateLimitError, DeadlineExceededError):
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to get block content: {str(e)}")
+        return BlockContent(id=block_id, content=content, truncated=truncated)
+    
+    return await run_until_disconnected(request, load())
+
+
+def batch_item(page_id: str, status: int, body: Optional[bytes] = None, error: Optional[str] = None) -> bytes:
+    """批量接口中单个页面的结果（直接拼接缓存的响应体，不重新序列化页面）"""
+    return (
+        b'{"id":' + json.dumps(page_id).encode("utf-8") + b',"status":' + str(status).encode("ascii")
+        + b',"page":' + (body if body is not None else b"null")
+        + b',"error":' + json.dumps(error, ensure_ascii=False).encode("utf-8") + b"}"
+    )
+
+
+async def fetch_batch_item(page_id: str, priority: str, semaphore: asyncio.Semaphore,
+                           selection: Optional[FieldSelection] = None, deadline: Optional[Deadline] = None) -> bytes:
+    """获取批量请求中的一个页面，失败时返回该页面的错误而不影响其他页面"""
+    async with semaphore:
+        try:
+            entry = response_cache.latest_page(page_id)
+            if entry is not None and time.time() - entry["validated_at"] <= response_cache.page_fresh_ttl:
+                body = entry["body"] if selection is None else selection.project(entry["body"])
+            elif selection is not None and not selection.needs_content:
+                async with session_pool.acquire(priority, deadline) as mcp_client:
+                    body = (await load_page_metadata(mcp_client, page_id, selection))["body"]
+            else:
+                async with session_pool.acquire(priority, deadline) as mcp_client:
+                    entry, _ = await load_page_entry(mcp_client, page_id)
+                body = entry["body"] if selection is None else selection.project(entry["body"])
+            return batch_item(page_id, 200, body=body)
+        except HTTPException as e:
+            return batch_item(page_id, e.status_code, error=str(e.detail))
+        except UpstreamRateLimitError as e:
+            return batch_item(page_id, 503, error=str(e))
+        except DeadlineExceededError as e:
+            return batch_item(page_id, 504, error=str(e))
+        except Exception as e:
+            print(f"Error getting page content for {page_id}: {e}")
+            return batch_item(page_id, 500, error=f"Failed to get page content: {str(e)}")
+
+
+@app.post("/api/pages/batch", response_model=BatchPagesResponse)
+async def get_pages_batch(
+    request: BatchPagesRequest,
+    http_request: Request,
+    x_priority: Optional[str] = Header(None),
+    x_request_timeout: Optional[float] = Header(None),
+    token: str = Depends(verify_token)
+):
+    """
+    批量获取多个页面的完整内容
+
+    - **page_ids**: 页面 ID 列表（重复的 ID 只获取一次，最多 BATCH_MAX_PAGES 个）
+    - **stream**: 为 true 时以 NDJSON 流式返回，每个页面完成后立即发送一行（按完成顺序）
+    - 页面并发获取（BATCH_CONCURRENCY），每个结果带有各自的 status，单个页面失败不影响其他页面
+    - **fields**: 只返回每个页面的指定字段，不包含 content 时只请求页面元数据
+    - 请求头 `X-Priority` 可指定上游调度优先级（默认 bulk）
+    - 请求头 `X-Request-Timeout`: 整个批量请求的截止时间，到期时未完成的页面返回 504，客户端断开时全部取消
+    """
+    selection = parse_fields(request.fields)
+    page_ids = list(dict.fromkeys(request.page_ids))
+    if len(page_ids) > BATCH_MAX_PAGES:
+        raise HTTPException(status_code=400, detail=f"Too many page ids: {len(page_ids)} > {BATCH_MAX_PAGES}")
+
+    priority = resolve_priority(x_priority, "bulk")
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    deadline = Deadline.from_env(x_request_timeout)
+
+    if request.stream:
+        async def ndjson_body():
+            tasks = [
+                asyncio.ensure_future(fetch_batch_item(page_id, priority, semaphore, selection, deadline))
+                for page_id in page_ids
+            ]
+            try:
+                for next_item in asyncio.as_completed(tasks):
+                    yield await next_item + b"\n"
+            finally:
+                # 客户端断开时取消尚未完成的页面
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        return StreamingResponse(ndjson_body(), media_type="application/x-ndjson")
+
+    async def load():
+        items = await asyncio.gather(*(
+            fetch_batch_item(page_id, priority, semaphore, selection, deadline) for page_id in page_ids
+        ))
+        return Response(content=b'{"results":[' + b",".join(items) + b"]}", media_type="application/json")
+
+    return await run_until_disconnected(http_request, load())
+
+
+async def load_row_content(page_data: dict, priority: str, semaphore: asyncio.Semaphore,
+                           deadline: Optional[Deadline] = None) -> dict:
+    """获取数据库查询结果中一行的缓存条目，直接使用查询返回的页面对象验证缓存"""
+    async with semaphore:
+        async with session_pool.acquire(priority, deadline) as mcp_client:
+            entry, _ = await load_page_entry(mcp_client, page_data["id"], page_data=page_data)
+    return entry
+
+
+async def fetch_row_item(page_data: dict, priority: str, semaphore: asyncio.Semaphore,
+                         deadline: Optional[Deadline] = None) -> Tuple[bytes, Optional[Tuple[int, str]], bool]:
+    """获取一行的完整内容，失败时返回该行的元数据（content 为 null）和错误，不影响其他行
+
+    返回 (行, (状态码, 错误), 是否完整)；获取失败或有子块获取失败（条目没有 ETag）时不完整。
+    """
+    try:
+        entry = await load_row_content(page_data, priority, semaphore, deadline)
+        return entry["body"], None, entry["etag"] is not None
+    except HTTPException as e:
+        status, error = e.status_code, str(e.detail)
+    except UpstreamRateLimitError as e:
+        status, error = 503, str(e)
+    except DeadlineExceededError as e:
+        status, error = 504, str(e)
+    except Exception as e:
+        print(f"Error getting page content for {page_data.get('id')}: {e}")
+        status, error = 500, f"Failed to get page content: {str(e)}"
+    page_info = NotionParser.parse_page(page_data).model_dump(mode="json")
+    row = json.dumps({**page_info, "content": None}, ensure_ascii=False).encode("utf-8")
+    return row, (status, error), False
+
+
+def start_row_content(pages: list, priority: str, semaphore: asyncio.Semaphore,
+                      deadline: Optional[Deadline] = None) -> list:
+    """为每一行启动内容获取任务（并发数受 semaphore 限制），返回按行顺序排列的任务，任务结果同 fetch_row_item"""
+    return [asyncio.ensure_future(fetch_row_item(page_data, priority, semaphore, deadline)) for page_data in pages]
+
+
+async def query_database_rows(database_id: str, priority: str, cache_control: Optional[str], page_size: int,
+                              start_cursor: Optional[str] = None, filter: Optional[dict] = None,
+                              sorts: Optional[list] = None, deadline: Optional[Deadline] = None):
+    """查询数据库的一页原始页面对象（已镜像时由镜像返回），返回 (页面列表, next_cursor)"""
+    if sync_engine.is_mirrored(database_id) and not wants_no_cache(cache_control):
         try:
-            page_content = await NotionParser.get_page_content(mcp_client, page_id)
-            if not page_content:
-                raise HTTPException(status_code=404, detail=f"Page {page_id} not found or failed to retrieve")
-            return page_content
+            if filter or sorts:
+                rows, next_cursor = paginate(local_query.query(database_id, filter, sorts), page_size, start_cursor)
+            else:
+                rows, next_cursor = mirror_store.page(database_id, page_size, start_cursor)
+            return [row["raw"] for row in rows], next_cursor
+        except UnsupportedFilterError as e:
+            print(f"Falling back to upstream query: {e}")
+
+    async with session_pool.acquire(priority, deadline) as mcp_client:
+        result = await mcp_client.query_database(
+            database_id=database_id, page_size=page_size, start_cursor=start_cursor, filter=filter, sorts=sorts
+        )
+    if not result:
+        raise HTTPException(status_code=404, detail="Database not found")
+    pages = [item for item in result.get("results", []) if item.get("object") == "page"]
+    return pages, result.get("next_cursor") if result.get("has_more") else None
+
+
+async def database_content_response(request: Request, database_id: str, priority: str, if_none_match: Optional[str],
+                                    cache_control: Optional[str], page_size: int,
+                                    start_cursor: Optional[str] = None, filter: Optional[dict] = None,
+                                    sorts: Optional[list] = None, selection: Optional[FieldSelection] = None,
+                                    deadline: Optional[Deadline] = None) -> Response:
+    """数据库查询结果连同每一行的完整内容（include_content=true），各行内容并发获取
+
+    单行获取失败时该行只返回元数据（content 为 null），错误列在 errors 中，不影响其他行；
+    有行获取失败或内容不完整时响应不带 ETag。客户端断开时停止获取，截止时间到期时未完成的行返回 504。
+    """
+    async def load():
+        try:
+            pages, next_cursor = await query_database_rows(
+                database_id, priority, cache_control, page_size, start_cursor, filter, sorts, deadline
+            )
+        except (HTTPException, UpstreamRateLimitError, DeadlineExceededError):
+            raise
         except Exception as e:
-            print(f"Error getting page content: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to get page content: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Failed to get database pages with content: {str(e)}")
+        items = await asyncio.gather(*start_row_content(pages, priority, asyncio.Semaphore(BATCH_CONCURRENCY), deadline))
+        errors = [
+            batch_item(page_data.get("id", ""), error[0], error=error[1])
+            for page_data, (_, error, _) in zip(pages, items) if error is not None
+        ]
+        body = (
+            b'{"results":[' + b",".join(row for row, _, _ in items) + b'],"has_more":' + (b"true" if next_cursor else b"false")
+            + b',"next_cursor":' + json.dumps(next_cursor).encode("utf-8") + b',"errors":[' + b",".join(errors) + b"]}"
+        )
+        # 有行获取失败或内容因子块获取失败而不完整时，与单个页面相同，不带 ETag
+        etag = ResponseCache.make_etag(body) if all(complete for _, _, complete in items) else None
+        return cached_response({"body": body, "etag": etag}, if_none_match, selection=selection)
+
+    return await run_until_disconnected(request, load())
 
 
 @app.get("/api/database/{database_id}/pages", response_model=PageListResponse)
 async def get_database_pages(
     database_id: str,
+    request: Request,
     page_size: int = 100,
     start_cursor: Optional[str] = None,
+    include_content: bool = False,
+    fields: Optional[str] = None,
+    x_priority: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None),
+    x_request_timeout: Optional[float] = Header(None),
     token: str = Depends(verify_token)
 ):
     """
@@ -81,35 +766,208 @@ async def get_database_pages(
     - **database_id**: Notion 数据库 ID
     - **page_size**: 每页返回的页面数量 (默认: 100)
     - **start_cursor**: 分页游标，用于获取下一页
+    - 请求头 `If-None-Match` 与当前 ETag 一致时返回 304
+    - 已镜像的数据库直接由本地镜像返回；请求头 `Cache-Control: no-cache` 强制访问上游
+    - **include_content**: 为 true 时每个结果为包含 Markdown 内容的完整页面，各行内容在服务端并发获取；
+      单行失败时该行 content 为 null，错误列在 errors 中
+    - **fields**: 只返回每个页面的指定字段，如 `id,title,properties.Status`（不包含 content 时忽略 include_content）
+    - 请求头 `X-Request-Timeout`: include_content 时的截止时间（秒），到期时未完成的行返回 504
     """
-    async with MCPClient() as mcp_client:
+    selection = parse_fields(fields)
+    if include_content and (selection is None or selection.needs_content):
+        return await database_content_response(
+            request, database_id, resolve_priority(x_priority, "normal"), if_none_match, cache_control, page_size,
+            start_cursor, selection=selection, deadline=Deadline.from_env(x_request_timeout)
+        )
+    if sync_engine.is_mirrored(database_id) and not wants_no_cache(cache_control):
+        return mirror_database_response(database_id, if_none_match, page_size, start_cursor, selection=selection)
+    
+    async with session_pool.acquire(resolve_priority(x_priority, "normal")) as mcp_client:
         try:
-            result = await mcp_client.query_database(
-                database_id=database_id,
+            return await query_database_response(
+                mcp_client, database_id, if_none_match,
                 page_size=page_size,
-                start_cursor=start_cursor
+                start_cursor=start_cursor,
+                selection=selection,
+                no_cache=wants_no_cache(cache_control)
             )
-            
-            if not result:
-                raise HTTPException(status_code=404, detail="Database not found")
-            
-            parsed_result = NotionParser.parse_page_list(result)
-            return PageListResponse(**parsed_result)
-            
+        except (HTTPException, UpstreamRateLimitError):
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to get database pages: {str(e)}")
 
 
+async def iter_database_results(database_id: str, priority: str, first_page: dict):
+    """沿 next_cursor 逐页读取数据库，每次产出一页原始页面对象；处理当前页时已在后台请求下一页"""
+    async with session_pool.acquire(priority) as mcp_client:
+        result = first_page
+        pending = None
+        try:
+            while True:
+                next_cursor = result.get("next_cursor")
+                if result.get("has_more") and next_cursor:
+                    pending = asyncio.ensure_future(mcp_client.query_database(
+                        database_id=database_id, page_size=EXPORT_PAGE_SIZE, start_cursor=next_cursor
+                    ))
+                yield [item for item in result.get("results", []) if item.get("object") == "page"]
+                if pending is None:
+                    return
+                result = await pending
+                pending = None
+                if not result or "results" not in result:
+                    # 上游返回错误对象（如 {"object": "error", "status": 502}）时不能当作最后一页，否则导出被静默截断
+                    detail = f": {result.get('message')}" if result else ""
+                    raise RuntimeError(f"query_database returned no results after cursor {next_cursor}{detail}")
+        finally:
+            # 客户端断开时取消尚未完成的预取
+            if pending is not None and not pending.done():
+                pending.cancel()
+                await asyncio.gather(pending, return_exceptions=True)
+
+
+async def iter_mirror_results(database_id: str):
+    """按 EXPORT_PAGE_SIZE 分批产出镜像中的原始页面对象"""
+    rows = mirror_store.rows(database_id)
+    for start in range(0, len(rows), EXPORT_PAGE_SIZE):
+        yield [row["raw"] for row in rows[start:start + EXPORT_PAGE_SIZE]]
+
+
+async def export_lines(results, include_content: bool, priority: str, selection: Optional[FieldSelection] = None):
+    """把逐页的查询结果转换为 NDJSON 行
+
+    包含内容时，每一页结果到达后立即启动该页各行的内容获取，与上一页的输出和下一页的查询重叠；
+    同时最多有两页的任务在进行，内存占用与数据库大小无关。
+    某一行内容获取失败时输出该行的元数据（content 为 null）并附带 status 和 error，继续导出其余行。
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    pending: list = []
+
+    def content_line(item: Tuple[bytes, Optional[Tuple[int, str]], bool]) -> bytes:
+        body, error, _ = item
+        body = body if selection is None else selection.project(body)
+        if error is not None:
+            body = (
+                body[:-1] + b',"status":' + str(error[0]).encode("ascii")
+                + b',"error":' + json.dumps(error[1], ensure_ascii=False).encode("utf-8") + b"}"
+            )
+        return body + b"\n"
+
+    try:
+        async for pages in results:
+            if not include_content:
+                for page_data in pages:
+                    if selection is not None:
+                        page_info = NotionParser.parse_page(page_data, property_names=selection.property_names())
+                        yield selection.dumps(page_info.model_dump(mode="json")) + b"\n"
+                        continue
+                    page_info = NotionParser.parse_page(page_data)
+                    if search_index is not None:
+                        search_index.add(page_info)
+                    yield page_info.model_dump_json().encode("utf-8") + b"\n"
+                continue
+            tasks = start_row_content(pages, priority, semaphore)
+            for task in pending:
+                yield content_line(await task)
+            pending = tasks
+        for task in pending:
+            yield content_line(await task)
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+@app.get("/api/database/{database_id}/export")
+async def export_database(
+    database_id: str,
+    include_content: bool = False,
+    fields: Optional[str] = None,
+    x_priority: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None),
+    token: str = Depends(verify_token)
+):
+    """
+    以 NDJSON 流式导出数据库的全部页面
+
+    - **database_id**: Notion 数据库 ID
+    - **include_content**: 为 true 时每行为包含 Markdown 内容的完整页面
+    - **fields**: 只导出每个页面的指定字段（不包含 content 时忽略 include_content）
+    - 每行为一个页面的 JSON（与页面列表中的元素格式相同），服务端自动跟随 next_cursor 分页
+    - include_content 时某一行内容获取失败不会中止导出：该行 content 为 null，并带有该行的 status 和 error
+    - 第一页查询失败时在开始流式输出前返回 404（数据库不存在）或 502；之后查询数据库出错（包括上游返回错误对象）时导出中止，最后一行为 `{"error": "..."}`
+    - 请求头 `X-Priority` 可指定上游调度优先级（默认 bulk）
+    - 已镜像的数据库直接由本地镜像导出；请求头 `Cache-Control: no-cache` 强制访问上游
+    """
+    selection = parse_fields(fields)
+    include_content = include_content and (selection is None or selection.needs_content)
+    priority = resolve_priority(x_priority, "bulk")
+    if sync_engine.is_mirrored(database_id) and not wants_no_cache(cache_control):
+        results = iter_mirror_results(database_id)
+    else:
+        # 第一页在返回响应前获取，数据库不存在时可以直接返回 404
+        async with session_pool.acquire(priority) as mcp_client:
+            first_page = await mcp_client.query_database(database_id=database_id, page_size=EXPORT_PAGE_SIZE)
+        if not first_page:
+            raise HTTPException(status_code=404, detail="Database not found")
+        if "results" not in first_page:
+            # 上游返回错误对象：数据库不存在时为 404，其他错误为 502
+            status_code = 404 if first_page.get("status") == 404 else 502
+            raise HTTPException(status_code=status_code, detail=f"Database query failed: {first_page.get('message', 'no results')}")
+        results = iter_database_results(database_id, priority, first_page)
+
+    async def ndjson_body():
+        try:
+            async for line in export_lines(results, include_content, priority, selection):
+                yield line
+        except Exception as e:
+            print(f"Error exporting database {database_id}: {e}")
+            yield json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8") + b"\n"
+
+    return StreamingResponse(ndjson_body(), media_type="application/x-ndjson")
+
+
 @app.post("/api/search", response_model=PageListResponse)
-async def search_pages(request: SearchRequest, token: str = Depends(verify_token)):
+async def search_pages(
+    request: SearchRequest,
+    response: Response,
+    x_priority: Optional[str] = Header(None),
+    token: str = Depends(verify_token)
+):
     """
     全局搜索页面
     
     - **query**: 搜索关键词
     - **filter**: 搜索过滤器 (可选)
     - **page_size**: 返回结果数量 (默认: 10)
+    - **mode**: upstream（转发到 Notion）/ local（本地全文索引）/ auto（本地无结果时回退到上游），默认由 SEARCH_MODE 决定
+    - 响应头 `X-Search-Source` 标明结果来自 local 还是 upstream
+    - **fields**: 只返回每个页面的指定字段，如 `id,title`
     """
-    async with MCPClient() as mcp_client:
+    mode = (request.mode or SEARCH_MODE).lower()
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid search mode: {mode}")
+    if mode != "upstream" and search_index is None:
+        raise HTTPException(status_code=400, detail="Local search is disabled (SEARCH_MODE=upstream)")
+    selection = parse_fields(request.fields)
+    
+    def respond(page_list: PageListResponse, source: str):
+        if selection is None:
+            response.headers["X-Search-Source"] = source
+            return page_list
+        return Response(
+            content=selection.project(page_list.model_dump_json().encode("utf-8")),
+            media_type="application/json",
+            headers={"X-Search-Source": source}
+        )
+    
+    # 本地索引只包含页面，按数据库搜索时直接转发到上游
+    pages_only = not request.filter or request.filter.get("value") == "page"
+    if mode != "upstream" and pages_only:
+        results, total = search_index.search(request.query, limit=request.page_size)
+        if results or mode == "local":
+            return respond(PageListResponse(results=results, has_more=total > len(results), next_cursor=None), "local")
+    
+    async with session_pool.acquire(resolve_priority(x_priority, "interactive")) as mcp_client:
         try:
             result = await mcp_client.search(
                 query=request.query,
@@ -118,17 +976,30 @@ async def search_pages(request: SearchRequest, token: str = Depends(verify_token
             )
             
             if not result:
-                return PageListResponse(results=[], has_more=False, next_cursor=None)
+                return respond(PageListResponse(results=[], has_more=False, next_cursor=None), "upstream")
             
             parsed_result = NotionParser.parse_page_list(result)
-            return PageListResponse(**parsed_result)
+            if search_index is not None:
+                for page_info in parsed_result["results"]:
+                    search_index.add(page_info)
+            return respond(PageListResponse(**parsed_result), "upstream")
             
+        except UpstreamRateLimitError:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
 
 @app.post("/api/database/search", response_model=PageListResponse)
-async def search_database_pages(request: DatabaseSearchRequest, token: str = Depends(verify_token)):
+async def search_database_pages(
+    request: DatabaseSearchRequest,
+    http_request: Request,
+    x_priority: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None),
+    x_request_timeout: Optional[float] = Header(None),
+    token: str = Depends(verify_token)
+):
     """
     在数据库中搜索页面（支持过滤和排序）
     
@@ -137,37 +1008,85 @@ async def search_database_pages(request: DatabaseSearchRequest, token: str = Dep
     - **sorts**: 排序条件 (可选)
     - **page_size**: 返回结果数量 (默认: 100)
     - **start_cursor**: 分页游标 (可选)
+    - 请求头 `If-None-Match` 与当前 ETag 一致时返回 304
+    - 已镜像的数据库在本地执行过滤和排序，条件不受支持时回退到上游查询
+    - **include_content**: 为 true 时每个结果为包含 Markdown 内容的完整页面；单行失败时该行 content 为 null，错误列在 errors 中
+    - **fields**: 只返回每个页面的指定字段（不包含 content 时忽略 include_content）
+    - 请求头 `X-Request-Timeout`: include_content 时的截止时间（秒），到期时未完成的行返回 504
     """
-    async with MCPClient() as mcp_client:
+    selection = parse_fields(request.fields)
+    if request.include_content and (selection is None or selection.needs_content):
+        return await database_content_response(
+            http_request, request.database_id, resolve_priority(x_priority, "normal"), if_none_match, cache_control,
+            request.page_size, request.start_cursor, filter=request.filter, sorts=request.sorts, selection=selection,
+            deadline=Deadline.from_env(x_request_timeout)
+        )
+    if sync_engine.is_mirrored(request.database_id) and not wants_no_cache(cache_control):
+        try:
+            return mirror_database_response(
+                request.database_id, if_none_match, request.page_size, request.start_cursor,
+                filter=request.filter, sorts=request.sorts, selection=selection
+            )
+        except UnsupportedFilterError as e:
+            print(f"Falling back to upstream query: {e}")
+    
+    async with session_pool.acquire(resolve_priority(x_priority, "normal")) as mcp_client:
         try:
-            result = await mcp_client.query_database(
-                database_id=request.database_id,
+            return await query_database_response(
+                mcp_client, request.database_id, if_none_match,
                 page_size=request.page_size,
                 start_cursor=request.start_cursor,
                 filter=request.filter,
-                sorts=request.sorts
+                sorts=request.sorts,
+                selection=selection,
+                no_cache=wants_no_cache(cache_control)
             )
-            
-            if not result:
-                raise HTTPException(status_code=404, detail="Database not found")
-            
-            parsed_result = NotionParser.parse_page_list(result)
-            return PageListResponse(**parsed_result)
-            
+        except (HTTPException, UpstreamRateLimitError):
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database search failed: {str(e)}")
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 指标（文本格式）：各接口延迟、各工具的上游调用、页面渲染规模、连接池和缓存"""
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/debug/trace/{trace_id}")
+async def get_trace(trace_id: str, token: str = Depends(verify_token)):
+    """
+    读取调试追踪（请求时带请求头 `X-Debug-Trace: 1` 或查询参数 `trace=1`，响应头 `X-Trace-Id` 为追踪 ID）
+
+    返回每个上游 MCP 调用的工具名、参数、块层级、起止时间、排队时间和接收字节数，
+    以及按调用关系组织的调用树（name / value / children，可直接用于火焰图）。
+    """
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Trace {trace_id} not found or expired")
+    return trace.to_dict()
+
+
 @app.get("/api/health")
 async def health_check():
     """健康检查端点"""
     try:
-        # 尝试初始化 MCP 客户端来检查连接
-        async with MCPClient() as mcp_client:
+        # 从会话池借用会话来检查连接
+        async with session_pool.acquire() as mcp_client:
             return {
                 "status": "healthy",
                 "mcp_server_url": os.getenv("MCP_SERVER_URL"),
-                "mcp_connected": True
+                "mcp_connected": True,
+                "session_pool": session_pool.stats(),
+                "single_flight": session_pool.single_flight.stats(),
+                "scheduler": session_pool.scheduler.stats(),
+                "block_cache": block_cache.stats(),
+                "response_cache": response_cache.stats(),
+                "page_refresher": page_refresher.stats(),
+                "cache_store": cache_store.stats() if cache_store is not None else None,
+                "mirror": sync_engine.stats(),
+                "local_query": local_query.stats(),
+                "search_index": search_index.stats() if search_index is not None else None
             }
     except Exception as e:
         return JSONResponse(
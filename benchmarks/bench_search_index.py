@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+本地全文搜索索引基准
+
+在合成语料（词频服从 Zipf 分布，混合英文单词和中文）上测量 SearchIndex 的
+建索引耗时、内存占用、查询延迟和增量更新耗时。
+
+运行: python -m benchmarks.bench_search_index --pages 100000
+"""
+import argparse
+import itertools
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import List
+
+from models.schemas import PageContent
+from search.index import SearchIndex
+
+CJK_WORDS = ["数据", "分析", "项目", "计划", "会议", "记录", "产品", "设计", "用户", "需求", "模型", "智能", "周报", "总结"]
+
+
+def make_vocabulary(size: int, rng: random.Random) -> List[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+    return sorted(words)
+
+
+def make_corpus(pages: int, words_per_page: int, vocabulary_size: int, seed: int) -> List[PageContent]:
+    """生成合成页面：标题 3-6 个词，正文 words_per_page 个词，约 1/5 的页面夹杂中文"""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+    # Zipf 权重：排名越靠前的词出现越频繁（预先累加，避免每次抽样重新计算）
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    corpus = []
+    for i in range(pages):
+        title = " ".join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(3, 6)))
+        body = rng.choices(vocabulary, cum_weights=weights, k=words_per_page)
+        if i % 5 == 0:
+            body += rng.choices(CJK_WORDS, k=words_per_page // 10)
+        corpus.append(PageContent(
+            id=f"page-{i:08d}",
+            title=title,
+            url="",
+            created_time=now,
+            last_edited_time=now,
+            properties={"Status": rng.choice(["Todo", "Doing", "Done"]), "Tags": rng.sample(vocabulary[:50], 2)},
+            content=" ".join(body)
+        ))
+    return corpus
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地全文搜索索引基准")
+    parser.add_argument("--pages", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=120, help="每个页面的正文词数")
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"生成语料: {args.pages} 页, 每页 {args.words} 词, 词表 {args.vocabulary}", flush=True)
+    corpus = make_corpus(args.pages, args.words, args.vocabulary, args.seed)
+
+    # 测量整个语料的索引，不设容量上限
+    index = SearchIndex(max_pages=0, max_bytes=0)
+    start = time.perf_counter()
+    for page in corpus:
+        index.add(page)
+    build_seconds = time.perf_counter() - start
+
+    # tracemalloc 会显著拖慢建索引，内存在单独的一次构建中测量
+    del index
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    index = SearchIndex(max_pages=0, max_bytes=0)
+    for page in corpus:
+        index.add(page)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = index.stats()
+    print(f"建索引: {build_seconds:.2f}s ({args.pages / build_seconds:.0f} 页/秒), "
+          f"{stats['terms']} 个词, 索引内存约 {(after - before) / 1024 / 1024:.1f}MB（含页面元数据）")
+
+    # 查询：按词频区间抽取 1-3 个词，覆盖常见词、中频词和低频词
+    rng = random.Random(args.seed + 1)
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(args.seed))
+    bands = {
+        "common (rank < 100)": vocabulary[:100],
+        "mid (rank 100-5000)": vocabulary[100:5000],
+        "rare (rank > 5000)": vocabulary[5000:],
+        "cjk": CJK_WORDS,
+    }
+    # 第一次查询常见词时需要建立 champion list，冷查询和热查询分开统计
+    print(f"{'query band':>22} {'terms':>6} {'cold p99':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'avg hits':>9}")
+    for name, words in bands.items():
+        for term_count in (1, 2, 3):
+            queries = [" ".join(rng.sample(words, term_count)) for _ in range(args.queries // 3)]
+            runs = []
+            for _ in range(2):
+                latencies, hits = [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    _, total = index.search(query, limit=10)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    hits.append(total)
+                runs.append(latencies)
+            cold, warm = runs
+            print(f"{name:>22} {term_count:>6} {percentile(cold, 0.99):>9.2f} {percentile(warm, 0.5):>8.2f} "
+                  f"{percentile(warm, 0.95):>8.2f} {percentile(warm, 0.99):>8.2f} {statistics.mean(hits):>9.0f}")
+
+    # 增量更新：重新索引已存在的页面（标记删除 + 重新加入）
+    sample = rng.sample(corpus, min(1000, len(corpus)))
+    start = time.perf_counter()
+    for page in sample:
+        index.add(page)
+    update_ms = (time.perf_counter() - start) / len(sample) * 1000
+    print(f"增量更新: {update_ms:.3f}ms/页")
+
+
+if __name__ == "__main__":
+    main()
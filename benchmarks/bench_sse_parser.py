@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+SSE/JSON-RPC 响应解析微基准
+
+对比旧的整体解析方式（response.text + split + 两次 json.loads + 切片）
+与 client.sse 中基于 client.stream()/aiter_lines 的增量解析。
+
+运行: python -m benchmarks.bench_sse_parser
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+from typing import Any, Dict, Optional
+
+import httpx
+
+from client.sse import read_tool_result
+
+
+def make_sse_payload(block_count: int) -> bytes:
+    """生成与 notion-mcp-server 相同格式的 API-get-block-children 响应"""
+    blocks = []
+    for i in range(block_count):
+        text = f"Paragraph {i} " + "lorem ipsum dolor sit amet " * 4
+        blocks.append({
+            "object": "block",
+            "id": f"block-{i:08d}",
+            "type": "paragraph",
+            "has_children": False,
+            "created_time": "2025-01-01T00:00:00.000Z",
+            "last_edited_time": "2025-01-01T00:00:00.000Z",
+            "paragraph": {
+                "rich_text": [{
+                    "type": "text",
+                    "text": {"content": text, "link": None},
+                    "annotations": {"bold": False, "italic": False, "code": False, "color": "default"},
+                    "plain_text": text,
+                    "href": None
+                }],
+                "color": "default"
+            }
+        })
+    result = {"object": "list", "results": blocks, "has_more": False, "next_cursor": None}
+    message = {
+        "jsonrpc": "2.0",
+        "id": "1",
+        "result": {"content": [{"type": "text", "text": "<json-result>" + json.dumps(result) + "</json-result>"}]}
+    }
+    return ("event: message\ndata: " + json.dumps(message) + "\n\n").encode()
+
+
+def legacy_parse(response_text: str) -> Optional[Dict[str, Any]]:
+    """旧版 MCPClient.call_tool 中的解析逻辑"""
+    lines = response_text.split('\n')
+    for line in lines:
+        if line.startswith('data: '):
+            try:
+                data = json.loads(line[6:])
+                if 'result' in data and 'content' in data['result']:
+                    content = data['result']['content']
+                    if content and len(content) > 0:
+                        json_text = content[0].get('text', '')
+                        if '<json-result>' in json_text:
+                            json_start = json_text.find('<json-result>') + len('<json-result>')
+                            json_end = json_text.find('</json-result>')
+                            if json_end > json_start:
+                                json_content = json_text[json_start:json_end]
+                                return json.loads(json_content)
+                        else:
+                            return json.loads(json_text)
+            except json.JSONDecodeError:
+                continue
+    try:
+        return json.loads(response_text)
+    except json.JSONDecodeError:
+        return None
+
+
+async def run_legacy(client: httpx.AsyncClient) -> Any:
+    response = await client.post("http://mcp.local/mcp", json={})
+    return legacy_parse(response.text)
+
+
+async def run_streaming(client: httpx.AsyncClient) -> Any:
+    async with client.stream("POST", "http://mcp.local/mcp", json={}) as response:
+        return await read_tool_result(response)
+
+
+async def measure(runner, client: httpx.AsyncClient, iterations: int) -> Dict[str, float]:
+    # 预热并校验结果
+    assert (await runner(client))["results"]
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await runner(client)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    await runner(client)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ms_per_call": elapsed / iterations * 1000, "peak_kb": peak / 1024}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="SSE 响应解析微基准")
+    parser.add_argument("--blocks", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'blocks':>8} {'payload':>10} {'legacy ms':>10} {'stream ms':>10} {'speedup':>8} {'legacy peak':>12} {'stream peak':>12}")
+    for block_count in args.blocks:
+        payload = make_sse_payload(block_count)
+        transport = httpx.MockTransport(
+            lambda request: httpx.Response(200, headers={"content-type": "text/event-stream"}, content=payload)
+        )
+        async with httpx.AsyncClient(transport=transport) as client:
+            legacy = await measure(run_legacy, client, args.iterations)
+            streaming = await measure(run_streaming, client, args.iterations)
+
+        print(
+            f"{block_count:>8} {len(payload) / 1024:>8.0f}KB "
+            f"{legacy['ms_per_call']:>10.2f} {streaming['ms_per_call']:>10.2f} "
+            f"{legacy['ms_per_call'] / streaming['ms_per_call']:>7.2f}x "
+            f"{legacy['peak_kb']:>10.0f}KB {streaming['peak_kb']:>10.0f}KB"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+合成的本地 MCP 服务器
+
+与 notion-mcp-server 使用相同的协议（JSON-RPC over HTTP，initialize 返回 mcp-session-id，
+tools/call 以 SSE 事件返回，结果文本包在 <json-result> 中），内容按 ID 确定性地生成：
+
+- 任意页面 ID 都是一个合成页面：顶层块数、嵌套层数、每个容器块的子块数、表格数量和大小可配置
+- 任意数据库 ID 都是一个有 N 行的合成数据库，每一行也是一个合成页面
+- 每次工具调用按配置的延迟（可加随机抖动）返回
+
+GET /stats 返回各工具的调用次数和发送的字节数，POST /stats/reset 清零。
+
+运行: python -m benchmarks.fake_mcp_server --port 3999 --latency 0.05 --blocks 50 --depth 3
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+WORDS = [
+    "roadmap", "meeting", "notes", "design", "review", "launch", "budget", "research", "customer", "feedback",
+    "release", "planning", "retro", "hiring", "onboarding", "metrics", "incident", "report", "weekly", "draft"
+]
+
+# 块 ID 中各层级之间的分隔符（页面和数据库行的 ID 中不会出现）
+SEPARATOR = "~"
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+EDITED_TIME = "2025-01-01T00:00:00.000Z"
+
+
+def rich_text(text: str) -> List[Dict[str, Any]]:
+    return [{
+        "type": "text",
+        "text": {"content": text, "link": None},
+        "annotations": {"bold": False, "italic": False, "strikethrough": False, "underline": False, "code": False, "color": "default"},
+        "plain_text": text,
+        "href": None
+    }]
+
+
+class SyntheticWorkspace:
+    """按 ID 确定性生成的页面、块和数据库"""
+
+    def __init__(self, blocks: int = 50, depth: int = 3, fan_out: int = 4, nested_percent: int = 25,
+                 tables: int = 1, table_rows: int = 20, table_columns: int = 4, words: int = 12,
+                 database_rows: int = 500, search_pages: int = 200):
+        self.blocks = blocks
+        self.depth = depth
+        self.fan_out = fan_out
+        # 非顶层块中带子块的比例（百分比），顶层块同样按该比例嵌套
+        self.nested_percent = nested_percent
+        self.tables = tables
+        self.table_rows = table_rows
+        self.table_columns = table_columns
+        self.words = words
+        self.database_rows = database_rows
+        self.search_pages = search_pages
+        # 表格位于均匀分布的顶层位置
+        self._table_positions = {int((k + 0.5) * blocks / tables) for k in range(tables)} if tables and blocks else set()
+
+    def text(self, seed: str) -> str:
+        rng = random.Random(zlib.crc32(seed.encode()))
+        return " ".join(rng.choice(WORDS) for _ in range(self.words))
+
+    def title(self, seed: str) -> str:
+        rng = random.Random(zlib.crc32(seed.encode()) + 1)
+        return " ".join(rng.choice(WORDS).capitalize() for _ in range(3))
+
+    # ---- 块 ----
+
+    def block_type(self, block_id: str) -> str:
+        parts = block_id.split(SEPARATOR)
+        depth = len(parts) - 1
+        if depth == 1 and int(parts[-1]) in self._table_positions:
+            return "table"
+        if depth < self.depth and zlib.crc32(block_id.encode()) % 100 < self.nested_percent:
+            return "toggle" if zlib.crc32(block_id.encode()) % 2 else "bulleted_list_item"
+        return ("paragraph", "paragraph", "heading_2", "to_do", "quote", "code")[zlib.crc32(block_id.encode()) % 6]
+
+    def block(self, block_id: str) -> Dict[str, Any]:
+        block_type = self.block_type(block_id)
+        block = {
+            "object": "block",
+            "id": block_id,
+            "type": block_type,
+            "created_time": EDITED_TIME,
+            "last_edited_time": EDITED_TIME,
+            "has_children": block_type in ("table", "toggle", "bulleted_list_item"),
+            "archived": False
+        }
+        if block_type == "table":
+            block["table"] = {"table_width": self.table_columns, "has_column_header": True, "has_row_header": False}
+        elif block_type == "code":
+            block["code"] = {"rich_text": rich_text(self.text(block_id)), "language": "python"}
+        elif block_type == "to_do":
+            block["to_do"] = {"rich_text": rich_text(self.text(block_id)), "checked": False, "color": "default"}
+        else:
+            block[block_type] = {"rich_text": rich_text(self.text(block_id)), "color": "default"}
+        return block
+
+    def table_row(self, block_id: str) -> Dict[str, Any]:
+        return {
+            "object": "block",
+            "id": block_id,
+            "type": "table_row",
+            "created_time": EDITED_TIME,
+            "last_edited_time": EDITED_TIME,
+            "has_children": False,
+            "archived": False,
+            "table_row": {"cells": [rich_text(f"{block_id[-6:]} c{column}") for column in range(self.table_columns)]}
+        }
+
+    def children(self, block_id: str) -> List[Dict[str, Any]]:
+        """页面的顶层块，或某个块的子块"""
+        if SEPARATOR not in block_id:
+            return [self.block(f"{block_id}{SEPARATOR}{index}") for index in range(self.blocks)]
+        block_type = self.block_type(block_id)
+        if block_type == "table":
+            return [self.table_row(f"{block_id}{SEPARATOR}{index}") for index in range(self.table_rows)]
+        if block_type in ("toggle", "bulleted_list_item"):
+            return [self.block(f"{block_id}{SEPARATOR}{index}") for index in range(self.fan_out)]
+        return []
+
+    # ---- 页面和数据库 ----
+
+    def page(self, page_id: str) -> Dict[str, Any]:
+        database_id, _, row = page_id.partition("-row-")
+        if row:
+            return self.row(database_id, int(row))
+        return {
+            "object": "page",
+            "id": page_id,
+            "created_time": EDITED_TIME,
+            "last_edited_time": EDITED_TIME,
+            "archived": False,
+            "url": f"https://www.notion.so/{page_id}",
+            "parent": {"type": "workspace", "workspace": True},
+            "properties": {"title": {"id": "title", "type": "title", "title": rich_text(self.title(page_id))}}
+        }
+
+    def row(self, database_id: str, index: int) -> Dict[str, Any]:
+        page_id = f"{database_id}-row-{index:06d}"
+        # 行的 last_edited_time 随序号递增，便于镜像的增量同步
+        edited = (EPOCH + timedelta(minutes=index)).strftime("%Y-%m-%dT%H:%M:00.000Z")
+        return {
+            "object": "page",
+            "id": page_id,
+            "created_time": EDITED_TIME,
+            "last_edited_time": edited,
+            "archived": False,
+            "url": f"https://www.notion.so/{page_id}",
+            "parent": {"type": "database_id", "database_id": database_id},
+            "properties": {
+                "Name": {"id": "title", "type": "title", "title": rich_text(self.title(page_id))},
+                "Status": {"id": "s", "type": "status", "status": {"name": ("Todo", "Doing", "Done")[index % 3]}},
+                "Tags": {"id": "t", "type": "multi_select", "multi_select": [{"name": WORDS[index % len(WORDS)]}, {"name": WORDS[index % 7]}]},
+                "Points": {"id": "p", "type": "number", "number": index % 13},
+                "Due": {"id": "d", "type": "date", "date": {"start": (EPOCH + timedelta(days=index % 90)).strftime("%Y-%m-%d")}},
+                "Done": {"id": "c", "type": "checkbox", "checkbox": index % 2 == 0}
+            }
+        }
+
+    def database(self, database_id: str) -> Dict[str, Any]:
+        return {
+            "object": "database",
+            "id": database_id,
+            "created_time": EDITED_TIME,
+            "last_edited_time": EDITED_TIME,
+            "title": rich_text(f"Database {database_id}"),
+            "properties": {
+                "Name": {"id": "title", "type": "title", "title": {}},
+                "Status": {"id": "s", "type": "status", "status": {}},
+                "Tags": {"id": "t", "type": "multi_select", "multi_select": {}},
+                "Points": {"id": "p", "type": "number", "number": {}},
+                "Due": {"id": "d", "type": "date", "date": {}},
+                "Done": {"id": "c", "type": "checkbox", "checkbox": {}}
+            }
+        }
+
+    def query(self, database_id: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """查询数据库的一页；只支持镜像增量同步使用的 last_edited_time on_or_after 过滤，其余过滤条件忽略
+
+        行的 last_edited_time 随序号递增，过滤条件直接换算为起始序号，只生成当前页的行。
+        """
+        first = 0
+        condition = (arguments.get("filter") or {}).get("last_edited_time") or {}
+        if "on_or_after" in condition:
+            since = datetime.fromisoformat(condition["on_or_after"].replace("Z", "+00:00"))
+            minutes = (since - EPOCH).total_seconds() / 60
+            first = min(self.database_rows, max(0, math.ceil(minutes)))
+        return paginate(self.database_rows - first, lambda index: self.row(database_id, first + index), arguments)
+
+    def search(self, query: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        query = query.lower()
+        pages = (self.page(f"search-{index:05d}") for index in range(self.search_pages))
+        matches = [
+            page for page in pages
+            if query in page["properties"]["title"]["title"][0]["plain_text"].lower()
+        ]
+        return paginate(len(matches), matches.__getitem__, arguments)
+
+
+def paginate(total: int, item: Callable[[int], Dict[str, Any]], arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """按 start_cursor（偏移量）和 page_size 分页，只生成当前页的条目"""
+    start = int(arguments.get("start_cursor") or 0)
+    end = min(total, start + min(100, int(arguments.get("page_size") or 100)))
+    return {
+        "object": "list",
+        "results": [item(index) for index in range(start, end)],
+        "has_more": end < total,
+        "next_cursor": str(end) if end < total else None
+    }
+
+
+def tool_result(workspace: SyntheticWorkspace, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    if name == "API-retrieve-a-page":
+        return workspace.page(arguments["page_id"])
+    if name == "API-get-block-children":
+        children = workspace.children(arguments["block_id"])
+        return paginate(len(children), children.__getitem__, arguments)
+    if name == "API-retrieve-a-database":
+        return workspace.database(arguments["database_id"])
+    if name == "API-post-database-query":
+        return workspace.query(arguments["database_id"], arguments)
+    if name == "API-post-search":
+        return workspace.search(arguments.get("query", ""), arguments)
+    return {"object": "error", "status": 400, "code": "invalid_request", "message": f"Unknown tool {name}"}
+
+
+def sse_message(request_id: Any, result: Dict[str, Any]) -> bytes:
+    """与 notion-mcp-server 相同的响应格式"""
+    message = {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "result": {"content": [{"type": "text", "text": "<json-result>" + json.dumps(result) + "</json-result>"}]}
+    }
+    return ("event: message\ndata: " + json.dumps(message) + "\n\n").encode("utf-8")
+
+
+def make_app(workspace: SyntheticWorkspace, latency: float = 0.0, jitter: float = 0.0) -> Starlette:
+    """创建 ASGI 应用；latency 为每次工具调用的平均延迟（秒），jitter 为相对抖动（0.2 表示 ±20%）"""
+    sessions = set()
+    stats: Dict[str, Any] = {"initialize": 0, "calls": 0, "bytes": 0, "tools": {}}
+
+    async def mcp(request: Request) -> Response:
+        if request.method == "DELETE":
+            sessions.discard(request.headers.get("mcp-session-id"))
+            return Response(status_code=200)
+
+        body = await request.json()
+        if body.get("method") == "initialize":
+            stats["initialize"] += 1
+            session_id = str(uuid.uuid4())
+            sessions.add(session_id)
+            return JSONResponse({"jsonrpc": "2.0", "id": body.get("id"), "result": {}}, headers={"mcp-session-id": session_id})
+
+        if request.headers.get("mcp-session-id") not in sessions:
+            return Response(status_code=404)
+
+        name = body["params"]["name"]
+        arguments = body["params"].get("arguments") or {}
+        if latency > 0:
+            await asyncio.sleep(max(0.0, latency * (1 + jitter * random.uniform(-1, 1))))
+
+        payload = sse_message(body.get("id"), tool_result(workspace, name, arguments))
+        stats["calls"] += 1
+        stats["bytes"] += len(payload)
+        stats["tools"][name] = stats["tools"].get(name, 0) + 1
+        return Response(payload, media_type="text/event-stream")
+
+    async def get_stats(request: Request) -> Response:
+        if request.method == "POST":
+            stats.update(initialize=0, calls=0, bytes=0, tools={})
+        return JSONResponse(stats)
+
+    return Starlette(routes=[
+        Route("/mcp", mcp, methods=["POST", "DELETE"]),
+        Route("/stats", get_stats, methods=["GET"]),
+        Route("/stats/reset", get_stats, methods=["POST"])
+    ])
+
+
+def add_workspace_arguments(parser: argparse.ArgumentParser) -> None:
+    """合成内容的形状参数（基准脚本共用）"""
+    parser.add_argument("--latency", type=float, default=0.05, help="每次工具调用的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟的相对抖动")
+    parser.add_argument("--blocks", type=int, default=50, help="每个页面的顶层块数")
+    parser.add_argument("--depth", type=int, default=3, help="最大嵌套层数")
+    parser.add_argument("--fan-out", type=int, default=4, help="每个容器块的子块数")
+    parser.add_argument("--nested-percent", type=int, default=25, help="带子块的块所占百分比")
+    parser.add_argument("--tables", type=int, default=1, help="每个页面的表格数")
+    parser.add_argument("--table-rows", type=int, default=20)
+    parser.add_argument("--table-columns", type=int, default=4)
+    parser.add_argument("--words", type=int, default=12, help="每个文本块的词数")
+    parser.add_argument("--database-rows", type=int, default=500)
+    parser.add_argument("--search-pages", type=int, default=200)
+
+
+WORKSPACE_ARGUMENTS = (
+    "latency", "jitter", "blocks", "depth", "fan_out", "nested_percent", "tables", "table_rows", "table_columns",
+    "words", "database_rows", "search_pages"
+)
+
+
+def workspace_argv(args: argparse.Namespace) -> List[str]:
+    """把解析后的形状参数还原为命令行参数，用于在子进程中启动服务器"""
+    argv = []
+    for name in WORKSPACE_ARGUMENTS:
+        argv += ["--" + name.replace("_", "-"), str(getattr(args, name))]
+    return argv
+
+
+def workspace_from_arguments(args: argparse.Namespace) -> SyntheticWorkspace:
+    return SyntheticWorkspace(
+        blocks=args.blocks, depth=args.depth, fan_out=args.fan_out, nested_percent=args.nested_percent,
+        tables=args.tables, table_rows=args.table_rows, table_columns=args.table_columns, words=args.words,
+        database_rows=args.database_rows, search_pages=args.search_pages
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="合成的本地 MCP 服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3999)
+    add_workspace_arguments(parser)
+    args = parser.parse_args()
+
+    app = make_app(workspace_from_arguments(args), latency=args.latency, jitter=args.jitter)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
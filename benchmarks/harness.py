@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+端到端离线基准
+
+在子进程中启动合成的 MCP 服务器（benchmarks.fake_mcp_server），在本进程内通过 ASGI 直接驱动代理应用
+（不经过网络栈，也不需要 Notion token），按场景测量：
+
+- 吞吐量（请求/秒）和延迟 p50 / p95 / p99
+- 每个请求的上游 MCP 调用数（从合成服务器的 /stats 或回放传输层的统计计算）
+- 峰值内存（tracemalloc，单独一轮，避免追踪开销影响延迟）
+
+每个场景使用各自的页面 / 数据库 ID，page、batch 等场景的每个请求都是冷缓存；
+page_cached 先预热少量页面，然后反复读取。
+
+--record 把代理的全部上游调用录制到文件，--replay 只从录制文件回放（不启动合成服务器），
+录制文件也可以来自生产环境（MCP_TRANSPORT=record），cassette 场景依次读取其中录制过的页面。
+
+运行: python -m benchmarks.harness --scenarios page batch database_export --concurrency 8 --requests 200
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.fake_mcp_server import WORDS, add_workspace_arguments, workspace_argv
+from client.cassette import open_cassette
+
+AUTH_TOKEN = "benchmark-token"
+
+# 场景：请求序号 -> (方法, 路径, httpx 请求参数)
+Scenario = Callable[[str, int], Tuple[str, str, Dict[str, Any]]]
+
+SCENARIOS: Dict[str, Scenario] = {
+    # 完整页面（元数据 + 整个块树），每个请求一个新页面
+    "page": lambda run, i: ("GET", f"/api/page/{run}-page-{i}", {}),
+    # 反复读取 10 个已缓存的页面
+    "page_cached": lambda run, i: ("GET", f"/api/page/{run}-cached-{i % 10}", {}),
+    # NDJSON 流式页面
+    "page_stream": lambda run, i: ("GET", f"/api/page/{run}-stream-{i}", {"params": {"stream": "true"}}),
+    # 每个请求批量获取 10 个新页面
+    "batch": lambda run, i: ("POST", "/api/pages/batch", {"json": {"page_ids": [f"{run}-batch-{i}-{k}" for k in range(10)]}}),
+    # 数据库第一页（100 行），每个请求一个新数据库
+    "database_pages": lambda run, i: ("GET", f"/api/database/{run}-db-{i}/pages", {}),
+    # NDJSON 导出整个数据库
+    "database_export": lambda run, i: ("GET", f"/api/database/{run}-export-{i}/export", {}),
+    # 数据库内搜索
+    "database_search": lambda run, i: ("POST", "/api/database/search", {"json": {"database_id": f"{run}-dbsearch-{i}", "page_size": 50}}),
+    # 全局搜索（转发到上游）
+    "search": lambda run, i: ("POST", "/api/search", {"json": {"query": WORDS[i % len(WORDS)]}})
+}
+
+# 需要预热的场景：预热请求的序号与测量请求相同，测量时命中缓存
+WARM_SCENARIOS = ("page_cached",)
+
+# 录制文件中的页面 ID，由 --replay 加载
+CASSETTE_PAGES: List[str] = []
+
+
+def cassette_scenario(run: str, i: int) -> Tuple[str, str, Dict[str, Any]]:
+    """依次读取录制文件中的页面（与 run 无关，ID 必须与录制时一致）"""
+    return "GET", f"/api/page/{CASSETTE_PAGES[i % len(CASSETTE_PAGES)]}", {}
+
+
+SCENARIOS["cassette"] = cassette_scenario
+
+
+def load_cassette_pages(path: str) -> List[str]:
+    """录制文件中 API-retrieve-a-page 请求过的页面 ID（按首次出现的顺序）"""
+    pages: Dict[str, None] = {}
+    with open_cassette(path, "r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if entry["tool"] == "API-retrieve-a-page":
+                    pages.setdefault(entry["arguments"].get("page_id"), None)
+    return [page_id for page_id in pages if page_id]
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(percent / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def start_fake_server(port: int, args: argparse.Namespace) -> subprocess.Popen:
+    command = [sys.executable, "-m", "benchmarks.fake_mcp_server", "--port", str(port)] + workspace_argv(args)
+    process = subprocess.Popen(command)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats", timeout=1)
+            return process
+        except httpx.TransportError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Fake MCP server did not start")
+
+
+def configure_proxy(upstream: str, args: argparse.Namespace) -> None:
+    """在导入 app 之前设置环境变量（已有的 .env 不会覆盖这些值）"""
+    # 回放时不访问网络，服务器地址只需是合法的 URL
+    os.environ["MCP_SERVER_URL"] = upstream if upstream != "replay" else "http://replay.invalid/mcp"
+    os.environ["API_AUTH_TOKEN"] = AUTH_TOKEN
+    os.environ["MCP_RATE_LIMIT"] = str(args.rate_limit)
+    # 关闭持久化缓存和镜像，每次运行都从空缓存开始
+    os.environ["CACHE_DB_PATH"] = ""
+    os.environ["MIRROR_DATABASE_IDS"] = ""
+    os.environ["SEARCH_MODE"] = "upstream"
+    if args.record:
+        os.environ["MCP_TRANSPORT"] = "record"
+        os.environ["MCP_CASSETTE"] = args.record
+    elif args.replay:
+        os.environ["MCP_TRANSPORT"] = "replay"
+        os.environ["MCP_CASSETTE"] = args.replay
+        os.environ["MCP_REPLAY_SPEED"] = str(args.replay_speed)
+
+
+async def upstream_calls(upstream: str) -> int:
+    """合成服务器至今收到的工具调用数；回放时为回放传输层处理的调用数"""
+    if upstream == "replay":
+        from app import session_pool
+        stats = session_pool.transport.stats()
+        return stats["served"] + stats["misses"]
+    async with httpx.AsyncClient() as client:
+        response = await client.get(upstream.rsplit("/", 1)[0] + "/stats")
+        return response.json()["calls"]
+
+
+async def run_requests(client: httpx.AsyncClient, scenario: Scenario, run: str, requests: int,
+                       concurrency: int) -> Tuple[List[float], Counter, float]:
+    """闭环压测：concurrency 个 worker 依次取下一个请求序号，返回 (各请求延迟, 错误计数, 总耗时)"""
+    latencies: List[float] = []
+    errors: Counter = Counter()
+    counter = itertools.count()
+
+    async def worker():
+        while True:
+            index = next(counter)
+            if index >= requests:
+                return
+            method, path, kwargs = scenario(run, index)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                if response.status_code >= 400:
+                    errors[str(response.status_code)] += 1
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def bench_scenario(client: httpx.AsyncClient, upstream: str, name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    scenario = SCENARIOS[name]
+    if name in WARM_SCENARIOS:
+        await run_requests(client, scenario, "warm", min(args.requests, 10), args.concurrency)
+
+    calls_before = await upstream_calls(upstream)
+    latencies, errors, elapsed = await run_requests(client, scenario, "warm" if name in WARM_SCENARIOS else "run",
+                                                    args.requests, args.concurrency)
+    calls = await upstream_calls(upstream) - calls_before
+
+    result = {
+        "scenario": name,
+        "requests": len(latencies),
+        "errors": dict(errors),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "upstream_calls_per_request": calls / len(latencies) if latencies else 0.0,
+        "peak_mb": None
+    }
+
+    if args.memory:
+        # 单独一轮测峰值内存（新的 ID，与上一轮的缓存无关；page_cached 仍读取已缓存的页面）
+        tracemalloc.start()
+        await run_requests(client, scenario, "warm" if name in WARM_SCENARIOS else "memory",
+                           min(args.requests, args.memory_requests), args.concurrency)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_mb"] = peak / 1024 / 1024
+    return result
+
+
+async def run_benchmarks(upstream: str, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    configure_proxy(upstream, args)
+    # 环境变量设置之后才能导入应用
+    from app import app
+
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://proxy",
+                                     headers={"Authorization": f"Bearer {AUTH_TOKEN}"}, timeout=None) as client:
+            for name in args.scenarios:
+                result = await bench_scenario(client, upstream, name, args)
+                results.append(result)
+                print_result(result)
+    return results
+
+
+def print_header() -> None:
+    print(f"{'scenario':>16} {'req':>6} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'calls/req':>10} {'peak MB':>9}")
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    peak = f"{result['peak_mb']:>9.1f}" if result["peak_mb"] is not None else f"{'-':>9}"
+    print(f"{result['scenario']:>16} {result['requests']:>6} {sum(result['errors'].values()):>5} {result['rps']:>9.1f} "
+          f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+          f"{result['upstream_calls_per_request']:>10.1f} {peak}")
+    for error, count in sorted(result["errors"].items()):
+        print(f"{'':>16}   {error}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端离线基准（合成 MCP 服务器）")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS),
+                        help="默认为除 cassette 外的全部场景，--replay 时默认为 cassette")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发请求数（闭环）")
+    parser.add_argument("--requests", type=int, default=100, help="每个场景的请求数")
+    parser.add_argument("--rate-limit", type=float, default=0, help="代理的 MCP_RATE_LIMIT（0 表示不限速）")
+    parser.add_argument("--memory", action="store_true", help="额外一轮测量峰值内存")
+    parser.add_argument("--memory-requests", type=int, default=20, help="测量内存那一轮的请求数")
+    parser.add_argument("--port", type=int, default=3999, help="合成 MCP 服务器的端口")
+    parser.add_argument("--upstream", help="使用已运行的合成 MCP 服务器（如 http://127.0.0.1:3999/mcp），不再启动子进程")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件，便于对比")
+    parser.add_argument("--record", help="把代理的上游调用录制到该文件（.gz 结尾时压缩）")
+    parser.add_argument("--replay", help="只从该录制文件回放，不启动合成 MCP 服务器")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="回放速度（2 为两倍速，0 表示不等待）")
+    add_workspace_arguments(parser)
+    args = parser.parse_args()
+
+    process: Optional[subprocess.Popen] = None
+    upstream = args.upstream
+    if args.replay:
+        CASSETTE_PAGES.extend(load_cassette_pages(args.replay))
+        upstream = "replay"
+        args.scenarios = args.scenarios or ["cassette"]
+    elif args.scenarios and "cassette" in args.scenarios:
+        parser.error("the cassette scenario requires --replay")
+    args.scenarios = args.scenarios or [name for name in SCENARIOS if name != "cassette"]
+    if not upstream:
+        process = start_fake_server(args.port, args)
+        upstream = f"http://127.0.0.1:{args.port}/mcp"
+
+    if args.replay:
+        print(f"Replay: {args.replay}  speed={args.replay_speed}  pages={len(CASSETTE_PAGES)}  "
+              f"concurrency={args.concurrency}  requests={args.requests}")
+    else:
+        print(f"Upstream: {upstream}  latency={args.latency}s ±{args.jitter:.0%}  blocks={args.blocks} depth={args.depth} "
+              f"fan-out={args.fan_out}  concurrency={args.concurrency}  requests={args.requests}")
+    print_header()
+    try:
+        results = asyncio.run(run_benchmarks(upstream, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
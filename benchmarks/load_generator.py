@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+并发负载生成器
+
+按配置的请求组合（页面、全局搜索、数据库列表、数据库搜索）对代理施加并发负载，
+每一档负载先预热再测量，输出各端点的延迟分布（直方图和 p50 / p90 / p99）、错误分类和实际达到的 RPS。
+
+- 闭环（--concurrency）：固定数量的 worker，每个收到响应后立即发出下一个请求
+- 开环（--rate）：按指定速率到达（默认泊松分布），不等待前一个请求完成；
+  延迟从计划到达时间算起，不会因为服务变慢而少发请求（避免协调遗漏）
+
+--concurrency 或 --rate 给出多个值时依次运行每一档，最后汇总成一张表，用于找到饱和点。
+--local 在子进程中启动合成的 MCP 服务器和代理（uvicorn），不需要 Notion，结果可复现。
+
+运行:
+    python -m benchmarks.load_generator --local --rate 5 10 20 40 --duration 20
+    python -m benchmarks.load_generator --base-url http://localhost:8000 --page-ids <id> --database-ids <id> --concurrency 16
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+from benchmarks.fake_mcp_server import WORDS, add_workspace_arguments
+from benchmarks.harness import percentile, start_fake_server
+from metrics.registry import LATENCY_BUCKETS
+
+load_dotenv()
+
+# 请求组合中的端点：名称 -> 根据随机数和目标 ID 生成 (方法, 路径, httpx 请求参数)
+Targets = Dict[str, List[str]]
+RequestFactory = Callable[[random.Random, Targets], Tuple[str, str, Dict[str, Any]]]
+
+ENDPOINTS: Dict[str, RequestFactory] = {
+    "page": lambda rng, targets: ("GET", f"/api/page/{rng.choice(targets['pages'])}", {}),
+    "search": lambda rng, targets: ("POST", "/api/search", {"json": {"query": rng.choice(targets["queries"])}}),
+    "database_pages": lambda rng, targets: ("GET", f"/api/database/{rng.choice(targets['databases'])}/pages", {}),
+    "database_search": lambda rng, targets: (
+        "POST", "/api/database/search", {"json": {"database_id": rng.choice(targets["databases"]), "page_size": 20}}
+    )
+}
+
+DEFAULT_MIX = "page=6,search=2,database_pages=1,database_search=1"
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """解析形如 "page=6,search=2" 的请求组合权重"""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if not name:
+            continue
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {name!r} (expected one of {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("The request mix needs at least one endpoint with a positive weight")
+    return mix
+
+
+class PhaseStats:
+    """一档负载的测量结果：各端点的延迟和错误"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.errors: Dict[str, Counter] = {name: Counter() for name in ENDPOINTS}
+        self.dropped = 0
+        self.elapsed = 0.0
+
+    def record(self, endpoint: str, latency: float, error: Optional[str]) -> None:
+        self.latencies[endpoint].append(latency)
+        if error is not None:
+            self.errors[endpoint][error] += 1
+
+    def all_latencies(self) -> List[float]:
+        return [latency for latencies in self.latencies.values() for latency in latencies]
+
+    def error_count(self) -> int:
+        return sum(sum(errors.values()) for errors in self.errors.values())
+
+    def summary(self, latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "rps": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p90_ms": percentile(latencies, 90) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": max(latencies) * 1000 if latencies else 0.0
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        endpoints = {
+            name: {**self.summary(latencies, sum(self.errors[name].values()), self.elapsed), "error_breakdown": dict(self.errors[name])}
+            for name, latencies in self.latencies.items() if latencies
+        }
+        return {
+            "total": {**self.summary(self.all_latencies(), self.error_count(), self.elapsed), "dropped": self.dropped},
+            "endpoints": endpoints,
+            "histogram": histogram(self.all_latencies())
+        }
+
+
+def histogram(latencies: List[float]) -> List[Tuple[str, int]]:
+    """按 /metrics 的延迟分桶统计（上界，秒），最后一个桶为 +Inf"""
+    counts = [0] * (len(LATENCY_BUCKETS) + 1)
+    for latency in latencies:
+        counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+    bounds = [f"{bound * 1000:g}ms" for bound in LATENCY_BUCKETS] + ["+Inf"]
+    # 去掉末尾的空桶
+    while len(counts) > 1 and counts[-1] == 0:
+        counts.pop()
+        bounds.pop()
+    return list(zip(bounds, counts))
+
+
+class LoadGenerator:
+    """按请求组合向代理发请求，记录延迟和错误"""
+
+    def __init__(self, client: httpx.AsyncClient, mix: Dict[str, float], targets: Targets, seed: int):
+        self.client = client
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.targets = targets
+        self.rng = random.Random(seed)
+
+    def next_request(self) -> Tuple[str, str, str, Dict[str, Any]]:
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        method, path, kwargs = ENDPOINTS[endpoint](self.rng, self.targets)
+        return endpoint, method, path, kwargs
+
+    async def send(self, stats: PhaseStats, scheduled_at: Optional[float] = None) -> None:
+        """发出一个请求；开环时延迟从计划到达时间算起"""
+        endpoint, method, path, kwargs = self.next_request()
+        start = scheduled_at if scheduled_at is not None else time.perf_counter()
+        error = None
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            if response.status_code >= 400:
+                error = str(response.status_code)
+        except Exception as e:
+            error = type(e).__name__
+        stats.record(endpoint, time.perf_counter() - start, error)
+
+    async def closed_loop(self, concurrency: int, duration: float) -> PhaseStats:
+        stats = PhaseStats()
+        start = time.perf_counter()
+        stop_at = start + duration
+
+        async def worker():
+            while time.perf_counter() < stop_at:
+                await self.send(stats)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        stats.elapsed = time.perf_counter() - start
+        return stats
+
+    async def open_loop(self, rate: float, duration: float, max_in_flight: int, poisson: bool = True) -> PhaseStats:
+        """按速率到达；同时进行的请求达到 max_in_flight 时新到达的请求记为 dropped（客户端过载）"""
+        stats = PhaseStats()
+        start = time.perf_counter()
+        in_flight = set()
+        next_arrival = start
+        while next_arrival < start + duration:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= max_in_flight:
+                stats.dropped += 1
+            else:
+                task = asyncio.create_task(self.send(stats, scheduled_at=next_arrival))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            next_arrival += self.rng.expovariate(rate) if poisson else 1 / rate
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        stats.elapsed = time.perf_counter() - start
+        return stats
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{url} did not become ready")
+
+
+def start_local_proxy(port: int, upstream: str, token: str, args: argparse.Namespace) -> subprocess.Popen:
+    """在子进程中启动代理，指向合成的 MCP 服务器（不使用持久化缓存和镜像）"""
+    env = dict(os.environ)
+    env.update({
+        "MCP_SERVER_URL": upstream,
+        "API_AUTH_TOKEN": token,
+        "MCP_RATE_LIMIT": str(args.rate_limit),
+        "CACHE_DB_PATH": "",
+        "MIRROR_DATABASE_IDS": "",
+        "SEARCH_MODE": "upstream"
+    })
+    command = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    wait_until_ready(f"http://127.0.0.1:{port}/", process)
+    return process
+
+
+def print_phase(label: str, stats: PhaseStats) -> None:
+    report = stats.to_dict()
+    total = report["total"]
+    print(f"\n== {label}: {total['requests']} requests in {stats.elapsed:.1f}s, {total['rps']:.1f} req/s, "
+          f"{total['errors']} errors" + (f", {total['dropped']} dropped" if total["dropped"] else ""))
+    print(f"{'endpoint':>16} {'req':>7} {'err':>6} {'req/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, item in report["endpoints"].items():
+        print(f"{name:>16} {item['requests']:>7} {item['errors']:>6} {item['rps']:>8.1f} {item['p50_ms']:>9.1f} "
+              f"{item['p90_ms']:>9.1f} {item['p99_ms']:>9.1f} {item['max_ms']:>9.1f}")
+        for error, count in sorted(item["error_breakdown"].items()):
+            print(f"{'':>16}   {error}: {count}")
+
+    buckets = report["histogram"]
+    peak = max((count for _, count in buckets), default=0)
+    print("latency histogram:")
+    for bound, count in buckets:
+        bar = "#" * (round(count / peak * 40) if peak else 0)
+        print(f"  <= {bound:>8} {count:>7}  {bar}")
+
+
+def print_saturation(steps: List[Dict[str, Any]]) -> None:
+    print(f"\n{'load':>16} {'offered':>9} {'achieved':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>8} {'dropped':>8}")
+    for step in steps:
+        total = step["total"]
+        offered = f"{step['rate']:.1f}" if step.get("rate") is not None else "-"
+        error_rate = total["errors"] / total["requests"] if total["requests"] else 0.0
+        print(f"{step['load']:>16} {offered:>9} {total['rps']:>9.1f} {total['p50_ms']:>9.1f} {total['p99_ms']:>9.1f} "
+              f"{error_rate:>8.1%} {total['dropped']:>8}")
+
+
+async def run_load(base_url: str, token: str, targets: Targets, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    if args.rate:
+        steps = [("rate", rate) for rate in args.rate]
+    else:
+        steps = [("concurrency", concurrency) for concurrency in args.concurrency]
+    max_connections = max([args.max_in_flight] + list(args.concurrency))
+
+    results = []
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=args.timeout,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    ) as client:
+        generator = LoadGenerator(client, args.mix, targets, args.seed)
+
+        async def phase(kind: str, value: float, duration: float) -> PhaseStats:
+            if kind == "rate":
+                return await generator.open_loop(value, duration, args.max_in_flight, poisson=args.arrival == "poisson")
+            return await generator.closed_loop(int(value), duration)
+
+        for kind, value in steps:
+            label = f"{kind}={value:g}"
+            if args.warmup > 0:
+                # 预热阶段的结果不计入（填充缓存、建立连接和 MCP 会话）
+                await phase(kind, value, args.warmup)
+            stats = await phase(kind, value, args.duration)
+            print_phase(label, stats)
+            results.append({"load": label, "rate": value if kind == "rate" else None, **stats.to_dict()})
+
+    if len(results) > 1:
+        print_saturation(results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发负载生成器")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="代理地址（--local 时忽略）")
+    parser.add_argument("--token", default=os.getenv("API_AUTH_TOKEN", "your-api-token"), help="API_AUTH_TOKEN")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8], help="闭环 worker 数，多个值时依次运行")
+    parser.add_argument("--rate", type=float, nargs="+", help="开环到达速率（请求/秒），多个值时依次运行；指定后忽略 --concurrency")
+    parser.add_argument("--arrival", choices=("poisson", "uniform"), default="poisson", help="开环到达间隔的分布")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="开环时同时进行的请求上限，超出的到达记为 dropped")
+    parser.add_argument("--duration", type=float, default=30, help="每一档的测量时长（秒）")
+    parser.add_argument("--warmup", type=float, default=5, help="每一档测量前的预热时长（秒，0 表示不预热）")
+    parser.add_argument("--timeout", type=float, default=60, help="单个请求的超时（秒）")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"请求组合权重（默认 {DEFAULT_MIX}）")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子（请求组合、目标和到达间隔）")
+    parser.add_argument("--page-ids", nargs="+", help="页面 ID（--local 时默认为合成页面）")
+    parser.add_argument("--database-ids", nargs="+", help="数据库 ID（--local 时默认为合成数据库）")
+    parser.add_argument("--queries", nargs="+", default=WORDS, help="全局搜索的关键词")
+    parser.add_argument("--local", action="store_true", help="在子进程中启动合成的 MCP 服务器和代理")
+    parser.add_argument("--pages", type=int, default=200, help="--local 时页面 ID 池的大小（越大缓存命中越少）")
+    parser.add_argument("--databases", type=int, default=5, help="--local 时数据库 ID 池的大小")
+    parser.add_argument("--port", type=int, default=3999, help="--local 时合成 MCP 服务器的端口")
+    parser.add_argument("--proxy-port", type=int, default=8765, help="--local 时代理的端口")
+    parser.add_argument("--rate-limit", type=float, default=0, help="--local 时代理的 MCP_RATE_LIMIT（0 表示不限速）")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件")
+    add_workspace_arguments(parser)
+    args = parser.parse_args()
+
+    targets = {
+        "pages": args.page_ids or ([f"page-{i}" for i in range(args.pages)] if args.local else []),
+        "databases": args.database_ids or ([f"db-{i}" for i in range(args.databases)] if args.local else []),
+        "queries": args.queries
+    }
+    for name in args.mix:
+        needed = "pages" if name == "page" else "databases" if name.startswith("database") else "queries"
+        if not targets[needed]:
+            parser.error(f"The mix includes {name} but no {needed} were given (use --{needed[:-1]}-ids or --local)")
+
+    processes: List[subprocess.Popen] = []
+    base_url, token = args.base_url, args.token
+    try:
+        if args.local:
+            processes.append(start_fake_server(args.port, args))
+            token = "load-generator-token"
+            processes.append(start_local_proxy(args.proxy_port, f"http://127.0.0.1:{args.port}/mcp", token, args))
+            base_url = f"http://127.0.0.1:{args.proxy_port}"
+            print(f"Local fake upstream: latency={args.latency}s ±{args.jitter:.0%}  blocks={args.blocks} depth={args.depth}  "
+                  f"pages={args.pages} databases={args.databases}")
+        print(f"Target: {base_url}  mix={','.join(f'{name}={weight:g}' for name, weight in args.mix.items())}  "
+              f"warmup={args.warmup:g}s duration={args.duration:g}s")
+        results = asyncio.run(run_load(base_url, token, targets, args))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
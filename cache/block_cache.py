@@ -0,0 +1,84 @@
+import json
+import os
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+from cache.edit_time import is_settled
+from cache.lru import LRUCache
+
+load_dotenv()
+
+
+class BlockCache:
+    """块级缓存：按 (block_id, last_edited_time) 缓存子块列表和渲染后的 Markdown
+
+    配置了持久化存储（store）时，内存未命中会回落到存储读取，写入同时写到存储。
+    last_edited_time 只精确到分钟，刚编辑过（未稳定）的块既不读取也不写入缓存。
+    """
+
+    NAMESPACE = "block"
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None, ttl: Optional[float] = None,
+                 store=None):
+        self.store = store
+        self._lru = LRUCache(
+            max_entries=max_entries if max_entries is not None else int(os.getenv("BLOCK_CACHE_MAX_ENTRIES", 10000)),
+            max_bytes=max_bytes if max_bytes is not None else int(os.getenv("BLOCK_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+            ttl=ttl if ttl is not None else float(os.getenv("BLOCK_CACHE_TTL", 3600))
+        )
+
+    @staticmethod
+    def _estimate_size(children: List[Dict[str, Any]], markdown: Optional[str]) -> int:
+        """估算条目占用的字节数"""
+        size = len(json.dumps(children, ensure_ascii=False, separators=(",", ":")))
+        if markdown:
+            size += len(markdown)
+        return size
+
+    def get(self, block_id: str, last_edited_time: Optional[str]) -> Optional[Dict[str, Any]]:
+        """读取块的缓存条目，last_edited_time 不一致或未稳定时视为未命中"""
+        if not is_settled(last_edited_time):
+            return None
+        entry = self._lru.get((block_id, last_edited_time))
+        if entry is None and self.store is not None:
+            entry = self._load(block_id, last_edited_time)
+        return entry
+
+    def peek(self, block_id: str, last_edited_time: Optional[str]) -> Optional[Dict[str, Any]]:
+        """读取缓存条目但不计入命中统计"""
+        if not is_settled(last_edited_time):
+            return None
+        return self._lru.peek((block_id, last_edited_time))
+
+    def _load(self, block_id: str, last_edited_time: str) -> Optional[Dict[str, Any]]:
+        """从持久化存储读取条目并放回内存缓存"""
+        item = self.store.get(self.NAMESPACE, (block_id, last_edited_time))
+        if item is None:
+            return None
+        value, ttl = item
+        entry = json.loads(value)
+        self._lru.put((block_id, last_edited_time), entry, len(value), ttl)
+        return entry
+
+    def put(self, block_id: str, last_edited_time: Optional[str], children: List[Dict[str, Any]], markdown: Optional[str] = None) -> None:
+        """缓存块的子块列表（以及可选的渲染结果）"""
+        if not is_settled(last_edited_time):
+            return
+        entry = {"children": children, "markdown": markdown}
+        self._lru.put((block_id, last_edited_time), entry, self._estimate_size(children, markdown))
+        if self.store is not None:
+            value = json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self.store.put(self.NAMESPACE, (block_id, last_edited_time), value, self._lru.ttl)
+
+    def set_markdown(self, block_id: str, last_edited_time: Optional[str], markdown: str) -> None:
+        """为已缓存的块补充子内容的渲染结果"""
+        entry = self.peek(block_id, last_edited_time)
+        if entry is not None and entry["markdown"] != markdown:
+            self.put(block_id, last_edited_time, entry["children"], markdown)
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计（命中/未命中/淘汰次数和内存占用）"""
+        return self._lru.stats()
@@ -0,0 +1,23 @@
+import os
+import time
+from datetime import datetime
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Notion 的 last_edited_time 只精确到分钟，同一分钟内的后续编辑不会改变它：
+# 距今不足 EDIT_TIME_SETTLE_SECONDS 的版本还可能变化，不能作为缓存键
+EDIT_TIME_SETTLE_SECONDS = float(os.getenv("EDIT_TIME_SETTLE_SECONDS", 60))
+
+
+def is_settled(last_edited_time: Optional[str], settle_seconds: Optional[float] = None) -> bool:
+    """last_edited_time 对应的内容是否已经不会在同一时间戳下再变化（无法解析时视为未稳定）"""
+    if not last_edited_time:
+        return False
+    try:
+        edited_at = datetime.fromisoformat(last_edited_time.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return False
+    settle_seconds = settle_seconds if settle_seconds is not None else EDIT_TIME_SETTLE_SECONDS
+    return time.time() - edited_at >= settle_seconds
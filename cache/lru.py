@@ -0,0 +1,84 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """带 TTL 过期和内存上限的 LRU 缓存"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        # key -> (value, 估算字节数, 过期时间)
+        self._data: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """读取缓存，过期条目视为未命中"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        value, _, expires_at = item
+        if expires_at < time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """读取缓存但不更新统计和访问顺序"""
+        item = self._data.get(key)
+        if item is None or item[2] < time.monotonic():
+            return None
+        return item[0]
+
+    def put(self, key: Hashable, value: Any, size: int, ttl: Optional[float] = None) -> None:
+        """写入缓存，超出条目数或内存上限时淘汰最久未使用的条目"""
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+
+        self.pop(key)
+        self._data[key] = (value, size, time.monotonic() + (ttl if ttl is not None else self.ttl))
+        self.bytes += size
+
+        while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._data.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """删除缓存条目"""
+        item = self._data.pop(key, None)
+        if item is None:
+            return None
+        self.bytes -= item[1]
+        return item[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
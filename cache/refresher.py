@@ -0,0 +1,48 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class BackgroundRefresher:
+    """后台刷新任务管理：同一个 key 同时最多只有一个刷新在进行"""
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, "asyncio.Task[Any]"] = {}
+        self.scheduled = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def schedule(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> bool:
+        """启动后台刷新，已有相同 key 的刷新在进行时跳过"""
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            self.skipped += 1
+            return False
+
+        task = asyncio.ensure_future(factory())
+        self._tasks[key] = task
+        task.add_done_callback(lambda done: self._on_done(key, done))
+        self.scheduled += 1
+        return True
+
+    def _on_done(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+            print(f"Background refresh failed for {key}: {task.exception()}")
+
+    async def close(self) -> None:
+        """取消所有进行中的刷新"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_progress": len(self._tasks),
+            "scheduled": self.scheduled,
+            "skipped": self.skipped,
+            "failed": self.failed
+        }
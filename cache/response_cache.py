@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Any, Hashable, Optional
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from cache.edit_time import is_settled
+from cache.lru import LRUCache
+
+load_dotenv()
+
+
+class ResponseCache:
+    """接口响应缓存：保存序列化后的响应体和强 ETag
+
+    - 页面按 (page_id, last_edited_time) 缓存，验证只需一次 API-retrieve-a-page；
+      last_edited_time 只精确到分钟，刚编辑过（未稳定）的版本不缓存
+    - 页面在 fresh_ttl 内无需验证；超过后的 stale_while_revalidate 秒内可先返回旧内容再后台刷新
+    - 数据库查询按 (database_id, 规范化的 filter/sorts/cursor/page_size) 缓存，依赖较短的 TTL
+    - 配置了持久化存储（store）时作为第二级缓存，多个 worker 之间共享，重启后仍然有效
+    """
+
+    NAMESPACE = "response"
+    LATEST_NAMESPACE = "page-latest"
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 page_ttl: Optional[float] = None, database_ttl: Optional[float] = None, store=None):
+        self.store = store
+        self.page_ttl = page_ttl if page_ttl is not None else float(os.getenv("RESPONSE_CACHE_PAGE_TTL", 3600))
+        self.database_ttl = database_ttl if database_ttl is not None else float(os.getenv("RESPONSE_CACHE_DATABASE_TTL", 30))
+        self.page_fresh_ttl = float(os.getenv("PAGE_CACHE_FRESH_TTL", 0))
+        self.page_stale_while_revalidate = float(os.getenv("PAGE_CACHE_STALE_WHILE_REVALIDATE", 0))
+        self._lru = LRUCache(
+            max_entries=max_entries if max_entries is not None else int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+            max_bytes=max_bytes if max_bytes is not None else int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+            ttl=self.page_ttl
+        )
+        # page_id -> 最近一次缓存的页面版本对应的缓存键
+        self._latest_pages: Dict[str, Hashable] = {}
+
+    @staticmethod
+    def page_key(page_id: str, last_edited_time: Optional[str]) -> Hashable:
+        return ("page", page_id, last_edited_time)
+
+    @staticmethod
+    def database_key(database_id: str, **params: Any) -> Hashable:
+        """数据库查询的缓存键，参数经过键排序规范化"""
+        return ("database", database_id, json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False))
+
+    @staticmethod
+    def make_etag(body: bytes) -> str:
+        """基于响应体内容的强 ETag"""
+        return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    @staticmethod
+    def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+        """判断 If-None-Match 是否命中（按 RFC 9110 使用弱比较）"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == etag:
+                return True
+        return False
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        entry = self._lru.get(key)
+        if entry is None and self.store is not None:
+            entry = self._load(key)
+        return entry
+
+    def _load(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """从持久化存储读取条目并放回内存缓存"""
+        item = self.store.get(self.NAMESPACE, key)
+        if item is None:
+            return None
+        value, ttl = item
+        # 存储格式：一行 JSON 元数据，随后是原始响应体
+        header, _, body = value.partition(b"\n")
+        entry = json.loads(header)
+        entry["body"] = body
+        self._lru.put(key, entry, len(body), ttl)
+        return entry
+
+    def _save(self, key: Hashable, entry: Dict[str, Any], ttl: float) -> None:
+        header = {name: value for name, value in entry.items() if name != "body"}
+        value = json.dumps(header).encode("utf-8") + b"\n" + entry["body"]
+        self.store.put(self.NAMESPACE, key, value, ttl)
+
+    @classmethod
+    def make_entry(cls, model: BaseModel) -> Dict[str, Any]:
+        """序列化响应为缓存条目（不写入缓存）"""
+        body = model.model_dump_json().encode("utf-8")
+        now = time.time()
+        return {"body": body, "etag": cls.make_etag(body), "stored_at": now, "validated_at": now}
+
+    def put(self, key: Hashable, model: BaseModel, ttl: Optional[float] = None) -> Dict[str, Any]:
+        """序列化并缓存响应，返回缓存条目"""
+        entry = self.make_entry(model)
+        body = entry["body"]
+        self._lru.put(key, entry, len(body), ttl)
+        if self.store is not None:
+            self._save(key, entry, ttl if ttl is not None else self._lru.ttl)
+        return entry
+
+    def _set_latest(self, page_id: str, last_edited_time: Optional[str], validated_at: float) -> None:
+        """记录页面最近的版本，存储中同时保存验证时间，供其他 worker 判断新鲜度"""
+        self._latest_pages[page_id] = self.page_key(page_id, last_edited_time)
+        if self.store is not None:
+            value = json.dumps({"last_edited_time": last_edited_time, "validated_at": validated_at}).encode("utf-8")
+            self.store.put(self.LATEST_NAMESPACE, page_id, value, self.page_ttl)
+
+    def get_page(self, page_id: str, last_edited_time: Optional[str]) -> Optional[Dict[str, Any]]:
+        """读取指定版本的页面响应，命中即表示内容已验证为最新"""
+        entry = self.get(self.page_key(page_id, last_edited_time))
+        if entry is not None:
+            entry["validated_at"] = time.time()
+            self._set_latest(page_id, last_edited_time, entry["validated_at"])
+        return entry
+
+    def put_page(self, page_id: str, last_edited_time: Optional[str], model: BaseModel) -> Dict[str, Any]:
+        """缓存页面响应，并记录为该页面的最新版本；last_edited_time 未稳定时只返回条目而不缓存"""
+        if not is_settled(last_edited_time):
+            return self.make_entry(model)
+        entry = self.put(self.page_key(page_id, last_edited_time), model)
+        self._set_latest(page_id, last_edited_time, entry["validated_at"])
+        return entry
+
+    def latest_page(self, page_id: str) -> Optional[Dict[str, Any]]:
+        """不经验证，直接读取页面最近缓存的版本"""
+        key = self._latest_pages.get(page_id)
+        if key is None and self.store is not None:
+            item = self.store.get(self.LATEST_NAMESPACE, page_id)
+            if item is not None:
+                latest = json.loads(item[0])
+                key = self.page_key(page_id, latest["last_edited_time"])
+                entry = self.get(key)
+                if entry is not None:
+                    entry["validated_at"] = max(entry["validated_at"], latest["validated_at"])
+                    self._latest_pages[page_id] = key
+                return entry
+        if key is None:
+            return None
+        entry = self.get(key)
+        if entry is None:
+            del self._latest_pages[page_id]
+        return entry
+
+    def forget_page(self, page_id: str) -> None:
+        """页面已不存在时移除其缓存"""
+        key = self._latest_pages.pop(page_id, None)
+        if key is not None:
+            self._lru.pop(key)
+        if self.store is not None:
+            self.store.delete(self.LATEST_NAMESPACE, page_id)
+
+    def clear(self) -> None:
+        self._lru.clear()
+        self._latest_pages.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._lru.stats()
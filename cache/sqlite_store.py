@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Hashable, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class SQLiteStore:
+    """基于 SQLite（WAL 模式）的持久化键值存储，作为内存缓存之下的第二级缓存
+
+    多个 uvicorn worker 各自打开连接：WAL 模式下读写互不阻塞，重启或重新部署后缓存仍然保留。
+    写入、删除和清理在单独的写线程中按调用顺序执行，不阻塞事件循环，写锁竞争由 busy_timeout 等待；
+    请求路径上的读取只等待 read_timeout，等不到锁时按未命中处理。
+    写线程积压超过 max_pending 个操作时丢弃新的写入（只是缓存，丢弃不影响正确性）。
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = None, busy_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None, max_pending: Optional[int] = None):
+        self.path = path
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("CACHE_DB_MAX_ENTRIES", 200000))
+        busy_timeout = busy_timeout if busy_timeout is not None else float(os.getenv("CACHE_DB_BUSY_TIMEOUT", 5))
+        read_timeout = read_timeout if read_timeout is not None else float(os.getenv("CACHE_DB_READ_TIMEOUT", 0.05))
+        self.max_pending = max_pending if max_pending is not None else int(os.getenv("CACHE_DB_MAX_PENDING_WRITES", 10000))
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # 写连接只在写线程中使用，读连接在事件循环中使用
+        self._write_conn = self._connect(busy_timeout)
+        self._write_conn.execute("PRAGMA journal_mode = WAL")
+        # WAL 模式下 NORMAL 已能保证数据库一致性，只是断电时可能丢失最近的几次写入，对缓存足够
+        self._write_conn.execute("PRAGMA synchronous = NORMAL")
+        self._write_conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._write_conn.execute("CREATE INDEX IF NOT EXISTS entries_updated_at ON entries (updated_at)")
+        self._conn = self._connect(read_timeout)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-store-writer")
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+        self._writes_since_prune = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def _connect(self, timeout: float) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout = {int(timeout * 1000)}")
+        return conn
+
+    @staticmethod
+    def encode_key(key: Hashable) -> str:
+        """把缓存键（字符串或元组）编码为文本"""
+        if isinstance(key, str):
+            return key
+        return json.dumps(list(key) if isinstance(key, tuple) else key, ensure_ascii=False, separators=(",", ":"))
+
+    def _submit(self, operation, *args) -> None:
+        """把写操作交给写线程，积压过多时丢弃"""
+        with self._pending_lock:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending += 1
+        self._writer.submit(self._run, operation, *args)
+
+    def _run(self, operation, *args) -> None:
+        try:
+            operation(*args)
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Tuple[bytes, float]]:
+        """读取条目，返回 (值, 剩余有效秒数)，不存在、已过期或等不到锁时返回 None"""
+        try:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, self.encode_key(key))
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Cache store read failed: {e}")
+            return None
+
+        now = time.time()
+        if row is None or row[1] < now:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bytes(row[0]), row[1] - now
+
+    def put(self, namespace: str, key: Hashable, value: bytes, ttl: float) -> None:
+        """写入条目（覆盖同键的旧值），在写线程中执行"""
+        now = time.time()
+        self._submit(self._put, namespace, self.encode_key(key), value, now + ttl, now)
+
+    def _put(self, namespace: str, key: str, value: bytes, expires_at: float, updated_at: float) -> None:
+        try:
+            self._write_conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, value, expires_at, updated_at)
+            )
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Cache store write failed: {e}")
+            return
+
+        self.writes += 1
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= 1000:
+            self._prune()
+
+    def delete(self, namespace: str, key: Hashable) -> None:
+        """删除条目，在写线程中执行"""
+        self._submit(self._delete, namespace, self.encode_key(key))
+
+    def _delete(self, namespace: str, key: str) -> None:
+        try:
+            self._write_conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Cache store delete failed: {e}")
+
+    def prune(self) -> None:
+        """删除过期条目，超出条目上限时删除最久未更新的条目，在写线程中执行"""
+        self._submit(self._prune)
+
+    def _prune(self) -> None:
+        self._writes_since_prune = 0
+        try:
+            self._write_conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+            count = self._write_conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            if count > self.max_entries:
+                self._write_conn.execute(
+                    "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY updated_at LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Cache store prune failed: {e}")
+
+    def flush(self) -> None:
+        """等待已提交的写操作全部完成"""
+        self._writer.submit(lambda: None).result()
+
+    def close(self) -> None:
+        """等待写线程完成积压的写入后关闭连接"""
+        self._writer.shutdown(wait=True)
+        self._write_conn.close()
+        self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """存储统计"""
+        return {
+            "path": self.path,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "pending_writes": self._pending,
+            "dropped_writes": self.dropped,
+            "errors": self.errors
+        }
+
+
+def open_store_from_env() -> Optional[SQLiteStore]:
+    """根据 CACHE_DB_PATH 打开持久化存储，未配置时返回 None（只使用内存缓存）"""
+    path = os.getenv("CACHE_DB_PATH")
+    if not path:
+        return None
+    return SQLiteStore(path)
@@ -0,0 +1,198 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# MCP_TRANSPORT 的取值：http（直接请求 MCP 服务器）、record（请求并录制）、replay（只从录制文件回放）
+TRANSPORT_MODES = ("http", "record", "replay")
+
+# 录制时保留的响应头
+RECORDED_HEADERS = ("content-type", "retry-after")
+
+
+def cassette_key(tool: str, arguments: Dict[str, Any]) -> str:
+    """回放时按工具名和参数匹配录制的调用（参数按键排序，与顺序无关）"""
+    return tool + " " + json.dumps(arguments, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def parse_tool_call(request: httpx.Request) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """从请求体中取出 tools/call 的工具名和参数，其他请求（initialize、结束会话）返回 None"""
+    if request.method != "POST":
+        return None
+    try:
+        payload = json.loads(request.content)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict) or payload.get("method") != "tools/call":
+        return None
+    params = payload.get("params") or {}
+    return params.get("name", ""), params.get("arguments") or {}
+
+
+def open_cassette(path: str, mode: str):
+    """录制文件为 JSON Lines，文件名以 .gz 结尾时 gzip 压缩（追加写入产生的多段 gzip 也能正常读取）"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """边转发边保存响应体，读完后写入录制文件（不影响调用方的增量解析）"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_complete):
+        self._stream = stream
+        self._on_complete = on_complete
+        self._chunks: List[bytes] = []
+        self._complete = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self._chunks.append(chunk)
+            yield chunk
+        self._complete = True
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+        # 没有读完的响应（调用被取消）不录制
+        if self._complete:
+            self._on_complete(b"".join(self._chunks))
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """把请求转发给真实的 MCP 服务器，同时把每次 tools/call 的请求和响应追加到录制文件
+
+    每行一次调用：工具名、参数、状态码、响应头中的 Content-Type / Retry-After、
+    响应体原文和耗时（从发出请求到读完响应体）。initialize 和结束会话不录制。
+    """
+
+    def __init__(self, path: str, wrapped: Optional[httpx.AsyncBaseTransport] = None):
+        self.path = path
+        self.wrapped = wrapped or httpx.AsyncHTTPTransport()
+        self._file = open_cassette(path, "a")
+        self.recorded = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        tool_call = parse_tool_call(request)
+        if tool_call is None:
+            return await self.wrapped.handle_async_request(request)
+
+        tool, arguments = tool_call
+        start = time.perf_counter()
+        response = await self.wrapped.handle_async_request(request)
+
+        def record(body: bytes) -> None:
+            entry = {
+                "tool": tool,
+                "arguments": arguments,
+                "status": response.status_code,
+                "headers": {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers},
+                "latency": round(time.perf_counter() - start, 6),
+                "body": body.decode("utf-8", errors="replace")
+            }
+            self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self._file.flush()
+            self.recorded += 1
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, record),
+            extensions=response.extensions
+        )
+
+    async def aclose(self) -> None:
+        self._file.close()
+        await self.wrapped.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": "record", "cassette": self.path, "recorded": self.recorded}
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """只从录制文件回放，不访问网络
+
+    相同工具和参数的多次录制按录制顺序依次返回，用完后重复最后一次。
+    响应按录制的耗时乘以 speed 的倒数延迟返回（speed=2 为两倍速，0 表示不等待）。
+    没有录制的调用返回 HTTP 501（客户端按上游失败处理；不用 400 / 404，以免被当作会话过期）并计入 misses。
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self._entries: Dict[str, Deque[Dict[str, Any]]] = {}
+        with open_cassette(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(cassette_key(entry["tool"], entry["arguments"]), deque()).append(entry)
+        self.loaded = sum(len(entries) for entries in self._entries.values())
+        self.served = 0
+        self.misses = 0
+
+    def _next_entry(self, tool: str, arguments: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        entries = self._entries.get(cassette_key(tool, arguments))
+        if not entries:
+            return None
+        return entries.popleft() if len(entries) > 1 else entries[0]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        tool_call = parse_tool_call(request)
+        if tool_call is None:
+            # initialize 返回新的会话 ID，结束会话直接成功
+            headers = {"mcp-session-id": str(uuid.uuid4())} if request.method == "POST" else {}
+            return httpx.Response(200, headers=headers, json={"jsonrpc": "2.0", "id": 1, "result": {}}, request=request)
+
+        tool, arguments = tool_call
+        entry = self._next_entry(tool, arguments)
+        if entry is None:
+            self.misses += 1
+            print(f"Cassette miss: {tool} {json.dumps(arguments, sort_keys=True)}")
+            return httpx.Response(501, text=f"No recorded response for {tool}", request=request)
+
+        if self.speed > 0 and entry["latency"] > 0:
+            await asyncio.sleep(entry["latency"] / self.speed)
+        self.served += 1
+        return httpx.Response(entry["status"], headers=entry["headers"], content=entry["body"].encode("utf-8"),
+                              request=request)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "replay",
+            "cassette": self.path,
+            "speed": self.speed,
+            "loaded": self.loaded,
+            "served": self.served,
+            "misses": self.misses
+        }
+
+
+def transport_from_env(**http_options) -> Optional[httpx.AsyncBaseTransport]:
+    """按 MCP_TRANSPORT / MCP_CASSETTE / MCP_REPLAY_SPEED 创建传输层，http 模式返回 None（使用 httpx 默认传输）
+
+    http_options 传给录制模式下实际发出请求的 httpx.AsyncHTTPTransport（连接池上限等）。
+    """
+    mode = os.getenv("MCP_TRANSPORT", "http").lower()
+    if mode not in TRANSPORT_MODES:
+        raise ValueError(f"Invalid MCP_TRANSPORT: {mode} (expected one of {', '.join(TRANSPORT_MODES)})")
+    if mode == "http":
+        return None
+
+    path = os.getenv("MCP_CASSETTE")
+    if not path:
+        raise ValueError(f"MCP_CASSETTE is required when MCP_TRANSPORT={mode}")
+    if mode == "record":
+        print(f"Recording MCP tool calls to {path}")
+        return RecordingTransport(path, httpx.AsyncHTTPTransport(**http_options))
+
+    transport = ReplayTransport(path, speed=float(os.getenv("MCP_REPLAY_SPEED", 1.0)))
+    print(f"Replaying {transport.loaded} MCP tool calls from {path}")
+    return transport
@@ -0,0 +1,45 @@
+import os
+import time
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class DeadlineExceededError(Exception):
+    """请求的截止时间已到，不再继续请求上游"""
+
+
+class Deadline:
+    """单个请求的截止时间（单调时钟）
+
+    随借出的 MCP 会话沿调用链传递：每次上游调用前检查剩余时间，
+    httpx 超时取剩余时间和 MCP_TIMEOUT 中较小的一个，到期后已排队和进行中的调用都会被取消。
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_env(cls, timeout: Optional[float] = None) -> Optional["Deadline"]:
+        """服务端默认 REQUEST_TIMEOUT（秒，0 表示不限制），客户端指定的更短时间优先"""
+        default = float(os.getenv("REQUEST_TIMEOUT", 60))
+        candidates = [value for value in (default, timeout) if value is not None and value > 0]
+        if not candidates:
+            return None
+        return cls(min(candidates))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self, what: str = "request") -> float:
+        """截止时间已到时抛出 DeadlineExceededError，否则返回剩余秒数"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"Deadline of {self.timeout:g}s exceeded before {what}")
+        return remaining
@@ -1,29 +1,112 @@
 import httpx
-import json
+import asyncio
+import random
+import time
 import uuid
-from typing import Dict, Any, Optional
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple
 import os
 from dotenv import load_dotenv
 
+from client.sse import read_tool_result
+from client.single_flight import SingleFlight, COALESCIBLE_TOOLS
+from client.scheduler import UpstreamScheduler, UpstreamRateLimitError, DEFAULT_PRIORITY
+from client.deadline import Deadline, DeadlineExceededError
+from metrics.registry import MCP_CALLS, MCP_CALL_DURATION
+from metrics.trace import current_trace, current_span
+
 load_dotenv()
 
 
+# 会话失效时 MCP 服务器返回的状态码（会话过期或服务器重启）
+SESSION_EXPIRED_STATUS_CODES = (400, 404)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头（秒数或 HTTP 日期）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def call_outcome(error: BaseException) -> str:
+    """上游调用异常对应的指标 outcome 标签"""
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    return "error"
+
+
 class MCPClient:
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, single_flight: Optional[SingleFlight] = None,
+                 scheduler: Optional[UpstreamScheduler] = None):
         self.server_url = os.getenv("MCP_SERVER_URL", "http://localhost:3000/mcp")
         self.auth_token = os.getenv("MCP_AUTH_TOKEN")
         self.session_id = None
-        self.client = httpx.AsyncClient(timeout=30.0)
+        # 传入共享的 httpx 客户端时复用其连接池，由会话池负责关闭
+        self._owns_client = client is None
+        # 单次上游调用的最长时间（秒），请求有截止时间时取两者中较小的一个
+        self.timeout = float(os.getenv("MCP_TIMEOUT", 30))
+        self.client = client or httpx.AsyncClient(timeout=self.timeout)
+        # 进程内共享的调用合并器，相同的并发只读调用只请求一次上游
+        self.single_flight = single_flight
+        # 进程内共享的出站调度器（令牌桶限速）
+        self.scheduler = scheduler
+        # 当前请求的优先级类别（interactive / normal / bulk）
+        self.priority = DEFAULT_PRIORITY
+        # 当前请求的截止时间，None 表示不限制
+        self.deadline: Optional[Deadline] = None
+        self.max_retries = int(os.getenv("MCP_RATE_LIMIT_MAX_RETRIES", 5))
+        self.backoff_base = float(os.getenv("MCP_RATE_LIMIT_BACKOFF", 1.0))
+        self.max_backoff = float(os.getenv("MCP_RATE_LIMIT_MAX_BACKOFF", 30.0))
         
     async def __aenter__(self):
         await self.initialize()
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.client.aclose()
+        if self._owns_client:
+            await self.client.aclose()
+    
+    async def terminate(self) -> None:
+        """结束 MCP 会话（尽力而为，失败时忽略）"""
+        if not self.session_id:
+            return
+        try:
+            await self.client.delete(
+                self.server_url,
+                headers={
+                    "Authorization": f"Bearer {self.auth_token}",
+                    "mcp-session-id": self.session_id
+                }
+            )
+        except Exception:
+            pass
+        finally:
+            self.session_id = None
     
     async def initialize(self) -> bool:
         """初始化 MCP 会话"""
+        trace = current_trace()
+        if trace is None:
+            return await self._initialize()
+        with trace.span("initialize", {}) as span:
+            success = await self._initialize()
+            if span is not None and not success:
+                span["outcome"] = "failed"
+            return success
+    
+    async def _initialize(self) -> bool:
         try:
             headers = {
                 "Authorization": f"Bearer {self.auth_token}",
@@ -42,11 +125,24 @@ class MCPClient:
                 }
             }
             
-            response = await self.client.post(
-                self.server_url,
-                headers=headers,
-                json=payload
-            )
+            timeout = self._request_timeout(self.deadline)
+            start = time.perf_counter()
+            try:
+                response = await self.client.post(
+                    self.server_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=timeout
+                )
+            except BaseException as e:
+                MCP_CALLS.inc("initialize", call_outcome(e))
+                raise
+            # initialize 握手与工具调用一起统计
+            MCP_CALLS.inc("initialize", "ok" if response.status_code == 200 else "http_error")
+            MCP_CALL_DURATION.observe(time.perf_counter() - start, "initialize")
+            span = current_span()
+            if span is not None:
+                span.update(coalesced=False, attempts=1, status=response.status_code, bytes=response.num_bytes_downloaded)
             
             if response.status_code == 200:
                 # 从响应头中提取 session ID
@@ -64,12 +160,70 @@ class MCPClient:
                 print(f"Initialize failed: {response.status_code} - {response.text}")
                 return False
                 
+        except DeadlineExceededError:
+            raise
         except Exception as e:
             print(f"Initialize error: {e}")
             return False
     
+    def _request_timeout(self, deadline: Optional[Deadline]) -> float:
+        """本次 HTTP 请求的超时：MCP_TIMEOUT 与请求剩余时间中较小的一个"""
+        if deadline is None:
+            return self.timeout
+        return min(self.timeout, deadline.check("upstream request"))
+    
     async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """调用 MCP 工具"""
+        """调用 MCP 工具，请求开启了调试追踪时记录该调用"""
+        trace = current_trace()
+        if trace is None:
+            return await self._call_with_deadline(name, arguments)
+        with trace.span(name, arguments) as span:
+            result = await self._call_with_deadline(name, arguments)
+            trace.record_result(span, result)
+            return result
+    
+    async def _call_with_deadline(self, name: str, arguments: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """请求有截止时间时到期即取消调用（包括在调度器中排队的时间）"""
+        # 发起调用时的截止时间（合并的调用可能在会话归还后仍在进行）
+        deadline = self.deadline
+        if deadline is None:
+            return await self._coalesced_call(name, arguments, None)
+        remaining = deadline.check(name)
+        try:
+            return await asyncio.wait_for(self._coalesced_call(name, arguments, deadline), remaining)
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError(f"Deadline of {deadline.timeout:g}s exceeded during {name}")
+    
+    async def _coalesced_call(self, name: str, arguments: Dict[str, Any],
+                              deadline: Optional[Deadline]) -> Optional[Dict[str, Any]]:
+        """只读工具通过 single-flight 合并相同的并发调用"""
+        if self.single_flight is None or name not in COALESCIBLE_TOOLS:
+            return await self._call_tool(name, arguments, deadline)
+        key = SingleFlight.make_key(name, arguments)
+        try:
+            return await self.single_flight.do(key, lambda: self._call_tool(name, arguments, deadline))
+        except DeadlineExceededError:
+            # 合并的调用受发起它的请求的截止时间约束，本请求仍有剩余时间时自己重新发起
+            if deadline is not None and deadline.expired:
+                raise
+            return await self._call_tool(name, arguments, deadline)
+    
+    async def _acquire(self, name: str, deadline: Optional[Deadline]) -> None:
+        """发送前向调度器取得令牌，并记录到当前调用的 span"""
+        if deadline is not None:
+            # 截止时间已到的请求不再消耗令牌
+            deadline.check(name)
+        waited = await self.scheduler.acquire(self.priority) if self.scheduler is not None else 0.0
+        span = current_span()
+        if span is not None:
+            # 实际发送（合并到其他调用的记录保持 coalesced）
+            span["coalesced"] = False
+            span["attempts"] += 1
+            span["queue_ms"] += round(waited * 1000, 3)
+    
+    async def _call_tool(self, name: str, arguments: Dict[str, Any],
+                         deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """实际发起一次 MCP 工具调用"""
         if not self.session_id:
             success = await self.initialize()
             if not success:
@@ -77,74 +231,108 @@ class MCPClient:
                 return None
         
         try:
-            headers = {
-                "Authorization": f"Bearer {self.auth_token}",
-                "Content-Type": "application/json",
-                "Accept": "application/json, text/event-stream",
-                "mcp-session-id": self.session_id
-            }
-            
-            payload = {
-                "jsonrpc": "2.0",
-                "id": str(uuid.uuid4()),
-                "method": "tools/call",
-                "params": {
-                    "name": name,
-                    "arguments": arguments
-                }
-            }
-            
-            response = await self.client.post(
-                self.server_url,
-                headers=headers,
-                json=payload
-            )
-            
-            if response.status_code == 200:
-                # 解析响应
-                response_text = response.text
-                # print(f"Response text: {response_text[:500]}...")  # 调试用
+            delay = None
+            for attempt in range(self.max_retries + 1):
+                await self._acquire(name, deadline)
+                status_code, result, retry_after = await self._send_tool_call(name, arguments, deadline)
                 
-                # 查找 JSON 结果
-                lines = response_text.split('\n')
-                for line in lines:
-                    if line.startswith('data: '):
-                        try:
-                            data = json.loads(line[6:])  # 去掉 'data: ' 前缀
-                            if 'result' in data and 'content' in data['result']:
-                                content = data['result']['content']
-                                if content and len(content) > 0:
-                                    # 提取 <json-result> 部分
-                                    json_text = content[0].get('text', '')
-                                    if '<json-result>' in json_text:
-                                        json_start = json_text.find('<json-result>') + len('<json-result>')
-                                        json_end = json_text.find('</json-result>')
-                                        if json_end > json_start:
-                                            json_content = json_text[json_start:json_end]
-                                            return json.loads(json_content)
-                                    else:
-                                        # 如果没有 <json-result> 标签，尝试直接解析
-                                        return json.loads(json_text)
-                        except json.JSONDecodeError as e:
-                            print(f"JSON decode error: {e}")
-                            continue
+                if status_code in SESSION_EXPIRED_STATUS_CODES:
+                    # 会话已过期，重新初始化后重试一次
+                    print(f"MCP session {self.session_id} expired, re-initializing")
+                    self.session_id = None
+                    if not await self.initialize():
+                        print("Failed to re-initialize MCP session")
+                        return None
+                    # 重发同样是一次上游调用，需要重新取得令牌
+                    await self._acquire(name, deadline)
+                    status_code, result, retry_after = await self._send_tool_call(name, arguments, deadline)
                 
-                # 如果没有找到 data: 行，尝试直接解析整个响应
-                try:
-                    return json.loads(response_text)
-                except json.JSONDecodeError:
-                    pass
-                
-                print(f"No valid JSON result found in response: {response_text}")
-                return None
-            else:
-                print(f"Tool call failed: {response.status_code} - {response.text}")
-                return None
+                if not self._is_rate_limited(status_code, result):
+                    return result
                 
+                # 被上游限流：遵守 Retry-After，并加入随机抖动的指数退避
+                delay = self._backoff_delay(attempt, retry_after)
+                print(f"Rate limited on {name}, retrying in {delay:.2f}s (attempt {attempt + 1})")
+                if self.scheduler is not None:
+                    self.scheduler.on_rate_limited(delay)
+                elif deadline is not None and delay >= deadline.remaining():
+                    raise DeadlineExceededError(f"Deadline of {deadline.timeout:g}s exceeded while backing off on {name}")
+                else:
+                    await asyncio.sleep(delay)
+            
+            # 不返回 None，避免调用方把限流误当成内容结束而渲染出不完整的页面
+            raise UpstreamRateLimitError(f"Upstream rate limit exceeded for {name}", retry_after=delay)
+        
+        except (UpstreamRateLimitError, DeadlineExceededError):
+            raise
+        except httpx.TimeoutException as e:
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceededError(f"Deadline of {deadline.timeout:g}s exceeded during {name}") from e
+            print(f"Tool call timed out: {e}")
+            return None
         except Exception as e:
             print(f"Tool call error: {e}")
             return None
     
+    @staticmethod
+    def _is_rate_limited(status_code: int, result: Optional[Any]) -> bool:
+        """HTTP 429，或 MCP 服务器把 Notion 的 429 错误包装在工具结果中"""
+        if status_code == 429:
+            return True
+        return isinstance(result, dict) and (result.get("status") == 429 or result.get("code") == "rate_limited")
+    
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        """计算重试等待时间"""
+        base = retry_after if retry_after is not None else min(self.max_backoff, self.backoff_base * (2 ** attempt))
+        return base + random.uniform(0, base * 0.5)
+    
+    async def _send_tool_call(self, name: str, arguments: Dict[str, Any],
+                              deadline: Optional[Deadline] = None) -> Tuple[int, Optional[Any], Optional[float]]:
+        """发送 tools/call 请求，并增量解析响应，返回 (状态码, 结果, Retry-After 秒数)"""
+        headers = {
+            "Authorization": f"Bearer {self.auth_token}",
+            "Content-Type": "application/json",
+            "Accept": "application/json, text/event-stream",
+            "mcp-session-id": self.session_id
+        }
+        
+        payload = {
+            "jsonrpc": "2.0",
+            "id": str(uuid.uuid4()),
+            "method": "tools/call",
+            "params": {
+                "name": name,
+                "arguments": arguments
+            }
+        }
+        
+        timeout = self._request_timeout(deadline)
+        start = time.perf_counter()
+        outcome = "error"
+        response = None
+        try:
+            async with self.client.stream("POST", self.server_url, headers=headers, json=payload,
+                                          timeout=timeout) as response:
+                if response.status_code != 200:
+                    outcome = "rate_limited" if response.status_code == 429 else "http_error"
+                    await response.aread()
+                    print(f"Tool call failed: {response.status_code} - {response.text}")
+                    return response.status_code, None, parse_retry_after(response.headers.get("retry-after"))
+                
+                result = await read_tool_result(response)
+                outcome = "rate_limited" if self._is_rate_limited(response.status_code, result) else "ok"
+                return response.status_code, result, None
+        except BaseException as e:
+            outcome = call_outcome(e)
+            raise
+        finally:
+            MCP_CALLS.inc(name, outcome)
+            MCP_CALL_DURATION.observe(time.perf_counter() - start, name)
+            span = current_span()
+            if span is not None and response is not None:
+                span["status"] = response.status_code
+                span["bytes"] += response.num_bytes_downloaded
+    
     async def get_page(self, page_id: str) -> Optional[Dict[str, Any]]:
         """获取页面信息"""
         return await self.call_tool("API-retrieve-a-page", {"page_id": page_id})
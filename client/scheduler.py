@@ -0,0 +1,232 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Any, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class UpstreamRateLimitError(Exception):
+    """上游持续返回 429，重试次数用尽"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶：按固定速率补充令牌，允许一定突发"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        # 收到 429 后暂停发放令牌直到该时间
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self, keep: float = 0) -> float:
+        """尝试取一个令牌（取后桶内至少保留 keep 个），成功返回 0，否则返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        self._refill(now)
+        needed = 1 + min(keep, max(0.0, self.burst - 1))
+        if self.tokens >= needed:
+            self.tokens -= 1
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """暂停发放令牌（用于遵守 Retry-After），暂停结束后从空桶开始补充"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+
+# 优先级类别：interactive 为用户正在等待的小请求，bulk 为整库分页、批量抓取等大任务
+PRIORITY_CLASSES = ("interactive", "normal", "bulk")
+DEFAULT_PRIORITY = "normal"
+
+
+def parse_priority_weights(value: str) -> Dict[str, float]:
+    """解析形如 "interactive=6,normal=3,bulk=1" 的权重配置"""
+    weights = {"interactive": 6.0, "normal": 3.0, "bulk": 1.0}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name in weights and weight.strip():
+            weights[name] = max(0.01, float(weight))
+    return weights
+
+
+class UpstreamScheduler:
+    """出站 MCP 调用调度器：令牌桶限速 + 按优先级类别的加权公平排队
+
+    各类别按权重分享上游配额（加权公平队列），低优先级可以使用空闲配额；
+    当 interactive 的排队等待 p99 超过目标值时，低优先级只能在 interactive 没有排队
+    且令牌桶保留足够余量时才能发出调用。p99 只统计最近 interactive_wait_window 秒内的等待
+    （包括仍在排队的 interactive 请求），每次放行前重新计算，积压消失后保护模式自动解除。
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None,
+                 weights: Optional[Dict[str, float]] = None, interactive_p99_target: Optional[float] = None):
+        # Notion 对每个 integration 的限制约为平均 3 次/秒
+        rate = rate if rate is not None else float(os.getenv("MCP_RATE_LIMIT", 3))
+        burst = burst if burst is not None else float(os.getenv("MCP_RATE_BURST", 5))
+        self.bucket = TokenBucket(rate, burst)
+        self.weights = weights or parse_priority_weights(os.getenv("MCP_PRIORITY_WEIGHTS", ""))
+        # interactive 排队等待 p99 目标（秒）
+        self.interactive_p99_target = (
+            interactive_p99_target if interactive_p99_target is not None
+            else float(os.getenv("MCP_INTERACTIVE_P99_TARGET_MS", 500)) / 1000
+        )
+        # 保护模式下为 interactive 保留的令牌数
+        self.interactive_reserve = float(os.getenv("MCP_INTERACTIVE_RESERVE", 2))
+        # 计算 p99 时使用的等待样本的时间窗口（秒）
+        self.interactive_wait_window = float(os.getenv("MCP_INTERACTIVE_WAIT_WINDOW", 30))
+
+        # 每个类别一个 FIFO 队列，元素为 (虚拟完成时间, future, 入队时间)
+        self._queues: Dict[str, Deque[Tuple[float, "asyncio.Future[None]", float]]] = {
+            name: deque() for name in PRIORITY_CLASSES
+        }
+        self._last_tag = {name: 0.0 for name in PRIORITY_CLASSES}
+        self._virtual_time = 0.0
+        self._dispatcher: Optional["asyncio.Task[None]"] = None
+        # 最近的 interactive 等待 (放行时间, 等待秒数)，用于估算 p99
+        self._interactive_waits: Deque[Tuple[float, float]] = deque(maxlen=200)
+        self.protecting = False
+
+        self.max_queue_depth = 0
+        self.acquired = {name: 0 for name in PRIORITY_CLASSES}
+        self.total_wait = {name: 0.0 for name in PRIORITY_CLASSES}
+        self.max_wait = {name: 0.0 for name in PRIORITY_CLASSES}
+        self.rate_limited = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def acquire(self, priority: str = DEFAULT_PRIORITY) -> float:
+        """等待直到可以发起一次上游调用，返回排队等待的秒数"""
+        if priority not in self._queues:
+            priority = DEFAULT_PRIORITY
+
+        start = time.monotonic()
+        # 加权公平队列：权重越大，虚拟完成时间增长越慢，越早被调度
+        tag = max(self._virtual_time, self._last_tag[priority]) + 1 / self.weights[priority]
+        self._last_tag[priority] = tag
+        future = asyncio.get_running_loop().create_future()
+        entry = (tag, future, start)
+        self._queues[priority].append(entry)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 等待者被取消（客户端断开、截止时间已到）：立即移出队列，不再计入排队深度
+            try:
+                self._queues[priority].remove(entry)
+            except ValueError:
+                pass
+            raise
+
+        now = time.monotonic()
+        waited = now - start
+        self.acquired[priority] += 1
+        self.total_wait[priority] += waited
+        self.max_wait[priority] = max(self.max_wait[priority], waited)
+        if priority == "interactive":
+            self._interactive_waits.append((now, waited))
+            self._update_protection(now)
+        return waited
+
+    def _interactive_p99(self, now: Optional[float] = None) -> float:
+        """最近 interactive_wait_window 秒内 interactive 等待时间的 p99，排在最前的 interactive 请求的已等待时间也计入"""
+        now = now if now is not None else time.monotonic()
+        waits = self._interactive_waits
+        while waits and now - waits[0][0] > self.interactive_wait_window:
+            waits.popleft()
+        samples = [waited for _, waited in waits]
+        queue = self._queues["interactive"]
+        if queue:
+            samples.append(now - queue[0][2])
+        if not samples:
+            return 0.0
+        samples.sort()
+        return samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+    def _update_protection(self, now: Optional[float] = None) -> None:
+        self.protecting = self._interactive_p99(now) > self.interactive_p99_target
+
+    def _select(self) -> Optional[str]:
+        """选出下一个要放行的类别"""
+        if self.protecting and self._queues["interactive"]:
+            return "interactive"
+
+        candidates = [name for name, queue in self._queues.items() if queue]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda name: self._queues[name][0][0])
+
+    async def _dispatch(self) -> None:
+        """按加权公平顺序放行等待者，每次放行消耗一个令牌"""
+        while True:
+            self._update_protection()
+            priority = self._select()
+            if priority is None:
+                return
+
+            keep = self.interactive_reserve if self.protecting and priority != "interactive" else 0
+            delay = self.bucket.reserve(keep)
+            if delay > 0:
+                # 等待期间可能有更高优先级的请求到达，醒来后重新选择
+                await asyncio.sleep(delay)
+                continue
+
+            tag, future, _ = self._queues[priority].popleft()
+            self._virtual_time = tag
+            if not future.done():
+                future.set_result(None)
+
+    def on_rate_limited(self, delay: float) -> None:
+        """上游返回 429：在 delay 秒内暂停所有出站调用"""
+        self.rate_limited += 1
+        self.bucket.pause(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """调度统计（各优先级的排队深度和等待时间）"""
+        self._update_protection()
+        return {
+            "rate": self.bucket.rate,
+            "burst": self.bucket.burst,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "rate_limited": self.rate_limited,
+            "protecting_interactive": self.protecting,
+            "interactive_p99_ms": round(self._interactive_p99() * 1000, 2),
+            "classes": {
+                name: {
+                    "weight": self.weights[name],
+                    "queue_depth": len(self._queues[name]),
+                    "acquired": self.acquired[name],
+                    "avg_wait_ms": round(self.total_wait[name] / self.acquired[name] * 1000, 2) if self.acquired[name] else 0.0,
+                    "max_wait_ms": round(self.max_wait[name] * 1000, 2)
+                }
+                for name in PRIORITY_CLASSES
+            }
+        }
@@ -0,0 +1,146 @@
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+from client.mcp_client import MCPClient
+from client.single_flight import SingleFlight
+from client.scheduler import UpstreamScheduler, DEFAULT_PRIORITY
+from client.deadline import Deadline
+from client.cassette import transport_from_env
+
+load_dotenv()
+
+
+class MCPSessionPool:
+    """MCP 会话池：在同一个 keep-alive 连接池上复用已初始化的 MCP 会话"""
+
+    def __init__(
+        self,
+        pool_size: Optional[int] = None,
+        max_idle: Optional[float] = None,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None
+    ):
+        # 最多保留的空闲会话数
+        self.pool_size = pool_size if pool_size is not None else int(os.getenv("MCP_POOL_SIZE", 10))
+        # 会话空闲超过该秒数后丢弃并重新初始化
+        self.max_idle = max_idle if max_idle is not None else float(os.getenv("MCP_POOL_MAX_IDLE", 300))
+        self.max_connections = max_connections if max_connections is not None else int(os.getenv("MCP_POOL_MAX_CONNECTIONS", 20))
+        self.max_keepalive_connections = (
+            max_keepalive_connections if max_keepalive_connections is not None
+            else int(os.getenv("MCP_POOL_MAX_KEEPALIVE", 10))
+        )
+
+        self.client: Optional[httpx.AsyncClient] = None
+        # 录制 / 回放传输层，直接请求 MCP 服务器时为 None
+        self.transport: Optional[httpx.AsyncBaseTransport] = None
+        # 所有会话共享的调用合并器
+        self.single_flight = SingleFlight()
+        # 所有会话共享的出站调度器，保证整个进程不超过上游速率限制
+        self.scheduler = UpstreamScheduler()
+        # 空闲会话，按 mcp-session-id 索引，值为 (客户端, 归还时间)
+        self._idle: "OrderedDict[str, Tuple[MCPClient, float]]" = OrderedDict()
+        self._in_use = 0
+        self._created = 0
+        self._reused = 0
+
+    async def start(self) -> None:
+        """创建共享的 httpx 连接池"""
+        if self.client is not None:
+            return
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.max_idle
+        )
+        # MCP_TRANSPORT=record / replay 时在连接池下面接入录制或回放传输层
+        self.transport = transport_from_env(limits=limits)
+        self.client = httpx.AsyncClient(
+            timeout=float(os.getenv("MCP_TIMEOUT", 30)),
+            limits=limits,
+            transport=self.transport
+        )
+
+    async def close(self) -> None:
+        """结束所有空闲会话并关闭连接池"""
+        while self._idle:
+            _, (mcp_client, _) = self._idle.popitem()
+            await mcp_client.terminate()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            self.transport = None
+
+    async def _checkout(self) -> MCPClient:
+        """取出一个可用会话，没有则新建"""
+        await self.start()
+
+        now = time.monotonic()
+        while self._idle:
+            # 优先使用最近归还的会话，让较旧的会话自然过期
+            _, (mcp_client, released_at) = self._idle.popitem(last=True)
+            if now - released_at <= self.max_idle:
+                self._reused += 1
+                return mcp_client
+            await mcp_client.terminate()
+
+        mcp_client = MCPClient(client=self.client, single_flight=self.single_flight, scheduler=self.scheduler)
+        await mcp_client.initialize()
+        self._created += 1
+        return mcp_client
+
+    async def _release(self, mcp_client: MCPClient) -> None:
+        """归还会话，超出池容量或会话无效时直接丢弃"""
+        if not mcp_client.session_id:
+            return
+        if len(self._idle) >= self.pool_size:
+            await mcp_client.terminate()
+            return
+        self._idle[mcp_client.session_id] = (mcp_client, time.monotonic())
+
+    @asynccontextmanager
+    async def acquire(self, priority: str = DEFAULT_PRIORITY,
+                      deadline: Optional[Deadline] = None) -> AsyncIterator[MCPClient]:
+        """在请求期间借用一个已初始化的 MCP 会话
+
+        priority 决定其上游调用的调度类别，deadline 为请求的截止时间，到期后该会话的上游调用被取消。
+        """
+        mcp_client = await self._checkout()
+        mcp_client.priority = priority
+        mcp_client.deadline = deadline
+        self._in_use += 1
+        try:
+            yield mcp_client
+        finally:
+            self._in_use -= 1
+            mcp_client.deadline = None
+            await self._release(mcp_client)
+
+    def connection_stats(self) -> Dict[str, int]:
+        """共享 httpx 连接池中打开的和空闲的连接数"""
+        # httpx 没有公开连接池状态，读取底层 httpcore 连接池（取不到时视为没有连接）
+        transport = getattr(self.client, "_transport", None)
+        # 录制模式下连接池在被包装的传输层里
+        pool = getattr(getattr(transport, "wrapped", transport), "_pool", None)
+        connections = list(getattr(pool, "connections", ()))
+        return {
+            "open": len(connections),
+            "idle": sum(1 for connection in connections if connection.is_idle())
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """会话池状态"""
+        return {
+            "pool_size": self.pool_size,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "created": self._created,
+            "reused": self._reused,
+            "connections": self.connection_stats(),
+            "transport": self.transport.stats() if self.transport is not None else {"mode": "http"}
+        }
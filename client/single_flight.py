@@ -0,0 +1,77 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List
+
+
+# 只读工具，相同参数的并发调用可以安全地共享结果
+COALESCIBLE_TOOLS = {
+    "API-retrieve-a-page",
+    "API-get-block-children",
+    "API-retrieve-a-database",
+    "API-post-database-query",
+    "API-post-search"
+}
+
+
+class SingleFlight:
+    """合并进行中的相同调用：同一 key 的调用未完成时，后来者等待并共享同一个结果
+
+    每个进行中的调用记录等待者数量，所有等待者都已取消（例如客户端断开或截止时间已到）时
+    取消该调用本身，不再为没有人读取的结果占用上游配额。
+    """
+
+    def __init__(self):
+        # key -> [共享的 future, 等待者数量]
+        self._inflight: Dict[str, List[Any]] = {}
+        self.calls = 0
+        self.deduplicated = 0
+        self.cancelled = 0
+
+    @staticmethod
+    def make_key(name: str, arguments: Dict[str, Any]) -> str:
+        """工具名 + 规范化（键排序）后的参数"""
+        return name + ":" + json.dumps(arguments, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行调用，已有相同调用进行中时直接等待其结果"""
+        self.calls += 1
+
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.deduplicated += 1
+        else:
+            future = asyncio.ensure_future(fn())
+            flight = self._inflight[key] = [future, 0]
+            future.add_done_callback(lambda done: self._on_done(key, done))
+
+        future = flight[0]
+        flight[1] += 1
+        try:
+            # shield: 某个调用方被取消不影响其他等待同一结果的调用方
+            return await asyncio.shield(future)
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not future.done():
+                # 最后一个等待者也已离开，取消上游调用；先移除 key，
+                # 任务真正结束前到达的新调用方会发起新的调用，而不是加入已取消的调用
+                self.cancelled += 1
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+                future.cancel()
+
+    def _on_done(self, key: str, future: "asyncio.Future[Any]") -> None:
+        flight = self._inflight.get(key)
+        if flight is not None and flight[0] is future:
+            del self._inflight[key]
+        # 所有调用方都已取消时，避免出现 "exception was never retrieved" 警告
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计"""
+        return {
+            "calls": self.calls,
+            "deduplicated": self.deduplicated,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._inflight)
+        }
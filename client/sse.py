@@ -0,0 +1,100 @@
+import json
+import re
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+JSON_RESULT_TAG = "<json-result>"
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"\s*")
+
+# 表示某条消息中没有工具结果（区别于结果本身为 None）
+NO_RESULT = object()
+
+
+def extract_tool_result(message: Dict[str, Any]) -> Any:
+    """从 JSON-RPC 消息中取出工具结果，没有结果时返回 NO_RESULT"""
+    result = message.get("result")
+    if not isinstance(result, dict) or "content" not in result:
+        return NO_RESULT
+
+    content = result["content"]
+    if not content:
+        return NO_RESULT
+
+    json_text = content[0].get("text", "")
+    start = json_text.find(JSON_RESULT_TAG)
+    if start < 0:
+        # 如果没有 <json-result> 标签，尝试直接解析
+        return json.loads(json_text)
+
+    # 直接从标签之后开始解码，避免切片产生额外的字符串拷贝
+    index = _whitespace.match(json_text, start + len(JSON_RESULT_TAG)).end()
+    value, _ = _decoder.raw_decode(json_text, index)
+    return value
+
+
+def _parse_event(data: str) -> Any:
+    """解析一个 SSE 事件的 data 字段"""
+    try:
+        return extract_tool_result(json.loads(data))
+    except (json.JSONDecodeError, AttributeError, IndexError) as e:
+        print(f"JSON decode error: {e}")
+        return NO_RESULT
+
+
+async def parse_sse_lines(lines: AsyncIterator[str]) -> Any:
+    """增量解析 SSE 流，遇到第一个完整的 JSON-RPC 结果即返回"""
+    data_lines = []
+
+    async for line in lines:
+        if line.startswith("data:"):
+            # 按 SSE 规范去掉冒号后的一个空格
+            data_lines.append(line[6:] if line.startswith("data: ") else line[5:])
+        elif not line and data_lines:
+            # 空行表示事件结束
+            result = _parse_event("\n".join(data_lines))
+            data_lines = []
+            if result is not NO_RESULT:
+                return result
+
+    if data_lines:
+        return _parse_event("\n".join(data_lines))
+    return NO_RESULT
+
+
+async def _iter_lines(text: str) -> AsyncIterator[str]:
+    for line in text.splitlines():
+        yield line
+
+
+async def read_tool_result(response: httpx.Response) -> Optional[Any]:
+    """从流式响应中读取工具结果，支持 SSE 和普通 JSON 两种格式"""
+    content_type = response.headers.get("content-type", "")
+
+    if "text/event-stream" in content_type:
+        lines = response.aiter_lines()
+        result = await parse_sse_lines(lines)
+        # 读完剩余数据（不再解析），让连接可以回到 keep-alive 连接池
+        async for _ in lines:
+            pass
+    else:
+        body = await response.aread()
+        try:
+            message = json.loads(body)
+        except json.JSONDecodeError:
+            message = None
+        if isinstance(message, dict):
+            result = extract_tool_result(message)
+            if result is NO_RESULT:
+                # 不是标准的工具结果，直接返回整个响应
+                result = message
+        else:
+            # 未声明 content-type 的 SSE 响应
+            result = await parse_sse_lines(_iter_lines(body.decode("utf-8", errors="replace")))
+
+    if result is NO_RESULT:
+        print("No valid JSON result found in response")
+        return None
+    return result
@@ -0,0 +1,89 @@
+import time
+from urllib.parse import parse_qs
+
+from metrics.registry import HTTP_REQUEST_DURATION
+from metrics.trace import RequestTrace, trace_store
+
+# 开启调试追踪的请求头 / 查询参数取值
+TRACE_FLAG_VALUES = ("1", "true", "yes")
+
+
+class MetricsMiddleware:
+    """记录每个 HTTP 请求的延迟（纯 ASGI 中间件，不包装响应体，流式响应和断开检测不受影响）
+
+    route 标签使用路由模板（如 /api/page/{page_id}），不会因页面 ID 产生大量时间序列；
+    没有匹配到路由的请求记为 unmatched。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # 路由匹配后 FastAPI 把匹配到的路由写入 scope
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                getattr(route, "path", "unmatched"), scope["method"], str(status)
+            )
+
+
+def trace_requested(scope) -> bool:
+    """请求头 X-Debug-Trace 或查询参数 trace 为 1 / true 时开启调试追踪"""
+    for name, value in scope["headers"]:
+        if name == b"x-debug-trace":
+            return value.decode("latin-1").strip().lower() in TRACE_FLAG_VALUES
+    if b"trace" in scope["query_string"]:
+        values = parse_qs(scope["query_string"].decode("latin-1")).get("trace", [])
+        return bool(values) and values[-1].lower() in TRACE_FLAG_VALUES
+    return False
+
+
+class TraceMiddleware:
+    """按需记录请求期间的全部上游 MCP 调用
+
+    开启后响应头带有 Server-Timing（按工具汇总的耗时和调用数）和 X-Trace-Id，
+    完整的调用列表和调用树可通过 GET /api/debug/trace/{trace_id} 读取。
+    流式响应的响应头在内容获取之前发送，Server-Timing 只包含此前的调用。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not trace_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope["method"], scope["path"])
+        trace_store.put(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                headers.append((b"x-trace-id", trace.id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with trace.activate():
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                trace.finish(trace.status or 500)
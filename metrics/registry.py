@@ -0,0 +1,183 @@
+import bisect
+import math
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# 延迟直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 采集回调返回的样本：(标签值, 数值)
+Sample = Tuple[Tuple[str, ...], float]
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    items = [f'{name}="{escape_label(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        items.append(extra)
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """只增不减的计数器，按标签值分别计数"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Histogram:
+    """固定分桶的直方图
+
+    记录时只做一次二分查找和两次加法（不保存原始样本），累计计数在输出时计算，
+    可以在生产负载下常开。
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶计数（最后一个为 +Inf）, 总和]
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = []
+        bounds = [format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """输出时才读取的指标，用于已有 stats() 中的计数和当前占用量（记录时没有任何开销）"""
+
+    def __init__(self, name: str, kind: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Iterable[Sample]]):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+            for labels, value in self.callback()
+        ]
+
+
+class MetricsRegistry:
+    """指标注册表，输出 Prometheus 文本格式（0.0.4）"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, kind: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Iterable[Sample]]) -> CallbackMetric:
+        return self._register(CallbackMetric(name, kind, documentation, labelnames, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.render()
+            except Exception as e:
+                print(f"Failed to collect metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+# 进程级注册表和各模块共用的指标
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "notion_proxy_http_request_duration_seconds",
+    "HTTP request latency by route template, method and status (streaming responses until the last byte)",
+    ("route", "method", "status")
+)
+
+MCP_CALLS = REGISTRY.counter(
+    "notion_proxy_mcp_calls_total",
+    "Upstream MCP HTTP calls by tool and outcome (ok, rate_limited, http_error, timeout, cancelled, error)",
+    ("tool", "outcome")
+)
+
+MCP_CALL_DURATION = REGISTRY.histogram(
+    "notion_proxy_mcp_call_duration_seconds",
+    "Upstream MCP call latency by tool, excluding scheduler queueing",
+    ("tool",)
+)
+
+PAGE_RENDER_CALLS = REGISTRY.histogram(
+    "notion_proxy_page_render_mcp_calls",
+    "get_block_children calls made per page render (block cache hits excluded)",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+
+PAGE_RENDER_BLOCKS = REGISTRY.histogram(
+    "notion_proxy_page_render_blocks",
+    "Blocks per page render",
+    buckets=(10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+)
+
+PAGE_RENDER_DEPTH = REGISTRY.histogram(
+    "notion_proxy_page_render_depth",
+    "Deepest block tree level fetched per page render (1 = top-level blocks only)",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+)
@@ -0,0 +1,194 @@
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from dotenv import load_dotenv
+
+from cache.lru import LRUCache
+
+load_dotenv()
+
+# 当前请求的追踪、当前的上游调用以及正在获取的块层级，随 asyncio 任务的上下文传递到子任务
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("notion_proxy_trace", default=None)
+_current_span: ContextVar[Optional[Dict[str, Any]]] = ContextVar("notion_proxy_trace_span", default=None)
+_block_depth: ContextVar[Optional[int]] = ContextVar("notion_proxy_block_depth", default=None)
+
+
+def current_trace() -> Optional["RequestTrace"]:
+    return _current_trace.get()
+
+
+def current_span() -> Optional[Dict[str, Any]]:
+    """当前正在执行的上游调用记录（未开启追踪时为 None）"""
+    return _current_span.get()
+
+
+@contextmanager
+def block_depth(depth: int) -> Iterator[None]:
+    """标记其中发起的调用所获取的块层级（1 为页面的顶层块）"""
+    token = _block_depth.set(depth)
+    try:
+        yield
+    finally:
+        _block_depth.reset(token)
+
+
+class RequestTrace:
+    """一个请求期间的全部上游 MCP 调用
+
+    每个调用记录工具名、参数、块层级、相对请求开始的起止时间、调度排队时间和接收的字节数。
+    被 single-flight 合并的调用标记为 coalesced（没有实际发送）。
+    调用之间的父子关系按结果中的块 ID 推断：获取某个块子内容的调用，挂在返回该块的调用之下。
+    """
+
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status: Optional[int] = None
+        self.spans: List[Dict[str, Any]] = []
+        # 块 / 页面 ID -> 返回它的调用
+        self._returned_by: Dict[str, int] = {}
+
+    def now_ms(self) -> float:
+        return round((time.perf_counter() - self._start) * 1000, 3)
+
+    @property
+    def finished(self) -> bool:
+        return self.duration_ms is not None
+
+    @contextmanager
+    def activate(self) -> Iterator["RequestTrace"]:
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    @contextmanager
+    def span(self, tool: str, arguments: Dict[str, Any]) -> Iterator[Optional[Dict[str, Any]]]:
+        """记录一次调用，期间 current_span() 返回该调用的记录"""
+        if self.finished:
+            # 响应结束后仍在进行的后台任务（例如 stale-while-revalidate 刷新）不计入
+            yield None
+            return
+        block_id = arguments.get("block_id") or arguments.get("page_id") or arguments.get("database_id")
+        span = {
+            "id": len(self.spans),
+            "parent": self._returned_by.get(block_id) if block_id else None,
+            "tool": tool,
+            "arguments": arguments,
+            "depth": _block_depth.get(),
+            "start_ms": self.now_ms(),
+            "end_ms": None,
+            "queue_ms": 0.0,
+            "bytes": 0,
+            "attempts": 0,
+            "status": None,
+            "outcome": None,
+            "coalesced": True
+        }
+        self.spans.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span["outcome"] = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            span["end_ms"] = self.now_ms()
+            if span["outcome"] is None:
+                span["outcome"] = "ok"
+
+    def record_result(self, span: Optional[Dict[str, Any]], result: Any) -> None:
+        """记录结果中出现的块 / 页面 ID，之后获取它们子内容的调用挂在该调用之下"""
+        if span is None or not isinstance(result, dict):
+            return
+        if isinstance(result.get("id"), str):
+            self._returned_by.setdefault(result["id"], span["id"])
+        for item in result.get("results") or ():
+            if isinstance(item, dict) and isinstance(item.get("id"), str):
+                self._returned_by.setdefault(item["id"], span["id"])
+
+    def finish(self, status: int) -> None:
+        self.status = status
+        self.duration_ms = self.now_ms()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """按工具汇总调用数和耗时（并发调用的耗时会重叠，总和可能超过请求耗时）"""
+        tools: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            item = tools.setdefault(span["tool"], {"calls": 0, "coalesced": 0, "dur_ms": 0.0, "queue_ms": 0.0, "bytes": 0})
+            item["calls"] += 1
+            item["coalesced"] += 1 if span["coalesced"] else 0
+            item["dur_ms"] += (span["end_ms"] if span["end_ms"] is not None else self.now_ms()) - span["start_ms"]
+            item["queue_ms"] += span["queue_ms"]
+            item["bytes"] += span["bytes"]
+        return tools
+
+    def server_timing(self) -> str:
+        """Server-Timing 响应头：每个工具一项（累计耗时和调用数），以及排队总时间和请求总耗时"""
+        summary = self.summary()
+        entries = [
+            f'{tool};dur={item["dur_ms"]:.1f};desc="{int(item["calls"])} calls"'
+            for tool, item in sorted(summary.items(), key=lambda entry: -entry[1]["dur_ms"])
+        ]
+        queue_ms = sum(item["queue_ms"] for item in summary.values())
+        if queue_ms:
+            entries.append(f'queue;dur={queue_ms:.1f};desc="rate limit queueing"')
+        entries.append(f"total;dur={self.now_ms():.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """完整的追踪：平铺的调用列表，以及按父子关系组织的调用树（name / value / children，可直接用于火焰图）"""
+        nodes = [
+            {
+                "name": f'{span["tool"]} {span["arguments"].get("block_id") or span["arguments"].get("page_id") or ""}'.strip(),
+                "value": round((span["end_ms"] if span["end_ms"] is not None else self.now_ms()) - span["start_ms"], 3),
+                "start_ms": span["start_ms"],
+                "span": span["id"],
+                "children": []
+            }
+            for span in self.spans
+        ]
+        roots = []
+        for span, node in zip(self.spans, nodes):
+            parent = span["parent"]
+            (nodes[parent]["children"] if parent is not None else roots).append(node)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms if self.finished else self.now_ms(),
+            "finished": self.finished,
+            "summary": self.summary(),
+            "calls": self.spans,
+            "tree": {"name": f"{self.method} {self.path}", "value": self.duration_ms or self.now_ms(), "children": roots}
+        }
+
+
+class TraceStore:
+    """最近的追踪（LRU），通过 GET /api/debug/trace/{trace_id} 读取"""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        max_entries = max_entries if max_entries is not None else int(os.getenv("TRACE_BUFFER_SIZE", 100))
+        ttl = ttl if ttl is not None else float(os.getenv("TRACE_TTL", 3600))
+        # 追踪按条目数限制，字节数上限不起作用
+        self._lru = LRUCache(max_entries=max_entries, max_bytes=1 << 62, ttl=ttl)
+
+    def put(self, trace: RequestTrace) -> None:
+        self._lru.put(trace.id, trace, 1)
+
+    def get(self, trace_id: str) -> Optional[RequestTrace]:
+        return self._lru.get(trace_id)
+
+
+trace_store = TraceStore()
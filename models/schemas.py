@@ -18,14 +18,36 @@ class PageInfo(BaseModel):
     properties: Dict[str, Any] = {}
 
 
+class TruncatedBlock(BaseModel):
+    block_id: str
+    reason: str  # "max_depth", "max_blocks", "max_calls" or "upstream_error"
+
+
+class TruncationInfo(BaseModel):
+    reasons: List[str]
+    limits: Dict[str, Optional[int]]
+    blocks_fetched: int
+    calls: int
+    skipped: List[TruncatedBlock]  # blocks whose children were not fetched
+
+
 class PageContent(PageInfo):
     content: str  # Markdown content
+    truncated: Optional[TruncationInfo] = None  # set when a fetch limit was hit
+
+
+class BlockContent(BaseModel):
+    id: str
+    content: str  # Markdown of the block's children
+    truncated: Optional[TruncationInfo] = None
 
 
 class SearchRequest(BaseModel):
     query: str
     filter: Optional[Dict[str, Any]] = None
     page_size: int = 10
+    mode: Optional[str] = None  # "upstream", "local" or "auto"; defaults to SEARCH_MODE
+    fields: Optional[str] = None  # e.g. "id,title,properties.Status"
 
 
 class DatabaseSearchRequest(BaseModel):
@@ -34,6 +56,8 @@ class DatabaseSearchRequest(BaseModel):
     sorts: Optional[List[Dict[str, Any]]] = None
     page_size: int = 100
     start_cursor: Optional[str] = None
+    include_content: bool = False  # return PageContent for every row
+    fields: Optional[str] = None  # e.g. "id,title,properties.Status"
 
 
 class PageListResponse(BaseModel):
@@ -42,6 +66,23 @@ class PageListResponse(BaseModel):
     next_cursor: Optional[str] = None
 
 
+class BatchPagesRequest(BaseModel):
+    page_ids: List[str]
+    stream: bool = False
+    fields: Optional[str] = None  # e.g. "id,title,properties.Status"
+
+
+class BatchPageResult(BaseModel):
+    id: str
+    status: int  # HTTP status of this item
+    page: Optional[PageContent] = None
+    error: Optional[str] = None
+
+
+class BatchPagesResponse(BaseModel):
+    results: List[BatchPageResult]
+
+
 class ErrorResponse(BaseModel):
     error: str
     detail: Optional[str] = None
@@ -0,0 +1,252 @@
+import asyncio
+import os
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+from metrics.registry import PAGE_RENDER_BLOCKS, PAGE_RENDER_CALLS, PAGE_RENDER_DEPTH
+from metrics.trace import block_depth
+
+load_dotenv()
+
+
+# 渲染时不会展开子内容的块类型（与 NotionParser.render_blocks 保持一致）
+LEAF_BLOCK_TYPES = {
+    "code", "divider", "table_row", "image", "video", "file", "pdf", "bookmark",
+    "embed", "equation", "link_to_page", "child_page", "child_database"
+}
+
+
+# 截断标记：超出获取上限时代替被跳过的子内容，渲染为 Markdown 注释
+TRUNCATION_MARKER = "<!-- notion-proxy: truncated"
+
+
+def _limit_from_env(name: str) -> Optional[int]:
+    value = int(os.getenv(name, 0))
+    return value if value > 0 else None
+
+
+class FetchLimits:
+    """单次请求获取块树的上限，None 表示不限制
+
+    - max_depth: 最大嵌套层数（1 表示只获取页面的顶层块）
+    - max_blocks: 最多获取的块总数
+    - max_calls: 最多发起的 get_block_children 调用数（命中块缓存不计入）
+    """
+
+    def __init__(self, max_depth: Optional[int] = None, max_blocks: Optional[int] = None,
+                 max_calls: Optional[int] = None):
+        self.max_depth = max_depth
+        self.max_blocks = max_blocks
+        self.max_calls = max_calls
+
+    @classmethod
+    def from_env(cls, max_depth: Optional[int] = None, max_blocks: Optional[int] = None,
+                 max_calls: Optional[int] = None) -> "FetchLimits":
+        """服务端默认上限（PAGE_MAX_DEPTH / PAGE_MAX_BLOCKS / PAGE_MAX_CALLS，0 表示不限制），参数可覆盖"""
+        def pick(override: Optional[int], name: str) -> Optional[int]:
+            if override is not None:
+                return override if override > 0 else None
+            return _limit_from_env(name)
+
+        return cls(
+            max_depth=pick(max_depth, "PAGE_MAX_DEPTH"),
+            max_blocks=pick(max_blocks, "PAGE_MAX_BLOCKS"),
+            max_calls=pick(max_calls, "PAGE_MAX_CALLS")
+        )
+
+    def as_dict(self) -> Dict[str, Optional[int]]:
+        return {"max_depth": self.max_depth, "max_blocks": self.max_blocks, "max_calls": self.max_calls}
+
+
+class BlockTreeFetcher:
+    """块树获取器：按层（广度优先）并发获取子块，同层子树并行请求，受并发上限约束
+
+    指定 limits 时，超出上限的子树不再获取，其子内容替换为截断标记块（type 为 truncated），
+    被跳过的块记录在 truncated 中，调用方可以稍后按块 ID 单独获取。
+    获取子块失败的块同样以截断标记代替（reason 为 upstream_error），不写入缓存。
+    """
+
+    def __init__(self, mcp_client, concurrency: Optional[int] = None, cache=None,
+                 limits: Optional[FetchLimits] = None):
+        self.mcp_client = mcp_client
+        self.concurrency = concurrency or int(os.getenv("BLOCK_FETCH_CONCURRENCY", 8))
+        self.cache = cache
+        self.limits = limits or FetchLimits()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        # 本次获取中各块的 last_edited_time，以及实际从 MCP 重新获取的块
+        self._versions: Dict[str, Optional[str]] = {}
+        self._fetched = set()
+        # 本次获取的块数、调用数，以及因超出上限而未完整获取子内容的块
+        self.blocks = 0
+        self.calls = 0
+        self.truncated: List[Dict[str, str]] = []
+        self._truncated_ids = set()
+        # 获取到的最深块层级（1 为顶层块）
+        self.depth = 0
+
+    def _exhausted(self) -> Optional[str]:
+        """已达到的块数或调用数上限"""
+        if self.limits.max_blocks is not None and self.blocks >= self.limits.max_blocks:
+            return "max_blocks"
+        if self.limits.max_calls is not None and self.calls >= self.limits.max_calls:
+            return "max_calls"
+        return None
+
+    def _truncate(self, block_id: str, reason: str) -> Dict[str, Any]:
+        """记录被截断的块，返回代替其剩余子内容的截断标记块"""
+        self.truncated.append({"block_id": block_id, "reason": reason})
+        self._truncated_ids.add(block_id)
+        # 截断的子树不是完整内容，不能复用或写入 Markdown 缓存
+        self._fetched.add(block_id)
+        return {
+            "object": "block",
+            "id": f"{block_id}:truncated",
+            "type": "truncated",
+            "has_children": False,
+            "truncated": {"block_id": block_id, "reason": reason}
+        }
+
+    @property
+    def failed(self) -> bool:
+        """本次获取中是否有上游调用失败"""
+        return any(item["reason"] == "upstream_error" for item in self.truncated)
+
+    def truncation_info(self) -> Optional[Dict[str, Any]]:
+        """本次获取的截断情况，未截断时返回 None"""
+        if not self.truncated:
+            return None
+        return {
+            "reasons": sorted({item["reason"] for item in self.truncated}),
+            "limits": self.limits.as_dict(),
+            "blocks_fetched": self.blocks,
+            "calls": self.calls,
+            "skipped": self.truncated
+        }
+
+    def observe_page_render(self) -> None:
+        """记录一次页面渲染的上游调用数、块数和层数"""
+        PAGE_RENDER_CALLS.observe(self.calls)
+        PAGE_RENDER_BLOCKS.observe(self.blocks)
+        PAGE_RENDER_DEPTH.observe(self.depth)
+
+    @staticmethod
+    def needs_children(block: Dict[str, Any]) -> bool:
+        """判断渲染该块是否需要获取子块"""
+        return bool(block.get("has_children")) and block.get("type", "") not in LEAF_BLOCK_TYPES
+
+    async def fetch_children(self, block_id: str) -> List[Dict[str, Any]]:
+        """获取单个块的全部子块（自动处理分页），达到上限或上游调用失败时在末尾追加截断标记块"""
+        all_child_blocks = []
+        start_cursor = None
+
+        while True:
+            reason = self._exhausted()
+            if reason is not None:
+                all_child_blocks.append(self._truncate(block_id, reason))
+                break
+            self.calls += 1
+            async with self._semaphore:
+                child_blocks_data = await self.mcp_client.get_block_children(block_id, page_size=100, start_cursor=start_cursor)
+            if not child_blocks_data or "results" not in child_blocks_data:
+                # 上游调用失败（5xx、超时或错误结果）：已获取的部分保留，其后留下截断标记，
+                # 不完整的子块列表不会写入块缓存，页面也不会写入响应缓存
+                all_child_blocks.append(self._truncate(block_id, "upstream_error"))
+                break
+
+            all_child_blocks.extend(child_blocks_data["results"])
+            self.blocks += len(child_blocks_data["results"])
+
+            # 检查是否还有更多内容
+            if not child_blocks_data.get("has_more", False):
+                break
+
+            start_cursor = child_blocks_data.get("next_cursor")
+            if not start_cursor:
+                break
+
+        return all_child_blocks
+
+    async def get_children(self, block_id: str, last_edited_time: Optional[str] = None,
+                           depth: int = 1) -> List[Dict[str, Any]]:
+        """获取子块（位于第 depth 层），块未修改时直接使用缓存"""
+        self._versions[block_id] = last_edited_time
+        if self.cache is not None:
+            entry = self.cache.get(block_id, last_edited_time)
+            if entry is not None:
+                self.blocks += len(entry["children"])
+                return entry["children"]
+
+        with block_depth(depth):
+            child_blocks = await self.fetch_children(block_id)
+        self._fetched.add(block_id)
+        if self.cache is not None and block_id not in self._truncated_ids:
+            self.cache.put(block_id, last_edited_time, child_blocks)
+        return child_blocks
+
+    async def fetch_tree(self, blocks: List[Dict[str, Any]], depth: int = 1) -> Dict[str, List[Dict[str, Any]]]:
+        """获取 blocks（位于第 depth 层）下的整棵子树，返回 block_id -> 子块列表 的映射"""
+        children_map: Dict[str, List[Dict[str, Any]]] = {}
+        if blocks:
+            self.depth = max(self.depth, depth)
+        level = [block for block in blocks if self.needs_children(block)]
+
+        while level:
+            if self.limits.max_depth is not None and depth >= self.limits.max_depth:
+                # 子块已超出最大层数，整层截断
+                for block in level:
+                    children_map[block["id"]] = [self._truncate(block["id"], "max_depth")]
+                break
+            depth += 1
+
+            # 同一层的所有子树相互独立，并发获取
+            results = await asyncio.gather(*(
+                self.get_children(block["id"], block.get("last_edited_time"), depth) for block in level
+            ))
+
+            for block, child_blocks in zip(level, results):
+                children_map[block["id"]] = child_blocks
+            if any(results):
+                self.depth = max(self.depth, depth)
+
+            next_level = {}
+            for child_blocks in results:
+                for child in child_blocks:
+                    if self.needs_children(child) and child["id"] not in children_map:
+                        next_level.setdefault(child["id"], child)
+            level = list(next_level.values())
+
+        return children_map
+
+    def cached_markdown(self, children_map: Dict[str, List[Dict[str, Any]]]) -> Dict[str, str]:
+        """找出整棵子树都命中缓存的块，返回 block_id -> 已缓存的子内容 Markdown"""
+        rendered: Dict[str, str] = {}
+        if self.cache is None:
+            return rendered
+
+        clean: Dict[str, bool] = {}
+
+        def is_clean(block_id: str) -> bool:
+            if block_id not in clean:
+                clean[block_id] = block_id not in self._fetched and all(
+                    is_clean(child["id"]) for child in children_map.get(block_id, [])
+                    if child.get("id") in children_map
+                )
+            return clean[block_id]
+
+        for block_id in children_map:
+            if is_clean(block_id):
+                entry = self.cache.peek(block_id, self._versions.get(block_id))
+                if entry is not None and entry["markdown"] is not None:
+                    rendered[block_id] = entry["markdown"]
+
+        return rendered
+
+    def store_markdown(self, rendered: Dict[str, str]) -> None:
+        """把本次渲染的子内容 Markdown 写回缓存"""
+        if self.cache is None:
+            return
+        for block_id, markdown in rendered.items():
+            # 包含截断标记的子内容不完整，不写入缓存
+            if TRUNCATION_MARKER in markdown:
+                continue
+            self.cache.set_markdown(block_id, self._versions.get(block_id), markdown)
@@ -0,0 +1,72 @@
+import json
+from typing import Any, Dict, Iterable, Optional, Set
+
+# 页面响应中可以选择的字段（按响应中的顺序）
+PAGE_FIELDS = ("id", "title", "url", "created_time", "last_edited_time", "parent", "properties", "content", "truncated")
+
+
+class FieldSelection:
+    """fields= 参数：只返回指定的字段，例如 id,title,properties.Status
+
+    properties.<名称> 只返回指定的属性；单独的 properties 返回全部属性。
+    未选择 content 时无需获取块树，未选择的属性也不会被解析。
+    """
+
+    def __init__(self, fields: Iterable[str], properties: Optional[Set[str]] = None):
+        self.fields = set(fields)
+        # 需要返回的属性名称，None 表示全部属性
+        self.properties = properties
+
+    @classmethod
+    def parse(cls, value: Optional[str]) -> Optional["FieldSelection"]:
+        """解析逗号分隔的字段列表，未指定时返回 None（返回全部字段），字段不存在时抛出 ValueError"""
+        if value is None or not value.strip():
+            return None
+        fields: Set[str] = set()
+        properties: Set[str] = set()
+        all_properties = False
+        for item in value.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            name, _, property_name = item.partition(".")
+            if name not in PAGE_FIELDS or (property_name and name != "properties"):
+                raise ValueError(f"Unknown field: {item}")
+            if property_name:
+                properties.add(property_name)
+            elif name == "properties":
+                all_properties = True
+            fields.add(name)
+        return cls(fields, None if all_properties else properties)
+
+    @property
+    def needs_content(self) -> bool:
+        return "content" in self.fields
+
+    def property_names(self) -> Optional[Set[str]]:
+        """需要解析的属性名称（None 表示全部）"""
+        return self.properties if "properties" in self.fields else set()
+
+    def apply(self, page: Dict[str, Any]) -> Dict[str, Any]:
+        """裁剪单个页面"""
+        result = {name: page[name] for name in PAGE_FIELDS if name in self.fields and name in page}
+        if page.get("truncated"):
+            # 内容被截断时始终返回截断信息
+            result["truncated"] = page["truncated"]
+        if "properties" in result and self.properties is not None:
+            result["properties"] = {
+                name: value for name, value in result["properties"].items() if name in self.properties
+            }
+        return result
+
+    def dumps(self, page: Dict[str, Any]) -> bytes:
+        """裁剪单个页面并序列化"""
+        return json.dumps(self.apply(page), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def project(self, body: bytes) -> bytes:
+        """裁剪序列化后的页面或页面列表响应（列表只裁剪 results 中的页面）"""
+        data = json.loads(body)
+        if "results" in data:
+            data["results"] = [self.apply(page) for page in data["results"]]
+            return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return self.dumps(data)
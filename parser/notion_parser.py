@@ -1,6 +1,10 @@
-from typing import Dict, Any, List, Optional
+import asyncio
+import os
+from collections import deque
+from typing import Dict, Any, Iterable, List, Optional, AsyncIterator, Tuple
 from datetime import datetime
 from models.schemas import PageInfo, PageContent, ParentInfo
+from parser.block_fetcher import BlockTreeFetcher, FetchLimits, TRUNCATION_MARKER
 
 
 class NotionParser:
@@ -116,9 +120,13 @@ class NotionParser:
         return None
     
     @staticmethod
-    def parse_page(page_data: Dict[str, Any]) -> PageInfo:
-        """解析页面数据"""
+    def parse_page(page_data: Dict[str, Any], property_names: Optional[Iterable[str]] = None) -> PageInfo:
+        """解析页面数据，指定 property_names 时只简化这些属性"""
         properties = page_data.get("properties", {})
+        selected = properties
+        if property_names is not None:
+            names = set(property_names)
+            selected = {name: value for name, value in properties.items() if name in names}
         
         return PageInfo(
             id=page_data.get("id", ""),
@@ -127,30 +135,13 @@ class NotionParser:
             created_time=datetime.fromisoformat(page_data.get("created_time", "").replace("Z", "+00:00")),
             last_edited_time=datetime.fromisoformat(page_data.get("last_edited_time", "").replace("Z", "+00:00")),
             parent=NotionParser.parse_parent(page_data.get("parent")),
-            properties=NotionParser.simplify_properties(properties)
+            properties=NotionParser.simplify_properties(selected)
         )
     
     @staticmethod
     async def get_block_children_content(mcp_client, block_id: str) -> str:
         """递归获取块的子内容"""
-        all_child_blocks = []
-        start_cursor = None
-        
-        while True:
-            child_blocks_data = await mcp_client.get_block_children(block_id, page_size=100, start_cursor=start_cursor)
-            if not child_blocks_data or "results" not in child_blocks_data:
-                break
-            
-            child_blocks = child_blocks_data["results"]
-            all_child_blocks.extend(child_blocks)
-            
-            # 检查是否还有更多内容
-            if not child_blocks_data.get("has_more", False):
-                break
-            
-            start_cursor = child_blocks_data.get("next_cursor")
-            if not start_cursor:
-                break
+        all_child_blocks = await BlockTreeFetcher(mcp_client).fetch_children(block_id)
         
         # 递归转换为 Markdown
         return await NotionParser.blocks_to_markdown(all_child_blocks, mcp_client)
@@ -158,25 +149,12 @@ class NotionParser:
     @staticmethod
     async def get_table_content(mcp_client, table_id: str, table_width: int, has_column_header: bool, has_row_header: bool) -> str:
         """获取表格内容并转换为 Markdown 表格"""
-        all_table_rows = []
-        start_cursor = None
-        
-        while True:
-            table_rows_data = await mcp_client.get_block_children(table_id, page_size=100, start_cursor=start_cursor)
-            if not table_rows_data or "results" not in table_rows_data:
-                break
-            
-            table_rows = table_rows_data["results"]
-            all_table_rows.extend(table_rows)
-            
-            # 检查是否还有更多内容
-            if not table_rows_data.get("has_more", False):
-                break
-            
-            start_cursor = table_rows_data.get("next_cursor")
-            if not start_cursor:
-                break
-        
+        all_table_rows = await BlockTreeFetcher(mcp_client).fetch_children(table_id)
+        return NotionParser.table_rows_to_markdown(all_table_rows, table_width, has_column_header, has_row_header)
+    
+    @staticmethod
+    def table_rows_to_markdown(all_table_rows: List[Dict[str, Any]], table_width: int, has_column_header: bool, has_row_header: bool) -> str:
+        """将表格行转换为 Markdown 表格"""
         if not all_table_rows:
             return ""
         
@@ -212,358 +190,447 @@ class NotionParser:
         return "\n".join(markdown_rows)
     
     @staticmethod
-    async def blocks_to_markdown(blocks: List[Dict[str, Any]], mcp_client=None) -> str:
-        """将 Notion blocks 转换为 Markdown"""
-        markdown_lines = []
+    async def blocks_to_markdown(blocks: List[Dict[str, Any]], mcp_client=None, cache=None) -> str:
+        """将 Notion blocks 转换为 Markdown，子块获取受 mcp_client.deadline 约束"""
+        if not mcp_client:
+            return NotionParser.render_blocks(blocks, {})
         
-        for block in blocks:
-            block_type = block.get("type", "")
-            block_id = block.get("id", "")
-            has_children = block.get("has_children", False)
-            
-            if block_type == "paragraph":
-                paragraph = block.get("paragraph", {})
-                rich_text = paragraph.get("rich_text", [])
-                if rich_text:
-                    text = "".join([item.get("plain_text", "") for item in rich_text])
-                    if text.strip():
-                        markdown_lines.append(text)
-                    else:
-                        markdown_lines.append("")  # 空段落
-                else:
-                    markdown_lines.append("")  # 空段落
-                
-                # 处理段落的子内容
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        markdown_lines.append(child_content)
-            
-            elif block_type == "heading_1":
-                heading = block.get("heading_1", {})
-                rich_text = heading.get("rich_text", [])
-                text = "".join([item.get("plain_text", "") for item in rich_text])
-                markdown_lines.append(f"# {text}")
-                
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        markdown_lines.append(child_content)
-            
-            elif block_type == "heading_2":
-                heading = block.get("heading_2", {})
-                rich_text = heading.get("rich_text", [])
-                text = "".join([item.get("plain_text", "") for item in rich_text])
-                markdown_lines.append(f"## {text}")
-                
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        markdown_lines.append(child_content)
-            
-            elif block_type == "heading_3":
-                heading = block.get("heading_3", {})
-                rich_text = heading.get("rich_text", [])
-                text = "".join([item.get("plain_text", "") for item in rich_text])
-                markdown_lines.append(f"### {text}")
-                
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        markdown_lines.append(child_content)
-            
-            elif block_type == "bulleted_list_item":
-                item = block.get("bulleted_list_item", {})
-                rich_text = item.get("rich_text", [])
-                text = "".join([item.get("plain_text", "") for item in rich_text])
-                markdown_lines.append(f"- {text}")
-                
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        # 为子内容添加缩进
-                        indented_content = "\n".join([f"  {line}" for line in child_content.split("\n")])
-                        markdown_lines.append(indented_content)
-            
-            elif block_type == "numbered_list_item":
-                item = block.get("numbered_list_item", {})
-                rich_text = item.get("rich_text", [])
-                text = "".join([item.get("plain_text", "") for item in rich_text])
-                markdown_lines.append(f"1. {text}")
-                
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        # 为子内容添加缩进
-                        indented_content = "\n".join([f"  {line}" for line in child_content.split("\n")])
-                        markdown_lines.append(indented_content)
-            
-            elif block_type == "code":
-                code_block = block.get("code", {})
-                rich_text = code_block.get("rich_text", [])
-                language = code_block.get("language", "")
-                code_text = "".join([item.get("plain_text", "") for item in rich_text])
-                markdown_lines.append(f"```{language}")
-                markdown_lines.append(code_text)
-                markdown_lines.append("```")
-            
-            elif block_type == "quote":
-                quote = block.get("quote", {})
-                rich_text = quote.get("rich_text", [])
-                text = "".join([item.get("plain_text", "") for item in rich_text])
-                markdown_lines.append(f"> {text}")
-                
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        # 为子内容添加引用格式
-                        quoted_content = "\n".join([f"> {line}" for line in child_content.split("\n")])
-                        markdown_lines.append(quoted_content)
-            
-            elif block_type == "divider":
-                markdown_lines.append("---")
-            
-            elif block_type == "to_do":
-                todo = block.get("to_do", {})
-                rich_text = todo.get("rich_text", [])
-                checked = todo.get("checked", False)
-                text = "".join([item.get("plain_text", "") for item in rich_text])
-                checkbox = "- [x]" if checked else "- [ ]"
-                markdown_lines.append(f"{checkbox} {text}")
+        # 先按层并发获取整棵子树，再按文档顺序渲染
+        fetcher = BlockTreeFetcher(mcp_client, cache=cache)
+        children_map = await fetcher.fetch_tree(blocks)
+        rendered = fetcher.cached_markdown(children_map)
+        markdown_content = NotionParser.render_blocks(blocks, children_map, rendered)
+        fetcher.store_markdown(rendered)
+        return markdown_content
+    
+    @staticmethod
+    async def iter_blocks_markdown(blocks: List[Dict[str, Any]], fetcher: BlockTreeFetcher,
+                                   window: Optional[int] = None) -> AsyncIterator[str]:
+        """blocks_to_markdown 的流式版本：按文档顺序逐块产出 Markdown 片段，拼接后与整体渲染结果一致"""
+        window = window or int(os.getenv("STREAM_PREFETCH_WINDOW", 16))
+        pending = deque()
+        index = 0
+        first = True
+        
+        try:
+            while index < len(blocks) or pending:
+                # 预取窗口内后续块的子树，已渲染的子树随即释放
+                while index < len(blocks) and len(pending) < window:
+                    block = blocks[index]
+                    task = asyncio.ensure_future(fetcher.fetch_tree([block])) if fetcher.needs_children(block) else None
+                    pending.append((block, task))
+                    index += 1
                 
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        # 为子内容添加缩进
-                        indented_content = "\n".join([f"  {line}" for line in child_content.split("\n")])
-                        markdown_lines.append(indented_content)
-            
-            elif block_type == "toggle":
-                toggle = block.get("toggle", {})
-                rich_text = toggle.get("rich_text", [])
-                text = "".join([item.get("plain_text", "") for item in rich_text])
-                markdown_lines.append(f"**{text}**")
+                block, task = pending.popleft()
+                children_map = await task if task else {}
+                rendered = fetcher.cached_markdown(children_map)
+                lines = NotionParser.render_block_lines(block, children_map, rendered)
+                fetcher.store_markdown(rendered)
                 
-                # 处理 toggle 的子内容
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        markdown_lines.append(child_content)
-            
-            elif block_type == "callout":
-                callout = block.get("callout", {})
-                rich_text = callout.get("rich_text", [])
-                icon = callout.get("icon", {})
+                if lines:
+                    fragment = "\n".join(lines)
+                    yield fragment if first else "\n" + fragment
+                    first = False
+        finally:
+            for _, task in pending:
+                if task:
+                    task.cancel()
+    
+    @staticmethod
+    async def iter_page_markdown(mcp_client, page_id: str, last_edited_time: Optional[str] = None,
+                                 cache=None, fetcher: Optional[BlockTreeFetcher] = None) -> AsyncIterator[str]:
+        """流式获取页面的 Markdown 内容；传入 fetcher 时使用其上限，结束后可从中读取截断情况"""
+        fetcher = fetcher or BlockTreeFetcher(mcp_client, cache=cache)
+        all_blocks = await fetcher.get_children(page_id, last_edited_time)
+        async for fragment in NotionParser.iter_blocks_markdown(all_blocks, fetcher):
+            yield fragment
+        fetcher.observe_page_render()
+    
+    @staticmethod
+    def truncation_marker(block: Dict[str, Any]) -> str:
+        """截断标记块的 Markdown（HTML 注释，渲染后不可见），包含被跳过子内容的块 ID"""
+        truncated = block.get("truncated", {})
+        return f"{TRUNCATION_MARKER} reason={truncated.get('reason')} block_id={truncated.get('block_id')} -->"
+    
+    @staticmethod
+    def _render_children(block_id: str, children_map: Dict[str, List[Dict[str, Any]]], rendered: Optional[Dict[str, str]]) -> str:
+        """渲染块的子内容，子树未变化时直接复用缓存的 Markdown"""
+        if rendered is not None and block_id in rendered:
+            return rendered[block_id]
+        
+        child_content = NotionParser.render_blocks(children_map[block_id], children_map, rendered)
+        if rendered is not None:
+            rendered[block_id] = child_content
+        return child_content
+    
+    @staticmethod
+    def render_blocks(blocks: List[Dict[str, Any]], children_map: Dict[str, List[Dict[str, Any]]],
+                      rendered: Optional[Dict[str, str]] = None) -> str:
+        """使用已获取的子块映射将 Notion blocks 渲染为 Markdown"""
+        markdown_lines = []
+        
+        for block in blocks:
+            markdown_lines.extend(NotionParser.render_block_lines(block, children_map, rendered))
+        
+        return "\n".join(markdown_lines)
+    
+    @staticmethod
+    def render_block_lines(block: Dict[str, Any], children_map: Dict[str, List[Dict[str, Any]]],
+                           rendered: Optional[Dict[str, str]] = None) -> List[str]:
+        """将单个 block 渲染为 Markdown 行"""
+        markdown_lines = []
+        
+        block_type = block.get("type", "")
+        block_id = block.get("id", "")
+        has_children = block.get("has_children", False)
+        
+        if block_type == "paragraph":
+            paragraph = block.get("paragraph", {})
+            rich_text = paragraph.get("rich_text", [])
+            if rich_text:
                 text = "".join([item.get("plain_text", "") for item in rich_text])
-                markdown_lines.append(f"> **{text}**")
-                
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        # 为子内容添加引用格式
-                        quoted_content = "\n".join([f"> {line}" for line in child_content.split("\n")])
-                        markdown_lines.append(quoted_content)
-            
-            elif block_type == "table":
-                # 处理表格
-                table = block.get("table", {})
-                table_width = table.get("table_width", 0)
-                has_column_header = table.get("has_column_header", False)
-                has_row_header = table.get("has_row_header", False)
-                
-                # 获取表格的子内容（表格行）
-                if has_children and mcp_client:
-                    table_content = await NotionParser.get_table_content(mcp_client, block_id, table_width, has_column_header, has_row_header)
-                    if table_content:
-                        markdown_lines.append(table_content)
-                else:
-                    markdown_lines.append("[Empty table]")
-            
-            elif block_type == "table_row":
-                # 表格行会在 get_table_content 中处理
-                pass
-            
-            elif block_type == "image":
-                image = block.get("image", {})
-                if image.get("type") == "external":
-                    url = image.get("external", {}).get("url", "")
-                    caption = image.get("caption", [])
-                    caption_text = "".join([item.get("plain_text", "") for item in caption])
-                    if caption_text:
-                        markdown_lines.append(f"![{caption_text}]({url})")
-                    else:
-                        markdown_lines.append(f"![]({url})")
-                else:
-                    markdown_lines.append("[Image content not supported]")
-            
-            elif block_type == "video":
-                video = block.get("video", {})
-                if video.get("type") == "external":
-                    url = video.get("external", {}).get("url", "")
-                    caption = video.get("caption", [])
-                    caption_text = "".join([item.get("plain_text", "") for item in caption])
-                    if caption_text:
-                        markdown_lines.append(f"[{caption_text}]({url})")
-                    else:
-                        markdown_lines.append(f"[Video]({url})")
+                if text.strip():
+                    markdown_lines.append(text)
                 else:
-                    markdown_lines.append("[Video content not supported]")
-            
-            elif block_type == "file":
-                file_block = block.get("file", {})
-                if file_block.get("type") == "external":
-                    url = file_block.get("external", {}).get("url", "")
-                    caption = file_block.get("caption", [])
-                    caption_text = "".join([item.get("plain_text", "") for item in caption])
-                    if caption_text:
-                        markdown_lines.append(f"[{caption_text}]({url})")
-                    else:
-                        markdown_lines.append(f"[File]({url})")
-                else:
-                    markdown_lines.append("[File content not supported]")
+                    markdown_lines.append("")  # 空段落
+            else:
+                markdown_lines.append("")  # 空段落
             
-            elif block_type == "pdf":
-                pdf = block.get("pdf", {})
-                if pdf.get("type") == "external":
-                    url = pdf.get("external", {}).get("url", "")
-                    caption = pdf.get("caption", [])
-                    caption_text = "".join([item.get("plain_text", "") for item in caption])
-                    if caption_text:
-                        markdown_lines.append(f"[{caption_text}]({url})")
-                    else:
-                        markdown_lines.append(f"[PDF]({url})")
+            # 处理段落的子内容
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    markdown_lines.append(child_content)
+        
+        elif block_type == "heading_1":
+            heading = block.get("heading_1", {})
+            rich_text = heading.get("rich_text", [])
+            text = "".join([item.get("plain_text", "") for item in rich_text])
+            markdown_lines.append(f"# {text}")
+            
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    markdown_lines.append(child_content)
+        
+        elif block_type == "heading_2":
+            heading = block.get("heading_2", {})
+            rich_text = heading.get("rich_text", [])
+            text = "".join([item.get("plain_text", "") for item in rich_text])
+            markdown_lines.append(f"## {text}")
+            
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    markdown_lines.append(child_content)
+        
+        elif block_type == "heading_3":
+            heading = block.get("heading_3", {})
+            rich_text = heading.get("rich_text", [])
+            text = "".join([item.get("plain_text", "") for item in rich_text])
+            markdown_lines.append(f"### {text}")
+            
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    markdown_lines.append(child_content)
+        
+        elif block_type == "bulleted_list_item":
+            item = block.get("bulleted_list_item", {})
+            rich_text = item.get("rich_text", [])
+            text = "".join([item.get("plain_text", "") for item in rich_text])
+            markdown_lines.append(f"- {text}")
+            
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    # 为子内容添加缩进
+                    indented_content = "\n".join([f"  {line}" for line in child_content.split("\n")])
+                    markdown_lines.append(indented_content)
+        
+        elif block_type == "numbered_list_item":
+            item = block.get("numbered_list_item", {})
+            rich_text = item.get("rich_text", [])
+            text = "".join([item.get("plain_text", "") for item in rich_text])
+            markdown_lines.append(f"1. {text}")
+            
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    # 为子内容添加缩进
+                    indented_content = "\n".join([f"  {line}" for line in child_content.split("\n")])
+                    markdown_lines.append(indented_content)
+        
+        elif block_type == "code":
+            code_block = block.get("code", {})
+            rich_text = code_block.get("rich_text", [])
+            language = code_block.get("language", "")
+            code_text = "".join([item.get("plain_text", "") for item in rich_text])
+            markdown_lines.append(f"```{language}")
+            markdown_lines.append(code_text)
+            markdown_lines.append("```")
+        
+        elif block_type == "quote":
+            quote = block.get("quote", {})
+            rich_text = quote.get("rich_text", [])
+            text = "".join([item.get("plain_text", "") for item in rich_text])
+            markdown_lines.append(f"> {text}")
+            
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    # 为子内容添加引用格式
+                    quoted_content = "\n".join([f"> {line}" for line in child_content.split("\n")])
+                    markdown_lines.append(quoted_content)
+        
+        elif block_type == "divider":
+            markdown_lines.append("---")
+        
+        elif block_type == "to_do":
+            todo = block.get("to_do", {})
+            rich_text = todo.get("rich_text", [])
+            checked = todo.get("checked", False)
+            text = "".join([item.get("plain_text", "") for item in rich_text])
+            checkbox = "- [x]" if checked else "- [ ]"
+            markdown_lines.append(f"{checkbox} {text}")
+            
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    # 为子内容添加缩进
+                    indented_content = "\n".join([f"  {line}" for line in child_content.split("\n")])
+                    markdown_lines.append(indented_content)
+        
+        elif block_type == "toggle":
+            toggle = block.get("toggle", {})
+            rich_text = toggle.get("rich_text", [])
+            text = "".join([item.get("plain_text", "") for item in rich_text])
+            markdown_lines.append(f"**{text}**")
+            
+            # 处理 toggle 的子内容
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    markdown_lines.append(child_content)
+        
+        elif block_type == "callout":
+            callout = block.get("callout", {})
+            rich_text = callout.get("rich_text", [])
+            icon = callout.get("icon", {})
+            text = "".join([item.get("plain_text", "") for item in rich_text])
+            markdown_lines.append(f"> **{text}**")
+            
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    # 为子内容添加引用格式
+                    quoted_content = "\n".join([f"> {line}" for line in child_content.split("\n")])
+                    markdown_lines.append(quoted_content)
+        
+        elif block_type == "table":
+            # 处理表格
+            table = block.get("table", {})
+            table_width = table.get("table_width", 0)
+            has_column_header = table.get("has_column_header", False)
+            has_row_header = table.get("has_row_header", False)
+            
+            # 获取表格的子内容（表格行）
+            if has_children and block_id in children_map:
+                table_content = NotionParser.table_rows_to_markdown(children_map[block_id], table_width, has_column_header, has_row_header)
+                if table_content:
+                    markdown_lines.append(table_content)
+                # 行数超出上限时表格之后保留截断标记
+                markdown_lines.extend(
+                    NotionParser.truncation_marker(row) for row in children_map[block_id] if row.get("type") == "truncated"
+                )
+            else:
+                markdown_lines.append("[Empty table]")
+        
+        elif block_type == "table_row":
+            # 表格行会在 get_table_content 中处理
+            pass
+        
+        elif block_type == "image":
+            image = block.get("image", {})
+            if image.get("type") == "external":
+                url = image.get("external", {}).get("url", "")
+                caption = image.get("caption", [])
+                caption_text = "".join([item.get("plain_text", "") for item in caption])
+                if caption_text:
+                    markdown_lines.append(f"![{caption_text}]({url})")
                 else:
-                    markdown_lines.append("[PDF content not supported]")
-            
-            elif block_type == "bookmark":
-                bookmark = block.get("bookmark", {})
-                url = bookmark.get("url", "")
-                caption = bookmark.get("caption", [])
+                    markdown_lines.append(f"![]({url})")
+            else:
+                markdown_lines.append("[Image content not supported]")
+        
+        elif block_type == "video":
+            video = block.get("video", {})
+            if video.get("type") == "external":
+                url = video.get("external", {}).get("url", "")
+                caption = video.get("caption", [])
                 caption_text = "".join([item.get("plain_text", "") for item in caption])
                 if caption_text:
                     markdown_lines.append(f"[{caption_text}]({url})")
                 else:
-                    markdown_lines.append(f"[Bookmark]({url})")
-            
-            elif block_type == "embed":
-                embed = block.get("embed", {})
-                url = embed.get("url", "")
-                markdown_lines.append(f"[Embedded content]({url})")
-            
-            elif block_type == "equation":
-                equation = block.get("equation", {})
-                expression = equation.get("expression", "")
-                markdown_lines.append(f"$${expression}$$")
-            
-            elif block_type == "synced_block":
-                synced_block = block.get("synced_block", {})
-                synced_from = synced_block.get("synced_from")
-                if synced_from:
-                    markdown_lines.append("[Synced block - content from another page]")
+                    markdown_lines.append(f"[Video]({url})")
+            else:
+                markdown_lines.append("[Video content not supported]")
+        
+        elif block_type == "file":
+            file_block = block.get("file", {})
+            if file_block.get("type") == "external":
+                url = file_block.get("external", {}).get("url", "")
+                caption = file_block.get("caption", [])
+                caption_text = "".join([item.get("plain_text", "") for item in caption])
+                if caption_text:
+                    markdown_lines.append(f"[{caption_text}]({url})")
                 else:
-                    markdown_lines.append("[Synced block]")
-                
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        markdown_lines.append(child_content)
-            
-            elif block_type == "template":
-                template = block.get("template", {})
-                rich_text = template.get("rich_text", [])
-                text = "".join([item.get("plain_text", "") for item in rich_text])
-                markdown_lines.append(f"**Template: {text}**")
-                
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        markdown_lines.append(child_content)
-            
-            elif block_type == "link_to_page":
-                link_to_page = block.get("link_to_page", {})
-                if link_to_page.get("type") == "page_id":
-                    page_id = link_to_page.get("page_id", "")
-                    markdown_lines.append(f"[Link to page]({page_id})")
-                elif link_to_page.get("type") == "database_id":
-                    database_id = link_to_page.get("database_id", "")
-                    markdown_lines.append(f"[Link to database]({database_id})")
+                    markdown_lines.append(f"[File]({url})")
+            else:
+                markdown_lines.append("[File content not supported]")
+        
+        elif block_type == "pdf":
+            pdf = block.get("pdf", {})
+            if pdf.get("type") == "external":
+                url = pdf.get("external", {}).get("url", "")
+                caption = pdf.get("caption", [])
+                caption_text = "".join([item.get("plain_text", "") for item in caption])
+                if caption_text:
+                    markdown_lines.append(f"[{caption_text}]({url})")
                 else:
-                    markdown_lines.append("[Link to page]")
-            
-            elif block_type == "child_page":
-                child_page = block.get("child_page", {})
-                title = child_page.get("title", "Untitled")
-                markdown_lines.append(f"**Child Page: {title}**")
-            
-            elif block_type == "child_database":
-                child_database = block.get("child_database", {})
-                title = child_database.get("title", "Untitled Database")
-                markdown_lines.append(f"**Child Database: {title}**")
-            
-            elif block_type == "column_list":
-                # 列列表容器
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        markdown_lines.append(child_content)
-            
-            elif block_type == "column":
-                # 列容器
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        markdown_lines.append(child_content)
+                    markdown_lines.append(f"[PDF]({url})")
+            else:
+                markdown_lines.append("[PDF content not supported]")
+        
+        elif block_type == "bookmark":
+            bookmark = block.get("bookmark", {})
+            url = bookmark.get("url", "")
+            caption = bookmark.get("caption", [])
+            caption_text = "".join([item.get("plain_text", "") for item in caption])
+            if caption_text:
+                markdown_lines.append(f"[{caption_text}]({url})")
+            else:
+                markdown_lines.append(f"[Bookmark]({url})")
+        
+        elif block_type == "embed":
+            embed = block.get("embed", {})
+            url = embed.get("url", "")
+            markdown_lines.append(f"[Embedded content]({url})")
+        
+        elif block_type == "equation":
+            equation = block.get("equation", {})
+            expression = equation.get("expression", "")
+            markdown_lines.append(f"$${expression}$$")
+        
+        elif block_type == "synced_block":
+            synced_block = block.get("synced_block", {})
+            synced_from = synced_block.get("synced_from")
+            if synced_from:
+                markdown_lines.append("[Synced block - content from another page]")
+            else:
+                markdown_lines.append("[Synced block]")
             
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    markdown_lines.append(child_content)
+        
+        elif block_type == "template":
+            template = block.get("template", {})
+            rich_text = template.get("rich_text", [])
+            text = "".join([item.get("plain_text", "") for item in rich_text])
+            markdown_lines.append(f"**Template: {text}**")
+            
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    markdown_lines.append(child_content)
+        
+        elif block_type == "link_to_page":
+            link_to_page = block.get("link_to_page", {})
+            if link_to_page.get("type") == "page_id":
+                page_id = link_to_page.get("page_id", "")
+                markdown_lines.append(f"[Link to page]({page_id})")
+            elif link_to_page.get("type") == "database_id":
+                database_id = link_to_page.get("database_id", "")
+                markdown_lines.append(f"[Link to database]({database_id})")
             else:
-                # 对于未知类型，尝试提取文本
-                if "rich_text" in block:
-                    rich_text = block["rich_text"]
-                    if rich_text:
-                        text = "".join([item.get("plain_text", "") for item in rich_text])
-                        if text.strip():
-                            markdown_lines.append(text)
-                
-                # 处理未知类型的子内容
-                if has_children and mcp_client:
-                    child_content = await NotionParser.get_block_children_content(mcp_client, block_id)
-                    if child_content:
-                        markdown_lines.append(child_content)
+                markdown_lines.append("[Link to page]")
         
-        return "\n".join(markdown_lines)
+        elif block_type == "child_page":
+            child_page = block.get("child_page", {})
+            title = child_page.get("title", "Untitled")
+            markdown_lines.append(f"**Child Page: {title}**")
+        
+        elif block_type == "child_database":
+            child_database = block.get("child_database", {})
+            title = child_database.get("title", "Untitled Database")
+            markdown_lines.append(f"**Child Database: {title}**")
+        
+        elif block_type == "truncated":
+            # 超出获取上限而跳过的子内容
+            markdown_lines.append(NotionParser.truncation_marker(block))
+        
+        elif block_type == "column_list":
+            # 列列表容器
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    markdown_lines.append(child_content)
+        
+        elif block_type == "column":
+            # 列容器
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    markdown_lines.append(child_content)
+        
+        else:
+            # 对于未知类型，尝试提取文本
+            if "rich_text" in block:
+                rich_text = block["rich_text"]
+                if rich_text:
+                    text = "".join([item.get("plain_text", "") for item in rich_text])
+                    if text.strip():
+                        markdown_lines.append(text)
+            
+            # 处理未知类型的子内容
+            if has_children and block_id in children_map:
+                child_content = NotionParser._render_children(block_id, children_map, rendered)
+                if child_content:
+                    markdown_lines.append(child_content)
+        
+        return markdown_lines
     
     @staticmethod
-    async def get_page_content(mcp_client, page_id: str) -> Optional[PageContent]:
-        """获取页面完整内容（包括 Markdown）"""
+    async def get_page_content(mcp_client, page_id: str, cache=None,
+                               page_data: Optional[Dict[str, Any]] = None,
+                               limits: Optional[FetchLimits] = None) -> Optional[PageContent]:
+        """获取页面完整内容（包括 Markdown），已获取过页面信息时可通过 page_data 传入
+
+        超出 limits 时内容被截断，截断情况记录在返回值的 truncated 中。
+        mcp_client 带有请求截止时间（mcp_client.deadline）时，到期后抛出 DeadlineExceededError，
+        并发获取中的其他子树共享同一截止时间，也同时停止。
+        """
         # 获取页面信息
-        page_data = await mcp_client.get_page(page_id)
+        if page_data is None:
+            page_data = await mcp_client.get_page(page_id)
         if not page_data:
             return None
         
         # 解析页面基本信息
         page_info = NotionParser.parse_page(page_data)
         
-        # 获取页面内容
-        all_blocks = []
-        start_cursor = None
-        
-        while True:
-            blocks_data = await mcp_client.get_block_children(page_id, page_size=100, start_cursor=start_cursor)
-            if not blocks_data or "results" not in blocks_data:
-                break
-            
-            blocks = blocks_data["results"]
-            all_blocks.extend(blocks)
-            
-            # 检查是否还有更多内容
-            if not blocks_data.get("has_more", False):
-                break
-            
-            start_cursor = blocks_data.get("next_cursor")
-            if not start_cursor:
-                break
-        
-        # 转换为 Markdown（支持递归获取子内容）
-        markdown_content = await NotionParser.blocks_to_markdown(all_blocks, mcp_client)
+        # 获取页面内容，并按层并发获取子内容后转换为 Markdown
+        # 页面本身也作为一个块参与缓存，未修改的子树不再请求 MCP
+        fetcher = BlockTreeFetcher(mcp_client, cache=cache, limits=limits)
+        all_blocks = await fetcher.get_children(page_id, page_data.get("last_edited_time"))
+        children_map = await fetcher.fetch_tree(all_blocks)
+        children_map[page_id] = all_blocks
+        rendered = fetcher.cached_markdown(children_map)
+        markdown_content = NotionParser._render_children(page_id, children_map, rendered)
+        fetcher.store_markdown(rendered)
+        fetcher.observe_page_render()
         
         return PageContent(
             id=page_info.id,
@@ -573,9 +640,23 @@ class NotionParser:
             last_edited_time=page_info.last_edited_time,
             parent=page_info.parent,
             properties=page_info.properties,
-            content=markdown_content
+            content=markdown_content,
+            truncated=fetcher.truncation_info()
         )
     
+    @staticmethod
+    async def get_block_content(mcp_client, block_id: str, cache=None,
+                                limits: Optional[FetchLimits] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """获取单个块的子内容 Markdown（用于补取被截断的子树），返回 (Markdown, 截断情况)"""
+        fetcher = BlockTreeFetcher(mcp_client, cache=cache, limits=limits)
+        # 块本身的版本未知，顶层子块列表不使用缓存
+        all_blocks = await fetcher.fetch_children(block_id)
+        children_map = await fetcher.fetch_tree(all_blocks)
+        rendered = fetcher.cached_markdown(children_map)
+        markdown_content = NotionParser.render_blocks(all_blocks, children_map, rendered)
+        fetcher.store_markdown(rendered)
+        return markdown_content, fetcher.truncation_info()
+    
     @staticmethod
     def parse_page_list(list_data: Dict[str, Any]) -> Dict[str, Any]:
         """解析页面列表数据"""
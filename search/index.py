@@ -0,0 +1,277 @@
+import bisect
+import heapq
+import math
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from models.schemas import PageInfo
+
+load_dotenv()
+
+# 中日韩文字没有空格分词，按相邻两字（bigram）切分
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af"
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+# 各字段的权重：标题命中比正文命中更重要
+TITLE_WEIGHT = 3.0
+PROPERTY_WEIGHT = 1.5
+CONTENT_WEIGHT = 1.0
+
+# 文档频率超过 CHAMPION_MIN_DF 的常见词只对其 CHAMPION_SIZE 个最相关文档计分（champion list）
+CHAMPION_SIZE = 2000
+CHAMPION_MIN_DF = 2 * CHAMPION_SIZE
+
+
+def tokenize(text: str) -> List[str]:
+    """分词：拉丁字母/数字按单词切分并转小写，中日韩文字切分为 bigram（单字保留为一个词）"""
+    tokens = []
+    for run in _TOKEN_RE.findall(text.casefold()):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def property_text(properties: Dict[str, Any]) -> Iterable[str]:
+    """简化后的属性中可被搜索的文本"""
+    for value in properties.values():
+        if isinstance(value, str):
+            yield value
+        elif isinstance(value, list):
+            yield from (item for item in value if isinstance(item, str))
+
+
+class SearchIndex:
+    """进程内倒排索引，使用 BM25 排序
+
+    每个词的倒排表是两个紧凑数组（内部文档号、加权词频）。更新页面时旧文档标记为删除，
+    以新的文档号重新加入；删除的文档过多时整体压缩倒排表。
+    常见词的倒排表很长，查询时只使用按长度归一化词频排序的前若干个文档（champion list），
+    这样查询耗时不随语料规模线性增长，代价是常见词组合查询的排序是近似的。
+    页面数超过 max_pages 或已索引文本（标题、属性和正文）超过 max_bytes 时，淘汰最久未更新的页面（0 表示不限制）。
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_pages: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        self.k1 = k1
+        self.b = b
+        self.max_pages = max_pages if max_pages is not None else int(os.getenv("SEARCH_INDEX_MAX_PAGES", 100000))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("SEARCH_INDEX_MAX_BYTES", 256 * 1024 * 1024))
+        # 词 -> (文档号数组, 加权词频数组)
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        # 按文档号索引：页面 id、加权长度、是否有效
+        self._page_ids: List[Optional[str]] = []
+        self._lengths = array("f")
+        self._alive = bytearray()
+        # page_id -> (文档号, 页面信息, last_edited_time, 是否包含正文, 已索引文本字节数)，按加入或更新的先后排列
+        self._docs: Dict[str, Tuple[int, PageInfo, str, bool, int]] = {}
+        self._total_length = 0.0
+        self._bytes = 0
+        self.evictions = 0
+        self._deleted = 0
+        # 词 -> 按 (归一化词频, 文档号) 升序排列的 champion list，查询时按需建立，之后随新增文档更新
+        self._champions: Dict[str, List[Tuple[float, int]]] = {}
+        self.queries = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @staticmethod
+    def _page_info(page: PageInfo) -> PageInfo:
+        """只保留 PageInfo 的字段（不在索引中保存正文）"""
+        if type(page) is PageInfo:
+            return page
+        return PageInfo(**{name: getattr(page, name) for name in PageInfo.model_fields})
+
+    def has_content(self, page_id: str, last_edited_time: Any) -> bool:
+        """页面当前版本的正文是否已经建立索引"""
+        doc = self._docs.get(page_id)
+        return doc is not None and doc[3] and doc[2] == str(last_edited_time)
+
+    def add(self, page: PageInfo, content: Optional[str] = None) -> None:
+        """加入或更新页面；content 为 None 时只索引标题和属性
+
+        只有元数据的更新遇到同一版本已索引正文的页面时，只替换页面信息而不重建索引。
+        """
+        content = content if content is not None else getattr(page, "content", None)
+        info = self._page_info(page)
+        version = str(info.last_edited_time)
+        existing = self._docs.get(info.id)
+        if existing is not None and content is None and existing[3] and existing[2] == version:
+            self._docs[info.id] = (existing[0], info, version, True, existing[4])
+            return
+
+        weights: Counter = Counter()
+        size = len(info.title.encode("utf-8"))
+        for token in tokenize(info.title):
+            weights[token] += TITLE_WEIGHT
+        for text in property_text(info.properties):
+            size += len(text.encode("utf-8"))
+            for token in tokenize(text):
+                weights[token] += PROPERTY_WEIGHT
+        if content:
+            size += len(content.encode("utf-8"))
+            for token in tokenize(content):
+                weights[token] += CONTENT_WEIGHT
+
+        self.remove(info.id)
+        doc_id = len(self._page_ids)
+        length = sum(weights.values())
+        self._page_ids.append(info.id)
+        self._lengths.append(length)
+        self._alive.append(1)
+        self._total_length += length
+        self._bytes += size
+        self._docs[info.id] = (doc_id, info, version, content is not None, size)
+
+        postings, champions = self._postings, self._champions
+        c1, c2 = self._length_norm()
+        for token, weight in weights.items():
+            posting = postings.get(token)
+            if posting is None:
+                posting = postings[token] = (array("I"), array("f"))
+            posting[0].append(doc_id)
+            posting[1].append(weight)
+            champion = champions.get(token)
+            if champion is not None:
+                impact = (weight / (weight + c1 + c2 * length), doc_id)
+                if len(champion) < CHAMPION_SIZE:
+                    bisect.insort(champion, impact)
+                elif impact > champion[0]:
+                    bisect.insort(champion, impact)
+                    del champion[0]
+        self._evict()
+
+    def _evict(self) -> None:
+        """超出页面数或文本字节数上限时淘汰最久未更新的页面（至少保留刚加入的页面）"""
+        while len(self._docs) > 1 and (
+            (self.max_pages and len(self._docs) > self.max_pages) or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            self.remove(next(iter(self._docs)))
+            self.evictions += 1
+
+    def remove(self, page_id: str) -> None:
+        """删除页面（标记删除，稍后压缩）"""
+        doc = self._docs.pop(page_id, None)
+        if doc is None:
+            return
+        doc_id = doc[0]
+        self._alive[doc_id] = 0
+        self._total_length -= self._lengths[doc_id]
+        self._bytes -= doc[4]
+        self._deleted += 1
+        if self._deleted > 1000 and self._deleted > len(self._docs):
+            self.compact()
+
+    def compact(self) -> None:
+        """去掉已删除的文档，重新编号"""
+        remap = array("i", [-1]) * len(self._page_ids)
+        page_ids: List[Optional[str]] = []
+        lengths = array("f")
+        for doc_id, page_id in enumerate(self._page_ids):
+            if self._alive[doc_id]:
+                remap[doc_id] = len(page_ids)
+                page_ids.append(page_id)
+                lengths.append(self._lengths[doc_id])
+
+        postings = {}
+        for token, (doc_ids, weights) in self._postings.items():
+            new_ids, new_weights = array("I"), array("f")
+            for doc_id, weight in zip(doc_ids, weights):
+                if remap[doc_id] >= 0:
+                    new_ids.append(remap[doc_id])
+                    new_weights.append(weight)
+            if new_ids:
+                postings[token] = (new_ids, new_weights)
+
+        self._postings = postings
+        self._page_ids = page_ids
+        self._lengths = lengths
+        self._alive = bytearray(b"\x01") * len(page_ids)
+        self._docs = {page_id: (remap[doc_id], *rest) for page_id, (doc_id, *rest) in self._docs.items()}
+        self._deleted = 0
+        self._champions.clear()
+
+    def _length_norm(self) -> Tuple[float, float]:
+        """BM25 分母中与文档长度相关的两个系数：tf + c1 + c2 * 文档长度"""
+        average = self._total_length / len(self._docs) if self._docs else 1.0
+        return self.k1 * (1 - self.b), self.k1 * self.b / max(average, 1e-9)
+
+    def _champion_list(self, term: str) -> List[Tuple[float, int]]:
+        """常见词的 champion list，有效文档不足一半时重建"""
+        champion = self._champions.get(term)
+        alive = self._alive
+        if champion is None or sum(alive[doc_id] for _, doc_id in champion) < len(champion) // 2:
+            c1, c2 = self._length_norm()
+            lengths = self._lengths
+            doc_ids, weights = self._postings[term]
+            champion = heapq.nlargest(CHAMPION_SIZE, (
+                (tf / (tf + c1 + c2 * lengths[doc_id]), doc_id)
+                for doc_id, tf in zip(doc_ids, weights) if alive[doc_id]
+            ))
+            champion.reverse()
+            self._champions[term] = champion
+        return champion
+
+    def search(self, query: str, limit: int = 10) -> Tuple[List[PageInfo], int]:
+        """按 BM25 得分返回最相关的页面，以及命中的页面总数（含常见词时为估计值）"""
+        self.queries += 1
+        terms = set(tokenize(query))
+        if not terms or not self._docs:
+            return [], 0
+
+        live = len(self._docs)
+        # 倒排表中包含尚未压缩的已删除文档，idf 按全部文档号计算以保证 df 不超过文档总数
+        total_docs = len(self._page_ids)
+        c1, c2 = self._length_norm()
+        boost_base = self.k1 + 1
+        lengths, alive = self._lengths, self._alive
+        scores: Dict[int, float] = {}
+        matched = 0
+
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            doc_ids, weights = posting
+            df = len(doc_ids)
+            matched = max(matched, df)
+            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            if idf <= 0:
+                continue
+            boost = idf * boost_base
+            get = scores.get
+            if df > CHAMPION_MIN_DF:
+                for impact, doc_id in self._champion_list(term):
+                    if alive[doc_id]:
+                        scores[doc_id] = get(doc_id, 0.0) + boost * impact
+                continue
+            for doc_id, tf in zip(doc_ids, weights):
+                if alive[doc_id]:
+                    scores[doc_id] = get(doc_id, 0.0) + boost * tf / (tf + c1 + c2 * lengths[doc_id])
+
+        top = heapq.nlargest(max(1, limit), scores.items(), key=lambda item: item[1])
+        # 使用 champion list 时命中数按最长的倒排表估计
+        return [self._docs[self._page_ids[doc_id]][1] for doc_id, _ in top], max(len(scores), min(matched, live))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pages": len(self._docs),
+            "pages_with_content": sum(1 for doc in self._docs.values() if doc[3]),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "terms": len(self._postings),
+            "champion_lists": len(self._champions),
+            "deleted": self._deleted,
+            "queries": self.queries
+        }
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+from sync.mirror_store import MirrorStore
+
+load_dotenv()
+
+
+def parse_database_ids(value: str) -> List[str]:
+    """解析逗号分隔的数据库 ID 列表"""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class SyncEngine:
+    """数据库镜像同步引擎：后台定期把配置的数据库同步到 MirrorStore
+
+    首次同步和定期的全量同步会分页读取整个数据库（可发现删除的页面）；
+    其余同步按 last_edited_time 过滤并升序排序，只拉取水位线之后修改过的页面。
+    """
+
+    def __init__(self, session_pool, store: MirrorStore, database_ids: Optional[List[str]] = None,
+                 interval: Optional[float] = None, full_interval: Optional[float] = None, search_index=None):
+        self.session_pool = session_pool
+        self.store = store
+        # 可选的全文搜索索引，同步到的页面变化会增量更新到索引中
+        self.search_index = search_index
+        self.database_ids = (
+            database_ids if database_ids is not None else parse_database_ids(os.getenv("MIRROR_DATABASE_IDS", ""))
+        )
+        # 增量同步间隔（秒）
+        self.interval = interval if interval is not None else float(os.getenv("MIRROR_SYNC_INTERVAL", 60))
+        # 全量同步间隔（秒）
+        self.full_interval = full_interval if full_interval is not None else float(os.getenv("MIRROR_FULL_SYNC_INTERVAL", 3600))
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.syncs = 0
+        self.full_syncs = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def is_mirrored(self, database_id: str) -> bool:
+        """数据库已配置镜像且已完成同步"""
+        return database_id in self.database_ids and self.store.is_ready(database_id)
+
+    async def start(self) -> None:
+        if self.search_index is not None:
+            # 从磁盘加载的镜像直接加入搜索索引
+            for database_id in self.database_ids:
+                for row in self.store.rows(database_id):
+                    self.search_index.add(row["info"])
+        if self.database_ids and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            for database_id in self.database_ids:
+                try:
+                    await self.sync_database(database_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failures += 1
+                    self.last_error = f"{database_id}: {e}"
+                    print(f"Failed to sync database {database_id}: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _query_all(self, mcp_client, database_id: str, filter: Optional[Dict[str, Any]] = None,
+                         sorts: Optional[list] = None) -> List[Dict[str, Any]]:
+        """分页读取查询的全部结果，任意一页失败则整次同步失败（避免用不完整的数据替换镜像）"""
+        pages = []
+        start_cursor = None
+        while True:
+            result = await mcp_client.query_database(
+                database_id=database_id, page_size=100, start_cursor=start_cursor, filter=filter, sorts=sorts
+            )
+            if not result or "results" not in result:
+                raise RuntimeError("query_database returned no results")
+            pages.extend(item for item in result["results"] if item.get("object") == "page")
+            start_cursor = result.get("next_cursor")
+            if not result.get("has_more") or not start_cursor:
+                return pages
+
+    async def sync_database(self, database_id: str, full: bool = False) -> int:
+        """同步一个数据库，返回变化的页面数"""
+        lock = self._locks.setdefault(database_id, asyncio.Lock())
+        async with lock:
+            state = self.store.get_state(database_id)
+            full = (
+                full or state is None or not state.get("watermark")
+                or time.time() - state["last_full_sync"] >= self.full_interval
+            )
+
+            async with self.session_pool.acquire("bulk") as mcp_client:
+                if full:
+                    pages = await self._query_all(mcp_client, database_id)
+                else:
+                    # Notion 的 last_edited_time 精确到分钟，使用 on_or_after 避免漏掉同一分钟内的修改
+                    pages = await self._query_all(
+                        mcp_client, database_id,
+                        filter={"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": state["watermark"]}},
+                        sorts=[{"timestamp": "last_edited_time", "direction": "ascending"}]
+                    )
+
+            changed, removed = self.store.apply(database_id, pages, full=full)
+            if self.search_index is not None:
+                for page_id in changed:
+                    self.search_index.add(self.store.get_row(database_id, page_id)["info"])
+                for page_id in removed:
+                    self.search_index.remove(page_id)
+            self.syncs += 1
+            if full:
+                self.full_syncs += 1
+            return len(changed) + len(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "database_ids": self.database_ids,
+            "interval": self.interval,
+            "full_interval": self.full_interval,
+            "syncs": self.syncs,
+            "full_syncs": self.full_syncs,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "databases": self.store.stats()
+        }
@@ -0,0 +1,457 @@
+import bisect
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from sync.mirror_store import MirrorStore
+
+
+class UnsupportedFilterError(ValueError):
+    """过滤或排序条件无法在本地求值（需要回退到上游查询）"""
+
+
+# 区间：(下界, 是否包含下界, 上界, 是否包含上界)，None 表示无界
+Range = Tuple[Any, bool, Any, bool]
+
+TEXT_TYPES = {"title", "rich_text", "url", "email", "phone_number"}
+# 可以建立哈希索引 / 有序索引的属性类型
+HASH_INDEX_TYPES = {"select", "status", "checkbox", "multi_select"}
+RANGE_INDEX_TYPES = {"number", "date", "created_time", "last_edited_time"}
+TIMESTAMPS = ("created_time", "last_edited_time")
+
+
+def parse_time(value: Any) -> Optional[datetime]:
+    """解析 ISO 8601 时间，没有时区的按 UTC 处理"""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def property_value(prop: Optional[Dict[str, Any]]) -> Any:
+    """取出原始属性对象的值（文本拼接为字符串，选项取名称，人员/关联取 id 列表）"""
+    if not prop:
+        return None
+    prop_type = prop.get("type", "")
+    value = prop.get(prop_type)
+
+    if prop_type in ("title", "rich_text"):
+        return "".join(part.get("plain_text", "") for part in value or [])
+    if prop_type in ("select", "status"):
+        return value.get("name") if value else None
+    if prop_type == "multi_select":
+        return [item.get("name", "") for item in value or []]
+    if prop_type == "checkbox":
+        return bool(value)
+    if prop_type == "date":
+        return value.get("start") if value else None
+    if prop_type in ("people", "relation"):
+        return [item.get("id", "") for item in value or []]
+    if prop_type in ("created_by", "last_edited_by"):
+        return value.get("id") if value else None
+    if prop_type == "unique_id":
+        return value.get("number") if value else None
+    if prop_type == "formula":
+        return property_value(value)
+    return value
+
+
+def is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == []
+
+
+def in_range(value: Any, rng: Range) -> bool:
+    low, low_inclusive, high, high_inclusive = rng
+    if value is None:
+        return False
+    try:
+        if low is not None and (value < low or (value == low and not low_inclusive)):
+            return False
+        if high is not None and (value > high or (value == high and not high_inclusive)):
+            return False
+    except TypeError:
+        # 属性值与条件的类型不一致（例如对文本属性使用数字条件）
+        return False
+    return True
+
+
+def date_range(operator: str, operand: Any, now: Optional[datetime] = None) -> Range:
+    """把日期过滤条件转为 UTC 时间区间；只有日期的值表示当天 [00:00, 次日 00:00)"""
+    now = now or datetime.now(timezone.utc)
+    relative = {
+        "past_week": (now - timedelta(days=7), True, now, True),
+        "past_month": (now - timedelta(days=30), True, now, True),
+        "past_year": (now - timedelta(days=365), True, now, True),
+        "next_week": (now, True, now + timedelta(days=7), True),
+        "next_month": (now, True, now + timedelta(days=30), True),
+        "next_year": (now, True, now + timedelta(days=365), True),
+    }
+    if operator in relative:
+        return relative[operator]
+    if operator == "this_week":
+        monday = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+        return (monday, True, monday + timedelta(days=7), False)
+
+    point = parse_time(operand)
+    if point is None:
+        raise UnsupportedFilterError(f"Invalid date value: {operand!r}")
+    if isinstance(operand, str) and len(operand) == 10:
+        start, end = point, point + timedelta(days=1)
+        ranges = {
+            "equals": (start, True, end, False),
+            "before": (None, False, start, False),
+            "after": (end, True, None, False),
+            "on_or_before": (None, False, end, False),
+            "on_or_after": (start, True, None, False),
+        }
+    else:
+        ranges = {
+            "equals": (point, True, point, True),
+            "before": (None, False, point, False),
+            "after": (point, False, None, False),
+            "on_or_before": (None, False, point, True),
+            "on_or_after": (point, True, None, False),
+        }
+    if operator not in ranges:
+        raise UnsupportedFilterError(f"Unsupported date operator: {operator}")
+    return ranges[operator]
+
+
+def number_range(operator: str, operand: Any) -> Range:
+    ranges = {
+        "equals": (operand, True, operand, True),
+        "greater_than": (operand, False, None, False),
+        "less_than": (None, False, operand, False),
+        "greater_than_or_equal_to": (operand, True, None, False),
+        "less_than_or_equal_to": (None, False, operand, True),
+    }
+    if operator not in ranges:
+        raise UnsupportedFilterError(f"Unsupported number operator: {operator}")
+    if not isinstance(operand, (int, float)) or isinstance(operand, bool):
+        raise UnsupportedFilterError(f"Invalid number value: {operand!r}")
+    return ranges[operator]
+
+
+class CompiledFilter:
+    """编译后的过滤条件：match 用于逐行判断，hint 描述可以使用的索引"""
+
+    def __init__(self, match: Callable[[Dict[str, Any]], bool], hint: Optional[tuple] = None):
+        self.match = match
+        self.hint = hint
+
+
+def _compile_condition(kind: str, condition: Dict[str, Any], get: Callable[[Dict[str, Any]], Any],
+                       index_key: Hashable) -> CompiledFilter:
+    """编译单个属性类型的条件，get 从原始页面对象中取出属性值"""
+    if not isinstance(condition, dict) or len(condition) != 1:
+        raise UnsupportedFilterError(f"Invalid {kind} condition: {condition!r}")
+    operator, operand = next(iter(condition.items()))
+
+    if operator == "is_empty":
+        return CompiledFilter(lambda page: is_empty(get(page)), ("eq", index_key, None, kind))
+    if operator == "is_not_empty":
+        return CompiledFilter(lambda page: not is_empty(get(page)))
+
+    if kind in TEXT_TYPES:
+        if not isinstance(operand, str):
+            raise UnsupportedFilterError(f"Invalid text value: {operand!r}")
+        needle = operand.casefold()
+        text_ops = {
+            "equals": lambda text: text == operand,
+            "does_not_equal": lambda text: text != operand,
+            "contains": lambda text: needle in text.casefold(),
+            "does_not_contain": lambda text: needle not in text.casefold(),
+            "starts_with": lambda text: text.casefold().startswith(needle),
+            "ends_with": lambda text: text.casefold().endswith(needle),
+        }
+        if operator not in text_ops:
+            raise UnsupportedFilterError(f"Unsupported {kind} operator: {operator}")
+        test = text_ops[operator]
+        return CompiledFilter(lambda page: test(get(page) or ""))
+
+    if kind in ("number", "unique_id"):
+        if operator == "does_not_equal":
+            return CompiledFilter(lambda page: get(page) != operand)
+        rng = number_range(operator, operand)
+        return CompiledFilter(lambda page: in_range(get(page), rng), ("range", index_key, rng, kind))
+
+    if kind == "checkbox":
+        if operator not in ("equals", "does_not_equal") or not isinstance(operand, bool):
+            raise UnsupportedFilterError(f"Unsupported checkbox condition: {condition!r}")
+        expected = operand if operator == "equals" else not operand
+        return CompiledFilter(lambda page: bool(get(page)) == expected, ("eq", index_key, expected, kind))
+
+    if kind in ("select", "status"):
+        if operator == "equals":
+            return CompiledFilter(lambda page: get(page) == operand, ("eq", index_key, operand, kind))
+        if operator == "does_not_equal":
+            return CompiledFilter(lambda page: get(page) != operand)
+        raise UnsupportedFilterError(f"Unsupported {kind} operator: {operator}")
+
+    if kind in ("multi_select", "people", "relation"):
+        if operator == "contains":
+            return CompiledFilter(lambda page: operand in (get(page) or []), ("eq", index_key, operand, kind))
+        if operator == "does_not_contain":
+            return CompiledFilter(lambda page: operand not in (get(page) or []))
+        raise UnsupportedFilterError(f"Unsupported {kind} operator: {operator}")
+
+    if kind in ("date", "created_time", "last_edited_time"):
+        rng = date_range(operator, operand)
+        return CompiledFilter(lambda page: in_range(parse_time(get(page)), rng), ("range", index_key, rng, kind))
+
+    if kind == "files":
+        raise UnsupportedFilterError(f"Unsupported files operator: {operator}")
+
+    raise UnsupportedFilterError(f"Unsupported filter type: {kind}")
+
+
+def compile_filter(filter: Optional[Dict[str, Any]]) -> CompiledFilter:
+    """把 Notion 的 filter JSON 编译为判断函数"""
+    if not filter:
+        return CompiledFilter(lambda page: True)
+
+    for compound in ("and", "or"):
+        if compound in filter:
+            children = [compile_filter(child) for child in filter[compound]]
+            matches = [child.match for child in children]
+            if compound == "and":
+                return CompiledFilter(lambda page: all(match(page) for match in matches),
+                                      ("and", [child.hint for child in children]))
+            return CompiledFilter(lambda page: any(match(page) for match in matches),
+                                  ("or", [child.hint for child in children]))
+
+    if "timestamp" in filter:
+        name = filter["timestamp"]
+        if name not in TIMESTAMPS:
+            raise UnsupportedFilterError(f"Unsupported timestamp: {name}")
+        return _compile_condition(name, filter.get(name), lambda page: page.get(name), ("timestamp", name))
+
+    if "property" in filter:
+        name = filter["property"]
+        kinds = [key for key in filter if key != "property"]
+        if len(kinds) != 1:
+            raise UnsupportedFilterError(f"Invalid property filter: {filter!r}")
+        kind = kinds[0]
+
+        def get(page: Dict[str, Any]) -> Any:
+            return property_value(page.get("properties", {}).get(name))
+
+        if kind == "formula":
+            # 公式按结果类型比较，例如 {"formula": {"number": {"greater_than": 1}}}
+            inner = filter["formula"]
+            if not isinstance(inner, dict) or len(inner) != 1:
+                raise UnsupportedFilterError(f"Invalid formula filter: {filter!r}")
+            kind, condition = next(iter(inner.items()))
+            return _compile_condition(kind, condition, get, ("formula", name))
+        condition = filter[kind]
+        if kind == "text":
+            # 旧版 API 的 text 条件等同于 rich_text
+            kind = "rich_text"
+        return _compile_condition(kind, condition, get, ("property", name))
+
+    raise UnsupportedFilterError(f"Unsupported filter: {filter!r}")
+
+
+def sort_value(value: Any) -> Any:
+    """排序用的值：文本不区分大小写，列表按拼接后的文本，时间解析为 datetime"""
+    if isinstance(value, str):
+        parsed = parse_time(value) if len(value) >= 10 and value[4:5] == "-" and value[7:8] == "-" else None
+        return parsed if parsed is not None else value.casefold()
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value).casefold()
+    return value
+
+
+def sort_rows(rows: List[Dict[str, Any]], sorts: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """按 Notion 的 sorts 排序（依次作为主、次排序键，空值始终排在最后）"""
+    rows = list(rows)
+    for sort in reversed(sorts or []):
+        if "timestamp" in sort:
+            name = sort["timestamp"]
+            if name not in TIMESTAMPS:
+                raise UnsupportedFilterError(f"Unsupported sort timestamp: {name}")
+            get = lambda row, name=name: row["raw"].get(name)
+        elif "property" in sort:
+            get = lambda row, name=sort["property"]: property_value(row["raw"].get("properties", {}).get(name))
+        else:
+            raise UnsupportedFilterError(f"Unsupported sort: {sort!r}")
+
+        descending = sort.get("direction", "ascending") == "descending"
+        keyed = [(sort_value(get(row)), row) for row in rows]
+        present = [item for item in keyed if not is_empty(item[0])]
+        empty = [item[1] for item in keyed if is_empty(item[0])]
+        try:
+            present.sort(key=lambda item: item[0], reverse=descending)
+        except TypeError:
+            # 同一属性混合了不同类型的值，按字符串比较
+            present.sort(key=lambda item: str(item[0]), reverse=descending)
+        rows = [item[1] for item in present] + empty
+    return rows
+
+
+class DatabaseIndex:
+    """单个镜像数据库的属性索引：选项类属性用哈希索引，数字/日期用有序索引
+
+    索引中保存的是行在镜像中的位置，候选集合排序后即为镜像中的原始顺序。
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        # (属性类别, 名称) -> 值 -> 行位置集合
+        self.hash: Dict[Hashable, Dict[Any, Set[int]]] = {}
+        # (属性类别, 名称) -> (有序的值列表, 对应的行位置列表)
+        self.sorted: Dict[Hashable, Tuple[List[Any], List[int]]] = {}
+        # 有序索引中值为空的行
+        self.empty: Dict[Hashable, Set[int]] = {}
+        # (属性类别, 名称) -> 出现过的属性类型，用于判断索引结果是否精确
+        self.types: Dict[Hashable, Set[str]] = {}
+
+        ranges: Dict[Hashable, List[Tuple[Any, int]]] = {}
+        for position, row in enumerate(rows):
+            for name in TIMESTAMPS:
+                ranges.setdefault(("timestamp", name), []).append((parse_time(row["raw"].get(name)), position))
+                self.types.setdefault(("timestamp", name), set()).add(name)
+            for name, prop in row["raw"].get("properties", {}).items():
+                prop_type = prop.get("type", "")
+                key = ("property", name)
+                value = property_value(prop)
+                self.types.setdefault(key, set()).add(prop_type)
+                if prop_type in HASH_INDEX_TYPES:
+                    buckets = self.hash.setdefault(key, {})
+                    if prop_type == "multi_select":
+                        for item in value or [None]:
+                            buckets.setdefault(item, set()).add(position)
+                    else:
+                        buckets.setdefault(None if is_empty(value) else value, set()).add(position)
+                elif prop_type in RANGE_INDEX_TYPES:
+                    if prop_type != "number":
+                        value = parse_time(value)
+                    ranges.setdefault(key, []).append((value, position))
+
+        # 缺少某个属性的行在索引中视为空值，保证索引结果总是判断函数结果的超集
+        for buckets in self.hash.values():
+            indexed = set().union(*buckets.values())
+            if len(indexed) < len(rows):
+                buckets.setdefault(None, set()).update(set(range(len(rows))) - indexed)
+        for key, items in ranges.items():
+            if len(items) < len(rows):
+                indexed = {position for _, position in items}
+                items.extend((None, position) for position in range(len(rows)) if position not in indexed)
+            present = sorted((item for item in items if item[0] is not None), key=lambda item: item[0])
+            self.sorted[key] = ([item[0] for item in present], [item[1] for item in present])
+            self.empty[key] = {position for value, position in items if value is None}
+
+    def _range_ids(self, key: Hashable, rng: Range) -> Optional[Set[int]]:
+        if key not in self.sorted:
+            return None
+        values, ids = self.sorted[key]
+        low, low_inclusive, high, high_inclusive = rng
+        try:
+            start = 0 if low is None else (bisect.bisect_left if low_inclusive else bisect.bisect_right)(values, low)
+            end = len(values) if high is None else (bisect.bisect_right if high_inclusive else bisect.bisect_left)(values, high)
+        except TypeError:
+            return None
+        return set(ids[start:end])
+
+    def candidates(self, hint: Optional[tuple]) -> Optional[Tuple[Set[int], bool]]:
+        """根据索引提示求出候选行的位置集合
+
+        返回 (候选集合, 是否精确)，精确时候选集合就是最终结果，无需再逐行判断；
+        返回 None 表示无法使用索引（需要全量扫描）。
+        """
+        if hint is None:
+            return None
+        kind = hint[0]
+        if kind == "and":
+            result, exact = None, True
+            for child in hint[1]:
+                found = self.candidates(child)
+                if found is None:
+                    exact = False
+                    continue
+                result = found[0] if result is None else result & found[0]
+                exact = exact and found[1]
+            return None if result is None else (result, exact)
+        if kind == "or":
+            result: Set[int] = set()
+            exact = True
+            for child in hint[1]:
+                found = self.candidates(child)
+                if found is None:
+                    return None
+                result |= found[0]
+                exact = exact and found[1]
+            return result, exact
+
+        key, value, filter_type = hint[1], hint[2], hint[3]
+        # 条件类型与数据中的属性类型一致时，索引结果与逐行判断的结果相同
+        exact = self.types.get(key) == {filter_type}
+        if kind == "eq":
+            if key in self.hash:
+                return set(self.hash[key].get(value, ())), exact
+            if value is None and key in self.empty:
+                return set(self.empty[key]), False
+            return None
+        if kind == "range":
+            ids = self._range_ids(key, value)
+            return None if ids is None else (ids, exact)
+        return None
+
+
+class LocalQueryEngine:
+    """在数据库镜像上本地执行 filter / sorts，索引随镜像版本变化重建"""
+
+    def __init__(self, store: MirrorStore):
+        self.store = store
+        # database_id -> (镜像版本, 索引)
+        self._indexes: Dict[str, Tuple[str, DatabaseIndex]] = {}
+        self.queries = 0
+        self.indexed_queries = 0
+
+    def index(self, database_id: str) -> DatabaseIndex:
+        version = self.store.get_state(database_id)["version"]
+        cached = self._indexes.get(database_id)
+        if cached is None or cached[0] != version:
+            cached = (version, DatabaseIndex(self.store.rows(database_id)))
+            self._indexes[database_id] = cached
+        return cached[1]
+
+    def query(self, database_id: str, filter: Optional[Dict[str, Any]] = None,
+              sorts: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """返回满足过滤条件并排好序的镜像行，条件不受支持时抛出 UnsupportedFilterError"""
+        compiled = compile_filter(filter)
+        self.queries += 1
+
+        rows = None
+        if filter:
+            index = self.index(database_id)
+            found = index.candidates(compiled.hint)
+            if found is not None:
+                # 只处理索引给出的候选行，并保持镜像中的原始顺序
+                self.indexed_queries += 1
+                candidates, exact = found
+                rows = [index.rows[position] for position in sorted(candidates)]
+                if not exact:
+                    rows = [row for row in rows if compiled.match(row["raw"])]
+            else:
+                rows = [row for row in self.store.rows(database_id) if compiled.match(row["raw"])]
+        else:
+            rows = self.store.rows(database_id)
+
+        return sort_rows(rows, sorts) if sorts else rows
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queries": self.queries, "indexed_queries": self.indexed_queries}
+
+
+def paginate(rows: List[Dict[str, Any]], page_size: int, start_cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """按游标分页，游标为下一页第一行的页面 id"""
+    start = 0
+    if start_cursor:
+        start = next((index for index, row in enumerate(rows) if row["id"] == start_cursor), len(rows))
+    end = start + max(1, page_size)
+    return rows[start:end], rows[end]["id"] if end < len(rows) else None
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from parser.notion_parser import NotionParser
+
+load_dotenv()
+
+
+class MirrorStore:
+    """数据库镜像存储：在内存中保存每个已镜像数据库的页面行，可选持久化到 SQLite
+
+    每行包含原始页面对象、simplify_properties 的结果和解析后的 PageInfo；
+    配置 MIRROR_DB_PATH 后重启时从磁盘加载，只需增量同步即可恢复；写入磁盘在单独的写线程中按同步顺序执行，不阻塞事件循环。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path is not None else os.getenv("MIRROR_DB_PATH", "")
+        # database_id -> {page_id -> 行}，按上游查询顺序保存
+        self._rows: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # database_id -> 同步状态
+        self._state: Dict[str, Dict[str, Any]] = {}
+        # database_id -> (页面 id 列表, 页面 id -> 位置)，用于分页，行变化后重建
+        self._order: Dict[str, Tuple[List[str], Dict[str, int]]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+
+        if self.path:
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS mirror_pages ("
+                " database_id TEXT NOT NULL,"
+                " page_id TEXT NOT NULL,"
+                " position INTEGER NOT NULL,"
+                " raw TEXT NOT NULL,"
+                " PRIMARY KEY (database_id, page_id))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS mirror_state ("
+                " database_id TEXT PRIMARY KEY,"
+                " state TEXT NOT NULL)"
+            )
+            self._load()
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mirror-store-writer")
+
+    @staticmethod
+    def make_row(raw: Dict[str, Any]) -> Dict[str, Any]:
+        """由原始页面对象生成镜像行"""
+        info = NotionParser.parse_page(raw)
+        return {
+            "id": raw.get("id", ""),
+            "last_edited_time": raw.get("last_edited_time", ""),
+            "raw": raw,
+            "properties": info.properties,
+            "info": info
+        }
+
+    @staticmethod
+    def is_removed(raw: Dict[str, Any]) -> bool:
+        """页面已归档或移入回收站"""
+        return bool(raw.get("archived") or raw.get("in_trash"))
+
+    def _load(self) -> None:
+        for database_id, state in self._conn.execute("SELECT database_id, state FROM mirror_state"):
+            self._state[database_id] = json.loads(state)
+            self._rows[database_id] = {}
+        for database_id, page_id, raw in self._conn.execute(
+            "SELECT database_id, page_id, raw FROM mirror_pages ORDER BY database_id, position"
+        ):
+            if database_id in self._rows:
+                self._rows[database_id][page_id] = self.make_row(json.loads(raw))
+
+    def _persist(self, database_id: str, changed: Iterable[str], removed: Iterable[str], full: bool) -> None:
+        """把变化的行交给写线程写入 SQLite
+
+        每次同步生成新的行字典（不会在原处修改），写线程直接使用当时的行字典和同步状态的副本。
+        """
+        if self._writer is None:
+            return
+        self._writer.submit(self._write, database_id, self._rows[database_id], list(changed), list(removed), full,
+                            json.dumps(self._state[database_id]))
+
+    def _write(self, database_id: str, rows: Dict[str, Dict[str, Any]], changed: List[str], removed: List[str],
+               full: bool, state: str) -> None:
+        """在写线程中把变化的行写入 SQLite（单个事务）"""
+        positions = {page_id: index for index, page_id in enumerate(rows)}
+        self._conn.execute("BEGIN")
+        try:
+            if full:
+                self._conn.execute("DELETE FROM mirror_pages WHERE database_id = ?", (database_id,))
+            else:
+                self._conn.executemany(
+                    "DELETE FROM mirror_pages WHERE database_id = ? AND page_id = ?",
+                    [(database_id, page_id) for page_id in removed]
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO mirror_pages (database_id, page_id, position, raw) VALUES (?, ?, ?, ?)",
+                [
+                    (database_id, page_id, positions[page_id], json.dumps(rows[page_id]["raw"], ensure_ascii=False))
+                    for page_id in (rows if full else changed) if page_id in rows
+                ]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO mirror_state (database_id, state) VALUES (?, ?)",
+                (database_id, state)
+            )
+            self._conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self._conn.execute("ROLLBACK")
+            print(f"Failed to persist mirror of database {database_id}: {e}")
+
+    def _version(self, database_id: str) -> str:
+        """镜像内容的版本号（页面 id、修改时间和顺序的摘要），用作响应缓存键的一部分"""
+        digest = hashlib.sha1()
+        for page_id, row in self._rows[database_id].items():
+            digest.update(f"{page_id}:{row['last_edited_time']};".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def apply(self, database_id: str, pages: List[Dict[str, Any]], full: bool) -> Tuple[List[str], List[str]]:
+        """写入一次同步的结果，full 为 true 时替换整个数据库；返回 (新增或修改的页面 id, 删除的页面 id)"""
+        state = self._state.setdefault(database_id, {"watermark": None, "last_sync": 0.0, "last_full_sync": 0.0})
+        old_rows = self._rows.get(database_id, {})
+        rows = {} if full else dict(old_rows)
+        changed, removed = [], []
+
+        for raw in pages:
+            page_id = raw.get("id")
+            if not page_id:
+                continue
+            if self.is_removed(raw):
+                if rows.pop(page_id, None) is not None:
+                    removed.append(page_id)
+                continue
+            old = old_rows.get(page_id)
+            if old is not None and old["last_edited_time"] == raw.get("last_edited_time"):
+                rows[page_id] = old
+                continue
+            rows[page_id] = self.make_row(raw)
+            changed.append(page_id)
+            if state["watermark"] is None or rows[page_id]["last_edited_time"] > state["watermark"]:
+                state["watermark"] = rows[page_id]["last_edited_time"]
+
+        if full:
+            removed = [page_id for page_id in old_rows if page_id not in rows]
+
+        self._rows[database_id] = rows
+        now = time.time()
+        state["last_sync"] = now
+        if full:
+            state["last_full_sync"] = now
+        if changed or removed or "version" not in state:
+            state["version"] = self._version(database_id)
+            self._order.pop(database_id, None)
+        state["page_count"] = len(rows)
+        self._persist(database_id, changed, removed, full)
+        return changed, removed
+
+    def is_ready(self, database_id: str) -> bool:
+        """数据库已完成至少一次同步，可以由镜像提供读取"""
+        return database_id in self._state and database_id in self._rows
+
+    def get_state(self, database_id: str) -> Optional[Dict[str, Any]]:
+        return self._state.get(database_id)
+
+    def rows(self, database_id: str) -> List[Dict[str, Any]]:
+        """数据库的全部镜像行（按上游顺序）"""
+        return list(self._rows.get(database_id, {}).values())
+
+    def get_row(self, database_id: str, page_id: str) -> Optional[Dict[str, Any]]:
+        return self._rows.get(database_id, {}).get(page_id)
+
+    def page(self, database_id: str, page_size: int, start_cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """按游标分页读取镜像行，游标为下一页第一行的页面 id"""
+        if database_id not in self._order:
+            order = list(self._rows.get(database_id, {}))
+            self._order[database_id] = (order, {page_id: index for index, page_id in enumerate(order)})
+        order, positions = self._order[database_id]
+        start = positions.get(start_cursor, len(order)) if start_cursor else 0
+        rows = self._rows[database_id]
+        end = start + max(1, page_size)
+        next_cursor = order[end] if end < len(order) else None
+        return [rows[page_id] for page_id in order[start:end]], next_cursor
+
+    def close(self) -> None:
+        """等待写线程完成积压的写入后关闭连接"""
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            database_id: {
+                "pages": state.get("page_count", 0),
+                "watermark": state.get("watermark"),
+                "last_sync": state.get("last_sync"),
+                "last_full_sync": state.get("last_full_sync")
+            }
+            for database_id, state in self._state.items()
+        }
@@ -0,0 +1,178 @@
+"""
+数据库导出和 include_content 的单元测试（上游为 benchmarks/fake_mcp_server 的合成工作区）
+
+运行: python -m unittest discover -s tests -t .
+"""
+import json
+import os
+import unittest
+from unittest import mock
+
+import httpx
+
+from benchmarks.fake_mcp_server import SEPARATOR, SyntheticWorkspace, sse_message, tool_result
+
+DATABASE_ID = "db"
+ROWS = 30
+# 这一行的块内容请求总是被上游限流
+FAILING_ROW = f"{DATABASE_ID}-row-000007"
+# 这一行的嵌套子块请求返回上游错误，内容带 upstream_error 截断标记
+TRUNCATED_ROW = f"{DATABASE_ID}-row-000002"
+
+
+class DatabaseContentTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        import app
+
+        self.app = app
+        self.workspace = SyntheticWorkspace(blocks=3, depth=1, nested_percent=0, tables=0, database_rows=ROWS)
+        # 按数据库查询的页码返回的错误对象，用于模拟导出中途的上游错误
+        self.query_errors = {}
+        self.query_calls = 0
+        self.fail_nested = False
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            payload = json.loads(request.content or b"{}")
+            if payload.get("method") == "initialize":
+                return httpx.Response(200, headers={"mcp-session-id": "test"}, json={})
+            if request.method == "DELETE":
+                return httpx.Response(200)
+            name, arguments = payload["params"]["name"], payload["params"]["arguments"]
+            if name == "API-get-block-children" and arguments["block_id"] == FAILING_ROW:
+                return httpx.Response(429, headers={"retry-after": "0"}, text="rate limited")
+            if name == "API-post-database-query":
+                self.query_calls += 1
+            result = tool_result(self.workspace, name, arguments)
+            if (self.fail_nested and name == "API-get-block-children"
+                    and arguments["block_id"].startswith(f"{TRUNCATED_ROW}{SEPARATOR}")):
+                result = {"object": "error", "status": 502, "code": "bad_gateway", "message": "upstream failed"}
+            if name == "API-post-database-query" and arguments.get("start_cursor") in self.query_errors:
+                result = self.query_errors[arguments.get("start_cursor")]
+            return httpx.Response(200, content=sse_message(payload["id"], result),
+                                  headers={"content-type": "text/event-stream"})
+
+        self.env = mock.patch.dict(os.environ, {"MCP_RATE_LIMIT_MAX_RETRIES": "0"})
+        self.env.start()
+        self.saved = (app.session_pool.client, app.session_pool.scheduler.bucket.rate, app.EXPORT_PAGE_SIZE)
+        app.session_pool.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        app.session_pool.scheduler.bucket.rate = 0
+        app.EXPORT_PAGE_SIZE = 10
+        app.app.dependency_overrides[app.verify_token] = lambda: "test"
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://test")
+
+    async def asyncTearDown(self):
+        app = self.app
+        await self.client.aclose()
+        await app.session_pool.close()
+        app.app.dependency_overrides.pop(app.verify_token, None)
+        app.session_pool.client, app.session_pool.scheduler.bucket.rate, app.EXPORT_PAGE_SIZE = self.saved
+        self.env.stop()
+
+    async def export(self, **params):
+        response = await self.client.get(f"/api/database/{DATABASE_ID}/export", params=params)
+        return response, [json.loads(line) for line in response.text.splitlines()]
+
+
+class ExportContentTest(DatabaseContentTestCase):
+    async def test_failed_row_does_not_stop_export(self):
+        response, lines = await self.export(include_content="true")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(lines), ROWS)
+        self.assertTrue(all("id" in line for line in lines), "export ended with an error line")
+
+        failed = [line for line in lines if line["id"] == FAILING_ROW]
+        self.assertEqual(len(failed), 1)
+        self.assertIsNone(failed[0]["content"])
+        self.assertEqual(failed[0]["status"], 503)
+        self.assertIn("rate limit", failed[0]["error"])
+        for line in lines:
+            if line["id"] != FAILING_ROW:
+                self.assertIsInstance(line["content"], str)
+                self.assertNotIn("error", line)
+
+    async def test_failed_row_with_fields(self):
+        _, lines = await self.export(include_content="true", fields="id,content")
+        self.assertEqual(len(lines), ROWS)
+        failed = next(line for line in lines if line["id"] == FAILING_ROW)
+        self.assertEqual(set(failed), {"id", "content", "status", "error"})
+
+    async def test_list_reports_failed_row_in_errors(self):
+        response = await self.client.get(f"/api/database/{DATABASE_ID}/pages",
+                                         params={"include_content": "true", "page_size": ROWS})
+        body = response.json()
+        self.assertEqual(len(body["results"]), ROWS)
+        self.assertEqual([error["id"] for error in body["errors"]], [FAILING_ROW])
+        self.assertNotIn("etag", response.headers)
+
+
+class DatabaseContentEtagTest(DatabaseContentTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.app.response_cache.clear()
+        self.app.block_cache.clear()
+        self.workspace.depth = 2
+        self.workspace.nested_percent = 100
+
+    async def list_with_content(self):
+        return await self.client.get(f"/api/database/{DATABASE_ID}/pages",
+                                     params={"include_content": "true", "page_size": 5})
+
+    async def test_complete_rows_have_etag(self):
+        response = await self.list_with_content()
+        self.assertEqual(response.json()["errors"], [])
+        self.assertIn("etag", response.headers)
+
+    async def test_truncated_row_drops_etag(self):
+        self.fail_nested = True
+        response = await self.list_with_content()
+        body = response.json()
+        self.assertEqual(body["errors"], [])
+        row = next(row for row in body["results"] if row["id"] == TRUNCATED_ROW)
+        self.assertIn("upstream_error", row["truncated"]["reasons"])
+        self.assertNotIn("etag", response.headers)
+        self.assertEqual(response.headers["cache-control"], "no-store")
+
+
+class ExportQueryErrorTest(DatabaseContentTestCase):
+    async def test_error_object_on_later_page_ends_with_error_line(self):
+        self.query_errors["10"] = {"object": "error", "status": 502, "code": "bad_gateway", "message": "upstream failed"}
+        response, lines = await self.export()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(lines), 11)
+        self.assertTrue(all("id" in line for line in lines[:10]))
+        self.assertIn("upstream failed", lines[-1]["error"])
+
+    async def test_error_object_on_first_page(self):
+        self.query_errors[None] = {"object": "error", "status": 502, "code": "bad_gateway", "message": "upstream failed"}
+        response, _ = await self.export()
+        self.assertEqual(response.status_code, 502)
+
+    async def test_database_not_found_on_first_page(self):
+        self.query_errors[None] = {"object": "error", "status": 404, "code": "object_not_found", "message": "not found"}
+        response, _ = await self.export()
+        self.assertEqual(response.status_code, 404)
+
+
+class DatabaseNoCacheTest(DatabaseContentTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.app.response_cache.clear()
+
+    async def test_no_cache_skips_response_cache(self):
+        url = f"/api/database/{DATABASE_ID}/pages"
+        await self.client.get(url, params={"page_size": 5})
+        await self.client.get(url, params={"page_size": 5})
+        self.assertEqual(self.query_calls, 1)
+        response = await self.client.get(url, params={"page_size": 5}, headers={"Cache-Control": "no-cache"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.query_calls, 2)
+
+    async def test_no_cache_search(self):
+        body = {"database_id": DATABASE_ID, "page_size": 5}
+        await self.client.post("/api/database/search", json=body)
+        await self.client.post("/api/database/search", json=body, headers={"Cache-Control": "no-cache"})
+        self.assertEqual(self.query_calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,419 @@
+"""
+sync/local_query.py 单元测试
+
+运行: python -m unittest discover -s tests -t .
+"""
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from sync.local_query import (
+    DatabaseIndex, LocalQueryEngine, UnsupportedFilterError, compile_filter, date_range, paginate, sort_rows
+)
+from sync.mirror_store import MirrorStore
+
+
+def text(value):
+    return [{"plain_text": value}] if value else []
+
+
+def make_page(page_id, name="", notes="", points=None, done=False, status=None, tags=(), due=None,
+              owners=(), score=None, edited="2024-03-01T10:00:00.000Z", rollup=None):
+    """生成一个原始页面对象，未指定的属性取空值"""
+    properties = {
+        "Name": {"type": "title", "title": text(name)},
+        "Notes": {"type": "rich_text", "rich_text": text(notes)},
+        "Points": {"type": "number", "number": points},
+        "Done": {"type": "checkbox", "checkbox": done},
+        "Status": {"type": "status", "status": {"name": status} if status else None},
+        "Tags": {"type": "multi_select", "multi_select": [{"name": tag} for tag in tags]},
+        "Due": {"type": "date", "date": {"start": due} if due else None},
+        "Owners": {"type": "people", "people": [{"id": owner} for owner in owners]},
+        "Score": {"type": "formula", "formula": {"type": "number", "number": score}},
+        "Total": {"type": "rollup", "rollup": rollup}
+    }
+    return {
+        "object": "page",
+        "id": page_id,
+        "created_time": "2024-01-01T00:00:00.000Z",
+        "last_edited_time": edited,
+        "url": f"https://www.notion.so/{page_id}",
+        "parent": {"type": "database_id", "database_id": "db"},
+        "properties": properties
+    }
+
+
+PAGES = [
+    make_page("a", name="Alpha launch", notes="Budget review", points=3, done=True, status="Done",
+              tags=("urgent", "q1"), due="2024-03-05", owners=("u1",), score=10, edited="2024-03-01T10:00:00.000Z"),
+    make_page("b", name="beta report", notes="", points=8, done=False, status="Doing",
+              tags=("q1",), due="2024-03-05T23:30:00.000Z", owners=("u1", "u2"), score=2,
+              edited="2024-03-02T10:00:00.000Z"),
+    make_page("c", name="Gamma", notes="launch notes", points=None, done=False, status=None,
+              tags=(), due="2024-03-06", owners=(), score=None, edited="2024-03-03T10:00:00.000Z"),
+    make_page("d", name="", notes="Delta", points=13, done=True, status="Todo",
+              tags=("later",), due=None, owners=("u2",), score=7, edited="2024-03-04T10:00:00.000Z")
+]
+
+
+def make_store(pages=PAGES):
+    store = MirrorStore(path="")
+    store.apply("db", pages, full=True)
+    return store
+
+
+class LocalQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = make_store()
+        self.engine = LocalQueryEngine(self.store)
+
+    def ids(self, filter=None, sorts=None):
+        return [row["id"] for row in self.engine.query("db", filter, sorts)]
+
+    def scan_ids(self, filter):
+        """不使用索引，逐行判断的结果"""
+        compiled = compile_filter(filter)
+        return [row["id"] for row in self.store.rows("db") if compiled.match(row["raw"])]
+
+    def assertMatches(self, filter, expected):
+        """索引查询和逐行判断都返回 expected"""
+        self.assertEqual(self.ids(filter), expected)
+        self.assertEqual(self.scan_ids(filter), expected)
+
+
+class TextFilterTest(LocalQueryTestCase):
+    def test_operators(self):
+        cases = [
+            ({"equals": "Gamma"}, ["c"]),
+            ({"does_not_equal": "Gamma"}, ["a", "b", "d"]),
+            ({"contains": "LAUNCH"}, ["a"]),
+            ({"does_not_contain": "a"}, ["d"]),
+            ({"starts_with": "be"}, ["b"]),
+            ({"ends_with": "report"}, ["b"]),
+            ({"is_empty": True}, ["d"]),
+            ({"is_not_empty": True}, ["a", "b", "c"])
+        ]
+        for condition, expected in cases:
+            with self.subTest(condition=condition):
+                self.assertMatches({"property": "Name", "title": condition}, expected)
+
+    def test_text_alias_for_rich_text(self):
+        self.assertMatches({"property": "Notes", "text": {"contains": "launch"}}, ["c"])
+        self.assertMatches({"property": "Notes", "rich_text": {"is_empty": True}}, ["b"])
+
+    def test_non_string_value_is_unsupported(self):
+        with self.assertRaises(UnsupportedFilterError):
+            compile_filter({"property": "Name", "title": {"equals": 1}})
+
+
+class NumberFilterTest(LocalQueryTestCase):
+    def test_operators(self):
+        cases = [
+            ({"equals": 8}, ["b"]),
+            ({"does_not_equal": 8}, ["a", "c", "d"]),
+            ({"greater_than": 3}, ["b", "d"]),
+            ({"less_than": 8}, ["a"]),
+            ({"greater_than_or_equal_to": 8}, ["b", "d"]),
+            ({"less_than_or_equal_to": 8}, ["a", "b"]),
+            ({"is_empty": True}, ["c"]),
+            ({"is_not_empty": True}, ["a", "b", "d"])
+        ]
+        for condition, expected in cases:
+            with self.subTest(condition=condition):
+                self.assertMatches({"property": "Points", "number": condition}, expected)
+
+    def test_invalid_value_is_unsupported(self):
+        for condition in ({"greater_than": "3"}, {"greater_than": True}, {"between": [1, 2]}):
+            with self.subTest(condition=condition), self.assertRaises(UnsupportedFilterError):
+                compile_filter({"property": "Points", "number": condition})
+
+
+class OptionFilterTest(LocalQueryTestCase):
+    def test_checkbox(self):
+        self.assertMatches({"property": "Done", "checkbox": {"equals": True}}, ["a", "d"])
+        self.assertMatches({"property": "Done", "checkbox": {"does_not_equal": True}}, ["b", "c"])
+        with self.assertRaises(UnsupportedFilterError):
+            compile_filter({"property": "Done", "checkbox": {"equals": "yes"}})
+
+    def test_status(self):
+        self.assertMatches({"property": "Status", "status": {"equals": "Doing"}}, ["b"])
+        self.assertMatches({"property": "Status", "status": {"does_not_equal": "Doing"}}, ["a", "c", "d"])
+        self.assertMatches({"property": "Status", "status": {"is_empty": True}}, ["c"])
+        self.assertMatches({"property": "Status", "status": {"is_not_empty": True}}, ["a", "b", "d"])
+
+    def test_select_matches_status_values(self):
+        # select 条件作用于 status 属性时类型不一致，索引结果不精确，仍由逐行判断得到正确结果
+        self.assertMatches({"property": "Status", "select": {"equals": "Todo"}}, ["d"])
+        with self.assertRaises(UnsupportedFilterError):
+            compile_filter({"property": "Status", "select": {"contains": "To"}})
+
+    def test_multi_select(self):
+        self.assertMatches({"property": "Tags", "multi_select": {"contains": "q1"}}, ["a", "b"])
+        self.assertMatches({"property": "Tags", "multi_select": {"does_not_contain": "q1"}}, ["c", "d"])
+        self.assertMatches({"property": "Tags", "multi_select": {"is_empty": True}}, ["c"])
+        self.assertMatches({"property": "Tags", "multi_select": {"is_not_empty": True}}, ["a", "b", "d"])
+
+    def test_people(self):
+        self.assertMatches({"property": "Owners", "people": {"contains": "u2"}}, ["b", "d"])
+        self.assertMatches({"property": "Owners", "people": {"does_not_contain": "u2"}}, ["a", "c"])
+        self.assertMatches({"property": "Owners", "people": {"is_empty": True}}, ["c"])
+
+    def test_formula(self):
+        self.assertMatches({"property": "Score", "formula": {"number": {"greater_than": 5}}}, ["a", "d"])
+        self.assertMatches({"property": "Score", "formula": {"number": {"is_empty": True}}}, ["c"])
+
+
+class DateFilterTest(LocalQueryTestCase):
+    def test_date_only_equals_covers_whole_day(self):
+        # 只有日期的条件表示当天 [00:00, 次日 00:00)，当天 23:30 的时间也匹配
+        self.assertMatches({"property": "Due", "date": {"equals": "2024-03-05"}}, ["a", "b"])
+
+    def test_date_only_ranges(self):
+        cases = [
+            ({"before": "2024-03-05"}, []),
+            ({"before": "2024-03-06"}, ["a", "b"]),
+            ({"after": "2024-03-05"}, ["c"]),
+            ({"on_or_before": "2024-03-05"}, ["a", "b"]),
+            ({"on_or_after": "2024-03-06"}, ["c"]),
+            ({"on_or_after": "2024-03-05"}, ["a", "b", "c"]),
+            ({"is_empty": True}, ["d"]),
+            ({"is_not_empty": True}, ["a", "b", "c"])
+        ]
+        for condition, expected in cases:
+            with self.subTest(condition=condition):
+                self.assertMatches({"property": "Due", "date": condition}, expected)
+
+    def test_date_only_range_bounds(self):
+        day = datetime(2024, 3, 5, tzinfo=timezone.utc)
+        next_day = day + timedelta(days=1)
+        self.assertEqual(date_range("equals", "2024-03-05"), (day, True, next_day, False))
+        self.assertEqual(date_range("before", "2024-03-05"), (None, False, day, False))
+        self.assertEqual(date_range("after", "2024-03-05"), (next_day, True, None, False))
+        self.assertEqual(date_range("on_or_before", "2024-03-05"), (None, False, next_day, False))
+        self.assertEqual(date_range("on_or_after", "2024-03-05"), (day, True, None, False))
+
+    def test_datetime_ranges_are_exact_points(self):
+        point = datetime(2024, 3, 5, 23, 30, tzinfo=timezone.utc)
+        self.assertEqual(date_range("equals", "2024-03-05T23:30:00Z"), (point, True, point, True))
+        self.assertEqual(date_range("after", "2024-03-05T23:30:00Z"), (point, False, None, False))
+        self.assertMatches({"property": "Due", "date": {"after": "2024-03-05T12:00:00Z"}}, ["b", "c"])
+
+    def test_relative_ranges(self):
+        now = datetime(2024, 3, 7, 15, 0, tzinfo=timezone.utc)  # 星期四
+        self.assertEqual(date_range("past_week", None, now), (now - timedelta(days=7), True, now, True))
+        self.assertEqual(date_range("next_month", None, now), (now, True, now + timedelta(days=30), True))
+        monday = datetime(2024, 3, 4, tzinfo=timezone.utc)
+        self.assertEqual(date_range("this_week", None, now), (monday, True, monday + timedelta(days=7), False))
+
+    def test_timestamp(self):
+        self.assertMatches({"timestamp": "last_edited_time", "last_edited_time": {"after": "2024-03-02"}}, ["c", "d"])
+        self.assertMatches(
+            {"timestamp": "last_edited_time", "last_edited_time": {"on_or_before": "2024-03-02T10:00:00Z"}}, ["a", "b"]
+        )
+
+    def test_invalid_dates_are_unsupported(self):
+        for filter in (
+            {"property": "Due", "date": {"equals": "next tuesday"}},
+            {"property": "Due", "date": {"between": "2024-03-05"}},
+            {"timestamp": "archived_time", "archived_time": {"after": "2024-03-01"}}
+        ):
+            with self.subTest(filter=filter), self.assertRaises(UnsupportedFilterError):
+                compile_filter(filter)
+
+
+class CompoundFilterTest(LocalQueryTestCase):
+    def test_and_or(self):
+        self.assertMatches({"and": [
+            {"property": "Tags", "multi_select": {"contains": "q1"}},
+            {"property": "Points", "number": {"greater_than": 5}}
+        ]}, ["b"])
+        self.assertMatches({"or": [
+            {"property": "Status", "status": {"equals": "Todo"}},
+            {"property": "Name", "title": {"contains": "gamma"}}
+        ]}, ["c", "d"])
+        self.assertMatches({"and": [
+            {"property": "Done", "checkbox": {"equals": True}},
+            {"or": [
+                {"property": "Points", "number": {"less_than": 5}},
+                {"property": "Owners", "people": {"contains": "u2"}}
+            ]}
+        ]}, ["a", "d"])
+
+
+class IndexExactnessTest(LocalQueryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = DatabaseIndex(self.store.rows("db"))
+
+    def candidates(self, filter):
+        return self.index.candidates(compile_filter(filter).hint)
+
+    def test_matching_type_is_exact(self):
+        found = self.candidates({"property": "Status", "status": {"equals": "Done"}})
+        self.assertEqual(found, ({0}, True))
+        found = self.candidates({"property": "Points", "number": {"greater_than": 3}})
+        self.assertEqual(found, ({1, 3}, True))
+
+    def test_mismatched_type_is_not_exact(self):
+        _, exact = self.candidates({"property": "Status", "select": {"equals": "Done"}})
+        self.assertFalse(exact)
+
+    def test_unindexed_condition_has_no_candidates(self):
+        self.assertIsNone(self.candidates({"property": "Name", "title": {"contains": "a"}}))
+        self.assertIsNone(self.candidates({"property": "Status", "status": {"does_not_equal": "Done"}}))
+
+    def test_and_with_unindexed_child_narrows_but_is_not_exact(self):
+        found = self.candidates({"and": [
+            {"property": "Tags", "multi_select": {"contains": "q1"}},
+            {"property": "Name", "title": {"contains": "beta"}}
+        ]})
+        self.assertEqual(found, ({0, 1}, False))
+        self.assertEqual(self.ids({"and": [
+            {"property": "Tags", "multi_select": {"contains": "q1"}},
+            {"property": "Name", "title": {"contains": "beta"}}
+        ]}), ["b"])
+
+    def test_and_of_indexed_children_is_exact(self):
+        found = self.candidates({"and": [
+            {"property": "Tags", "multi_select": {"contains": "q1"}},
+            {"property": "Done", "checkbox": {"equals": False}}
+        ]})
+        self.assertEqual(found, ({1}, True))
+
+    def test_and_of_unindexed_children_has_no_candidates(self):
+        self.assertIsNone(self.candidates({"and": [
+            {"property": "Name", "title": {"contains": "a"}},
+            {"property": "Notes", "rich_text": {"is_not_empty": True}}
+        ]}))
+
+    def test_or_needs_every_child_indexed(self):
+        self.assertIsNone(self.candidates({"or": [
+            {"property": "Status", "status": {"equals": "Todo"}},
+            {"property": "Name", "title": {"contains": "gamma"}}
+        ]}))
+        found = self.candidates({"or": [
+            {"property": "Status", "status": {"equals": "Todo"}},
+            {"property": "Points", "number": {"equals": 8}}
+        ]})
+        self.assertEqual(found, ({1, 3}, True))
+        _, exact = self.candidates({"or": [
+            {"property": "Status", "status": {"equals": "Todo"}},
+            {"property": "Status", "select": {"equals": "Done"}}
+        ]})
+        self.assertFalse(exact)
+
+    def test_empty_range_value_is_not_exact(self):
+        # 有序索引中的空值集合包括缺少属性的行，需要逐行确认
+        found = self.candidates({"property": "Points", "number": {"is_empty": True}})
+        self.assertEqual(found, ({2}, False))
+
+    def test_missing_property_counts_as_empty(self):
+        pages = PAGES + [{**make_page("e", name="Epsilon"), "properties": {"Name": {"type": "title", "title": text("Epsilon")}}}]
+        engine = LocalQueryEngine(make_store(pages))
+        rows = engine.query("db", {"property": "Status", "status": {"is_empty": True}})
+        self.assertEqual([row["id"] for row in rows], ["c", "e"])
+        rows = engine.query("db", {"property": "Points", "number": {"less_than": 100}})
+        self.assertEqual([row["id"] for row in rows], ["a", "b", "d"])
+
+    def test_index_follows_mirror_version(self):
+        self.ids({"property": "Status", "status": {"equals": "Done"}})
+        self.store.apply("db", [make_page("b", name="beta report", status="Done", edited="2024-03-09T10:00:00.000Z")],
+                         full=False)
+        self.assertEqual(self.ids({"property": "Status", "status": {"equals": "Done"}}), ["a", "b"])
+
+
+class SortAndPaginateTest(LocalQueryTestCase):
+    def test_sorts(self):
+        self.assertEqual(self.ids(sorts=[{"property": "Points", "direction": "descending"}]), ["d", "b", "a", "c"])
+        self.assertEqual(self.ids(sorts=[{"property": "Name", "direction": "ascending"}]), ["a", "b", "c", "d"])
+        self.assertEqual(self.ids(sorts=[{"property": "Due", "direction": "ascending"}]), ["a", "b", "c", "d"])
+        self.assertEqual(
+            self.ids(sorts=[{"property": "Done", "direction": "descending"}, {"timestamp": "last_edited_time"}]),
+            ["a", "d", "b", "c"]
+        )
+
+    def test_unsupported_sort(self):
+        with self.assertRaises(UnsupportedFilterError):
+            sort_rows(self.store.rows("db"), [{"timestamp": "archived_time"}])
+        with self.assertRaises(UnsupportedFilterError):
+            sort_rows(self.store.rows("db"), [{"direction": "ascending"}])
+
+    def test_paginate(self):
+        rows = self.store.rows("db")
+        page, cursor = paginate(rows, 3)
+        self.assertEqual(([row["id"] for row in page], cursor), (["a", "b", "c"], "d"))
+        page, cursor = paginate(rows, 3, cursor)
+        self.assertEqual(([row["id"] for row in page], cursor), (["d"], None))
+
+
+class UnsupportedFilterTest(LocalQueryTestCase):
+    def test_unsupported_filters_raise(self):
+        for filter in (
+            {"property": "Total", "rollup": {"number": {"greater_than": 1}}},
+            {"property": "Files", "files": {"contains": "report.pdf"}},
+            {"property": "Name", "title": {"equals": "a"}, "rich_text": {"equals": "a"}},
+            {"property": "Score", "formula": {"number": {"greater_than": 1}, "string": {"equals": "a"}}},
+            {"not": {"property": "Name", "title": {"equals": "a"}}}
+        ):
+            with self.subTest(filter=filter), self.assertRaises(UnsupportedFilterError):
+                self.engine.query("db", filter)
+
+
+class UpstreamFallbackTest(unittest.IsolatedAsyncioTestCase):
+    """已镜像的数据库遇到不支持的条件时回退到上游查询"""
+
+    async def asyncSetUp(self):
+        import app
+
+        self.app = app
+        self.calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            payload = json.loads(request.content or b"{}")
+            if payload.get("method") == "initialize":
+                return httpx.Response(200, headers={"mcp-session-id": "test"}, json={})
+            if request.method == "DELETE":
+                return httpx.Response(200)
+            self.calls.append(payload["params"])
+            result = {"object": "list", "results": [make_page("upstream")], "has_more": False, "next_cursor": None}
+            message = {"jsonrpc": "2.0", "id": payload["id"], "result": {
+                "content": [{"type": "text", "text": json.dumps(result)}]
+            }}
+            return httpx.Response(200, content=f"event: message\ndata: {json.dumps(message)}\n\n".encode("utf-8"),
+                                  headers={"content-type": "text/event-stream"})
+
+        self.saved = (app.mirror_store, app.local_query, app.sync_engine.store, app.sync_engine.database_ids,
+                      app.session_pool.client)
+        store = make_store()
+        app.mirror_store = store
+        app.local_query = LocalQueryEngine(store)
+        app.sync_engine.store = store
+        app.sync_engine.database_ids = ["db"]
+        app.session_pool.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def asyncTearDown(self):
+        app = self.app
+        await app.session_pool.close()
+        (app.mirror_store, app.local_query, app.sync_engine.store, app.sync_engine.database_ids,
+         app.session_pool.client) = self.saved
+
+    async def test_supported_filter_uses_mirror(self):
+        pages, cursor = await self.app.query_database_rows(
+            "db", "normal", None, 10, filter={"property": "Status", "status": {"equals": "Done"}}
+        )
+        self.assertEqual([page["id"] for page in pages], ["a"])
+        self.assertEqual(self.calls, [])
+
+    async def test_unsupported_filter_falls_back_to_upstream(self):
+        filter = {"property": "Total", "rollup": {"number": {"greater_than": 1}}}
+        pages, cursor = await self.app.query_database_rows("db", "normal", None, 10, filter=filter)
+        self.assertEqual([page["id"] for page in pages], ["upstream"])
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.calls[0]["name"], "API-post-database-query")
+        self.assertEqual(self.calls[0]["arguments"]["filter"], filter)
+
+
+if __name__ == "__main__":
+    unittest.main()